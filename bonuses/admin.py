@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import BonusEvent
+from .models import BonusEvent, CompensationPlan
 
 
 @admin.register(BonusEvent)
@@ -7,5 +7,21 @@ class BonusEventAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "order", "bonus_type", "amount", "lane", "depth", "status", "created_at")
     list_filter = ("bonus_type", "status", "lane")
     search_fields = ("user__email", "order__id")
-    readonly_fields = ("user", "order", "bonus_type", "amount", "lane", "depth", "status", "created_at")
+    readonly_fields = ("user", "order", "bonus_type", "amount", "lane", "depth", "plan_version", "status", "created_at")
     ordering = ("-created_at",)
+
+
+@admin.register(CompensationPlan)
+class CompensationPlanAdmin(admin.ModelAdmin):
+    list_display = (
+        "version", "app_fee_percent", "direct_percent", "hierarchy_percent",
+        "decay_percent", "cutoff_depth", "is_active", "created_at",
+    )
+    list_filter = ("is_active",)
+    ordering = ("-version",)
+
+    def get_readonly_fields(self, request, obj=None):
+        # Plans are versioned: once saved only is_active changes.
+        if obj is None:
+            return ("created_at",)
+        return tuple(f.name for f in obj._meta.fields if f.name != "is_active")
@@ -0,0 +1,55 @@
+"""
+Micro-benchmark: hierarchy pool split with the precomputed integer-cents DecayTable
+(bonuses/plan.py) vs naive per-depth Decimal arithmetic. Also reports how far the two
+results drift apart (the table hands out sub-cent remainders the naive split drops).
+
+Usage:
+  python manage.py bench_decay --pools 100000 --depths 15
+"""
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bonuses.plan import decay_table, from_cents, naive_decimal_split, to_cents
+
+
+class Command(BaseCommand):
+    help = "Benchmark the integer-cents decay table against a naive Decimal split."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pools", type=int, default=100000, help="Pools to split (default 100000).")
+        parser.add_argument("--depths", type=int, default=15, help="Ancestors per pool (default 15).")
+        parser.add_argument("--decay", type=int, default=30, help="Decay percent at depth 1 (default 30).")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for pool amounts (default 0).")
+
+    def handle(self, *args, **options):
+        if options["pools"] <= 0 or options["depths"] <= 0:
+            raise CommandError("--pools and --depths must be positive.")
+        rng = random.Random(options["seed"])
+        pools = [Decimal(rng.randrange(1, 10_000_000)).scaleb(-2) for _ in range(options["pools"])]
+        depths, decay = options["depths"], options["decay"]
+        table = decay_table(decay, depths)
+
+        started = time.perf_counter()
+        naive = [naive_decimal_split(pool, depths, decay, depths) for pool in pools]
+        naive_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        cents = [table.split(to_cents(pool), depths) for pool in pools]
+        table_elapsed = time.perf_counter() - started
+
+        paid_naive = sum(sum(shares) for shares in naive)
+        paid_table = sum(from_cents(sum(shares)) for shares in cents)
+        max_diff = max(
+            abs(to_cents(a) - b) for n, c in zip(naive, cents) for a, b in zip(n, c)
+        )
+        for label, elapsed in (("decimal", naive_elapsed), ("table", table_elapsed)):
+            self.stdout.write(
+                f"  {label:>8}: {elapsed:.3f}s, {elapsed / len(pools) * 1e6:.2f} us per pool"
+            )
+        self.stdout.write(
+            f"  paid: decimal {paid_naive}, table {paid_table}; max per-depth difference {max_diff} cent(s)"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Speed-up {naive_elapsed / table_elapsed:.1f}x."))
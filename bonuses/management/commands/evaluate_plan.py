@@ -0,0 +1,153 @@
+"""
+What-if: re-run the historical paid orders under an alternative compensation plan and
+report, per user, how the payout would differ from the actual bonus_events (NDJSON).
+
+Read-only: the rules forbid recalculating historical bonuses in place, so nothing is
+written. The orders that were paid out (tasks.ProcessedOrder) are replayed in memory with
+bonuses.simulator over the current tree, in batched vectorized chunks. Placement never
+changes, so every buyer's upline is the one the engine used (a buyer placed after ordering
+is treated as placed). Releasing pairs only moves events from PENDING to RELEASED, so the
+payout compared is the DIRECT and HIERARCHY amounts whatever their status. On Postgres all
+reads run in one REPEATABLE READ, READ ONLY transaction, so orders and events come from one
+consistent snapshot.
+
+The alternative plan is a stored version (--plan, default the active plan) with optional
+overrides; evaluating the plan the orders were paid under reports no differences.
+
+Usage:
+  python manage.py evaluate_plan --plan 2
+  python manage.py evaluate_plan --direct-percent 30 --hierarchy-percent 50 --cutoff 10 --output diff.ndjson
+"""
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import replace
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from bonuses.management.commands.simulate_bonuses import plan_configs
+from bonuses.models import BonusEvent
+from bonuses.plan import from_cents, to_cents
+from bonuses.simulator import Purchases, SimTree, require_numpy, simulate
+from orders.models import Order
+from tree.models import CLOSURE_MAX_DISTANCE
+
+KINDS = ("direct", "hierarchy")
+PERCENT_OVERRIDES = (
+    ("app_fee_percent", "app_fee_ratio"),
+    ("direct_percent", "direct_ratio"),
+    ("hierarchy_percent", "hierarchy_ratio"),
+)
+
+
+@contextmanager
+def _read_only():
+    """One consistent, read-only snapshot on Postgres; plain autocommit reads elsewhere."""
+    if connection.vendor != "postgresql":
+        yield
+        return
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        yield
+
+
+class Command(BaseCommand):
+    help = "Re-run historical paid orders under another plan (read-only); per-user diff vs bonus_events as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--plan", type=int, default=None, help="Plan version to start from (default: active).")
+        parser.add_argument("--app-fee-percent", type=int, default=None)
+        parser.add_argument("--direct-percent", type=int, default=None)
+        parser.add_argument("--hierarchy-percent", type=int, default=None)
+        parser.add_argument("--decay-percent", type=int, default=None, help="Depth i takes decay/i percent of the pool.")
+        parser.add_argument("--cutoff", type=int, default=None, help=f"Hierarchy depth (1..{CLOSURE_MAX_DISTANCE}).")
+        parser.add_argument("--chunk-size", type=int, default=250000, help="Orders per vectorized chunk.")
+        parser.add_argument("--all", action="store_true", help="Also list users whose payout does not change.")
+        parser.add_argument("--output", type=str, default=None, help="Write NDJSON here instead of stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            require_numpy()
+        except ImportError as exc:
+            raise CommandError(str(exc))
+        config, label = self._config(options)
+        started = time.monotonic()
+        with _read_only():
+            tree = SimTree.from_database()
+            orders = Order.objects.filter(status=Order.Status.PAID, processed__isnull=False)
+            purchases = Purchases.from_orders(tree, orders)
+            result = simulate(tree, purchases, config, max(1, options["chunk_size"]))
+            actual = self._actual(orders)
+
+        what_if = {"direct": result.direct, "hierarchy": result.hierarchy}
+        users = {int(u) for kind in KINDS for u in tree.user_ids[what_if[kind] != 0]} | {
+            u for kind in KINDS for u in actual[kind]
+        }
+        at = dict(zip(tree.user_ids.tolist(), range(len(tree))))
+        out = open(options["output"], "w", encoding="utf-8") if options["output"] else self.stdout
+        changed = 0
+        totals = {"actual": 0, "what_if": 0}
+        try:
+            for user_id in sorted(users):
+                pos = at.get(user_id)
+                row = {"user_id": user_id}
+                before = after = 0
+                for kind in KINDS:
+                    old = actual[kind].get(user_id, 0)
+                    new = 0 if pos is None else int(what_if[kind][pos])
+                    row[f"actual_{kind}"] = str(from_cents(old))
+                    row[kind] = str(from_cents(new))
+                    before += old
+                    after += new
+                row["delta"] = str(from_cents(after - before))
+                totals["actual"] += before
+                totals["what_if"] += after
+                if after != before:
+                    changed += 1
+                if after != before or options["all"]:
+                    out.write(json.dumps(row, separators=(",", ":")) + "\n")
+        finally:
+            if options["output"]:
+                out.close()
+        self.stderr.write(self.style.SUCCESS(
+            f"{label} what-if over {len(purchases)} order(s) in {time.monotonic() - started:.1f}s: "
+            f"actual {from_cents(totals['actual'])}, what-if {from_cents(totals['what_if'])} "
+            f"({from_cents(totals['what_if'] - totals['actual']):+}); {changed} user(s) changed."
+        ))
+
+    def _config(self, options):
+        """The base plan with the command-line overrides; (config, label)."""
+        config = plan_configs([options["plan"]] if options["plan"] is not None else [])[0]
+        changes = {}
+        for option, field in PERCENT_OVERRIDES:
+            if options[option] is not None:
+                if options[option] < 0:
+                    raise CommandError(f"--{option.replace('_', '-')} must not be negative.")
+                changes[field] = Decimal(options[option]).scaleb(-2)
+        for option in ("decay_percent", "cutoff"):
+            if options[option] is not None:
+                changes[option] = options[option]
+        label = f"Plan v{config.version}" + (" with overrides" if changes else "")
+        config = replace(config, **changes)
+        if config.app_fee_ratio + config.direct_ratio + config.hierarchy_ratio != 1:
+            raise CommandError("App fee, direct and hierarchy percents must add up to 100.")
+        if not 1 <= config.cutoff <= CLOSURE_MAX_DISTANCE:
+            raise CommandError(f"--cutoff must be between 1 and {CLOSURE_MAX_DISTANCE}.")
+        return config, label
+
+    def _actual(self, orders):
+        """{kind: {user_id: cents}} from the orders' DIRECT and HIERARCHY bonus_events."""
+        actual = {kind: {} for kind in KINDS}
+        paid = (
+            BonusEvent.objects.filter(order__in=orders)
+            .values_list("user_id", "bonus_type")
+            .annotate(total=Sum("amount"))
+            .order_by()
+        )
+        for user_id, bonus_type, total in paid:
+            actual["direct" if bonus_type == BonusEvent.BonusType.DIRECT else "hierarchy"][user_id] = to_cents(total)
+        return actual
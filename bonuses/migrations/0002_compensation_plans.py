@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:54
+
+import django.core.validators
+import django.db.models.expressions
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def seed_plan(apps, schema_editor):
+    # Version 1 = the documented rules (20/40/40, 30/i decay to depth 15, 10.00 per pair).
+    CompensationPlan = apps.get_model("bonuses", "CompensationPlan")
+    CompensationPlan.objects.get_or_create(version=1, defaults={"is_active": True})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonuses', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bonusevent',
+            name='plan_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='CompensationPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(unique=True)),
+                ('app_fee_percent', models.PositiveSmallIntegerField(default=20)),
+                ('direct_percent', models.PositiveSmallIntegerField(default=40)),
+                ('hierarchy_percent', models.PositiveSmallIntegerField(default=40)),
+                ('decay_percent', models.PositiveSmallIntegerField(default=30)),
+                ('cutoff_depth', models.PositiveSmallIntegerField(default=15, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(15)])),
+                ('pair_value', models.DecimalField(decimal_places=2, default=Decimal('10.00'), max_digits=12)),
+                ('is_active', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'compensation_plans',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='one_active_plan'), models.CheckConstraint(condition=models.Q(('app_fee_percent', django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.Value(100), '-', models.F('direct_percent')), '-', models.F('hierarchy_percent')))), name='plan_split_is_whole_profit'), models.CheckConstraint(condition=models.Q(('cutoff_depth__gte', 1), ('cutoff_depth__lte', 15)), name='plan_cutoff_within_closure')],
+            },
+        ),
+        migrations.RunPython(seed_plan, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:51
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonuses', '0002_compensation_plans'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='compensationplan',
+            name='pair_value',
+        ),
+    ]
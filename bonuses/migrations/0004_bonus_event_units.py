@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Q, Sum
+
+# Existing HIERARCHY events are numbered per (user, lane) in id order and DIRECT events take
+# the unit of their referrer's HIERARCHY event from the same order. Units that paid nothing
+# before this migration have no event, so later units of that lane number one lower; only
+# events written from now on are exact.
+NUMBER_HIERARCHY_SQL = """
+    UPDATE bonus_events SET unit = numbered.unit FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id, lane ORDER BY id) AS unit
+        FROM bonus_events WHERE bonus_type = 'HIERARCHY' AND lane IS NOT NULL
+    ) numbered
+    WHERE bonus_events.id = numbered.id
+"""
+NUMBER_DIRECT_SQL = """
+    UPDATE bonus_events SET lane = h.lane, unit = h.unit FROM bonus_events h
+    WHERE bonus_events.bonus_type = 'DIRECT' AND h.bonus_type = 'HIERARCHY'
+      AND h.order_id = bonus_events.order_id AND h.user_id = bonus_events.user_id
+"""
+
+
+def number_units(apps, schema_editor):
+    # Fold striped counter deltas first, so every unit so far is counted in pairing_counters.
+    PairingCounter = apps.get_model("tree", "PairingCounter")
+    PairingCounterShard = apps.get_model("tree", "PairingCounterShard")
+    pending = PairingCounterShard.objects.filter(Q(left_delta__gt=0) | Q(right_delta__gt=0))
+    for user_id, left, right in pending.values_list("user_id").annotate(
+        left=Sum("left_delta"), right=Sum("right_delta")
+    ).order_by():
+        PairingCounter.objects.filter(user_id=user_id).update(
+            left_count=F("left_count") + left, right_count=F("right_count") + right
+        )
+    pending.update(left_delta=0, right_delta=0)
+    schema_editor.execute(NUMBER_HIERARCHY_SQL)
+    schema_editor.execute(NUMBER_DIRECT_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonuses', '0003_remove_plan_pair_value'),
+        ('orders', '0002_shipping_and_order_fields'),
+        ('tree', '0008_path_order_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bonusevent',
+            name='unit',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='bonusevent',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['user', 'unit'], name='idx_bonus_pending_unit'),
+        ),
+        migrations.AddIndex(
+            model_name='bonusevent',
+            index=models.Index(condition=models.Q(('lane__isnull', True), ('status', 'PENDING')), fields=['user'], name='idx_bonus_pending_unpaired'),
+        ),
+        migrations.AddIndex(
+            model_name='bonusevent',
+            index=models.Index(condition=models.Q(('lane__isnull', False), ('unit__isnull', True)), fields=['user', 'id'], name='idx_bonus_unnumbered'),
+        ),
+        migrations.RunPython(number_units, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,60 @@
 from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import F, Q
 
 from orders.models import Order
+from tree.models import CLOSURE_MAX_DISTANCE
+
+
+class CompensationPlan(models.Model):
+    """
+    Versioned compensation rules: profit split, hierarchy decay and cutoff depth.
+    Exactly one plan is active; workers cache it (bonuses.plan.current_plan) and every
+    BonusEvent records the version it was paid under. Never edit a plan that has paid out;
+    add a new version and activate it instead.
+    """
+    version = models.PositiveIntegerField(unique=True)
+    # Profit split in whole percent; the three parts add up to 100.
+    app_fee_percent = models.PositiveSmallIntegerField(default=20)
+    direct_percent = models.PositiveSmallIntegerField(default=40)
+    hierarchy_percent = models.PositiveSmallIntegerField(default=40)
+    # Depth i takes decay_percent / i percent of the hierarchy pool.
+    decay_percent = models.PositiveSmallIntegerField(default=30)
+    cutoff_depth = models.PositiveSmallIntegerField(
+        default=CLOSURE_MAX_DISTANCE,
+        validators=[MinValueValidator(1), MaxValueValidator(CLOSURE_MAX_DISTANCE)],
+    )
+    is_active = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "compensation_plans"
+        constraints = [
+            models.UniqueConstraint(fields=["is_active"], condition=Q(is_active=True), name="one_active_plan"),
+            models.CheckConstraint(
+                condition=Q(app_fee_percent=100 - F("direct_percent") - F("hierarchy_percent")),
+                name="plan_split_is_whole_profit",
+            ),
+            models.CheckConstraint(
+                condition=Q(cutoff_depth__gte=1, cutoff_depth__lte=CLOSURE_MAX_DISTANCE),
+                name="plan_cutoff_within_closure",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Plan v{self.version}{' (active)' if self.is_active else ''}"
 
 
 class BonusEvent(models.Model):
     """
     Append-only bonus ledger. Never update amount; only status PENDING -> RELEASED.
+
+    Every lane increment a purchase gives an ancestor is one unit, numbered per (user,
+    lane) in order (1, 2, ...), and has exactly one HIERARCHY event (amount 0 when the
+    share rounded to nothing). A DIRECT event carries the lane and unit of its referrer's
+    increment from the same order, or no lane when the referrer got none. The n-th pair
+    releases unit n on both lanes (tasks.engine.release_events).
     """
     class BonusType(models.TextChoices):
         DIRECT = "DIRECT", "Direct"
@@ -36,6 +84,10 @@ class BonusEvent(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     lane = models.CharField(max_length=1, choices=Lane.choices, null=True, blank=True)
     depth = models.PositiveIntegerField(null=True, blank=True)
+    # Lane unit number (null until numbered: striped counters number it when folding).
+    unit = models.PositiveIntegerField(null=True, blank=True)
+    # CompensationPlan.version the amount was computed with (null for events before plans).
+    plan_version = models.PositiveIntegerField(null=True, blank=True)
     status = models.CharField(
         max_length=20,
         choices=Status.choices,
@@ -50,6 +102,16 @@ class BonusEvent(models.Model):
             models.Index(fields=["user"], name="idx_bonus_user"),
             models.Index(fields=["order"], name="idx_bonus_order"),
             models.Index(fields=["status"], name="idx_bonus_status"),
+            # Pair releases: pending units of a user by number.
+            models.Index(fields=["user", "unit"], condition=Q(status="PENDING"), name="idx_bonus_pending_unit"),
+            # Pending DIRECT events without a unit (released with the referrer's next pair).
+            models.Index(
+                fields=["user"], condition=Q(status="PENDING", lane__isnull=True), name="idx_bonus_pending_unpaired"
+            ),
+            # Events of striped counters waiting for fold_shards to number them.
+            models.Index(
+                fields=["user", "id"], condition=Q(unit__isnull=True, lane__isnull=False), name="idx_bonus_unnumbered"
+            ),
         ]
 
     def __str__(self):
@@ -0,0 +1,161 @@
+"""
+Compensation plan rules for the bonus engine, and hierarchy decay in integer cents.
+
+current_plan() returns the active CompensationPlan as an immutable PlanConfig, cached per
+process: within settings.COMPENSATION_PLAN_CHECK_SECONDS it costs no query, after that one
+query checks the active version and the row is reloaded only if the version changed.
+
+The decay rule pays depth i (1 = nearest ancestor) decay_percent / i percent of the
+hierarchy pool, up to the cutoff depth (see docs/decay cutoff.txt). DecayTable precomputes
+that as integer weights over a common denominator, lcm(1..cutoff) * 100, so splitting a pool
+is a few integer multiplications and divmods per depth and no Decimal division.
+
+Rounding is deterministic: the pool of a purchase with k ancestors is allowed
+floor(pool * sum of the first k shares) cents; every depth gets the floor of its exact share,
+and the cents left over (fewer than k) go to the depths with the largest fractional
+remainders, nearer depths first on ties. The total never exceeds the pool.
+"""
+import math
+import time
+from dataclasses import dataclass
+from decimal import ROUND_DOWN, Decimal
+from functools import lru_cache, reduce
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .models import CompensationPlan
+
+CENT = Decimal("0.01")
+
+
+@dataclass(frozen=True)
+class DecayTable:
+    """
+    Per-depth pool shares as weights[i - 1] / denominator for depths 1..cutoff. A decay
+    that would pay more than the pool stops when the pool is exhausted: the depth that
+    exhausts it gets what is left and every deeper depth gets 0.
+    """
+    cutoff: int
+    denominator: int
+    weights: tuple[int, ...]
+    prefix: tuple[int, ...]
+
+    @classmethod
+    def build(cls, decay_percent=30, cutoff=15):
+        lcm = reduce(math.lcm, range(1, cutoff + 1), 1)
+        denominator = 100 * lcm
+        weights = []
+        prefix = []
+        total = 0
+        for i in range(1, cutoff + 1):
+            weight = min(decay_percent * lcm // i, denominator - total)
+            total += weight
+            weights.append(weight)
+            prefix.append(total)
+        return cls(cutoff=cutoff, denominator=denominator, weights=tuple(weights), prefix=tuple(prefix))
+
+    def split(self, pool_cents_num, depths, pool_cents_den=1):
+        """
+        Cents for depths 1..min(depths, cutoff) from a pool of pool_cents_num / pool_cents_den
+        cents (a fraction, so profit * ratio needs no rounding before the split).
+        """
+        depths = min(depths, self.cutoff)
+        if depths <= 0 or pool_cents_num <= 0:
+            return [0] * max(depths, 0)
+        den = pool_cents_den * self.denominator
+        shares = []
+        remainders = []
+        for i in range(depths):
+            share, rem = divmod(pool_cents_num * self.weights[i], den)
+            shares.append(share)
+            remainders.append(rem)
+        leftover = pool_cents_num * self.prefix[depths - 1] // den - sum(shares)
+        if leftover:
+            for i in sorted(range(depths), key=lambda i: (-remainders[i], i))[:leftover]:
+                shares[i] += 1
+        return shares
+
+
+@lru_cache(maxsize=32)
+def decay_table(decay_percent=30, cutoff=15):
+    """DecayTable for a plan's decay parameters, built once per process."""
+    return DecayTable.build(decay_percent, cutoff)
+
+
+def to_cents(amount):
+    """Decimal amount (two places) to integer cents."""
+    return int(amount.quantize(CENT, rounding=ROUND_DOWN).scaleb(2))
+
+
+def from_cents(cents):
+    """Integer cents to a two-place Decimal, without division."""
+    return Decimal(cents).scaleb(-2)
+
+
+def naive_decimal_split(pool, depths, decay_percent=30, cutoff=15):
+    """
+    Reference: per-depth Decimal arithmetic, floored to the cent, stopping when the pool is
+    exhausted (used by bench_decay and the tests).
+    """
+    remaining = pool.quantize(CENT, rounding=ROUND_DOWN)
+    shares = []
+    for i in range(1, min(depths, cutoff) + 1):
+        share = min(remaining, (pool * decay_percent / i / 100).quantize(CENT, rounding=ROUND_DOWN))
+        shares.append(share)
+        remaining -= share
+    return shares
+
+
+@dataclass(frozen=True)
+class PlanConfig:
+    """Plain, immutable copy of a CompensationPlan row."""
+    version: int
+    app_fee_ratio: Decimal
+    direct_ratio: Decimal
+    hierarchy_ratio: Decimal
+    decay_percent: int
+    cutoff: int
+
+    @classmethod
+    def from_model(cls, plan):
+        return cls(
+            version=plan.version,
+            app_fee_ratio=Decimal(plan.app_fee_percent).scaleb(-2),
+            direct_ratio=Decimal(plan.direct_percent).scaleb(-2),
+            hierarchy_ratio=Decimal(plan.hierarchy_percent).scaleb(-2),
+            decay_percent=plan.decay_percent,
+            cutoff=plan.cutoff_depth,
+        )
+
+    @property
+    def table(self):
+        return decay_table(self.decay_percent, self.cutoff)
+
+
+_cached = None
+_checked_at = 0.0
+
+
+def current_plan():
+    """The active plan (PlanConfig), reloaded only when the active version changes."""
+    global _cached, _checked_at
+    now = time.monotonic()
+    interval = getattr(settings, "COMPENSATION_PLAN_CHECK_SECONDS", 60)
+    if _cached is not None and now - _checked_at < interval:
+        return _cached
+    active = CompensationPlan.objects.filter(is_active=True)
+    if _cached is None or active.values_list("version", flat=True).first() != _cached.version:
+        plan = active.first()
+        if plan is None:
+            raise ImproperlyConfigured("No active compensation plan; activate a CompensationPlan.")
+        _cached = PlanConfig.from_model(plan)
+    _checked_at = now
+    return _cached
+
+
+def reset_plan_cache():
+    """Forget the cached plan (tests; the next current_plan() reloads it)."""
+    global _cached, _checked_at
+    _cached = None
+    _checked_at = 0.0
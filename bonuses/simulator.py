@@ -0,0 +1,353 @@
+"""
+Offline bonus simulator (NumPy, optional: pip install ".[sim]").
+
+Projects payouts and pairing for a purchase stream under one or more compensation plans
+without touching the ledger. The tree is a set of arrays indexed by node position: parent
+(-1 for roots), lane under the parent (0 = L, 1 = R) and referrer position (-1 for none),
+loaded from a tree snapshot or built with the tree.shapes generators. Purchases are
+(buyer position, profit in cents) arrays, processed in chunks: each upline level is one
+gather (parent[current]) over the chunk and the amounts and lane increments land with
+np.bincount, so the cost is cutoff vectorized passes per chunk whatever the tree size.
+The stream is walked twice: once for the counters, once for the amounts, because which
+hierarchy units end up paired depends on the final counters.
+
+Amounts follow tasks.engine exactly: integer cents, direct and app fee rounded down, the
+hierarchy pool split by the plan's DecayTable with largest-remainder rounding (split_pools
+is DecayTable.split over a whole chunk). Released pairs only ever grow to min(left, right),
+so a user's pairs after any prefix of the stream are min(left, right) minus the pairs
+released before the stream started. Lane units are numbered per (user, lane) in stream
+order after the starting counters, as the engine numbers them, and pair n releases unit n
+on both lanes (tasks.engine.release_events): released is the hierarchy amount of the
+stream's units numbered up to the final min(left, right).
+"""
+import random
+from dataclasses import dataclass, field
+from functools import cached_property
+
+from django.contrib.auth import get_user_model
+
+from bonuses.plan import from_cents, to_cents
+from tasks.engine import order_profits
+from tree.models import PairingCounter
+from tree.shapes import build_shape
+from tree.snapshot import ABSENT, TreeSnapshot
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency: the "sim" extra
+    np = None
+
+User = get_user_model()
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError('The bonus simulator needs NumPy: pip install ".[sim]" (numpy>=1.26).')
+
+
+def _percent(ratio):
+    """PlanConfig ratio (two-place Decimal) to whole percent."""
+    return int(ratio.scaleb(2))
+
+
+@dataclass
+class SimTree:
+    """Node arrays by position; user_ids maps positions back to users for database trees."""
+    parent: "np.ndarray"
+    lane: "np.ndarray"
+    referrer: "np.ndarray"
+    user_ids: "np.ndarray | None" = None
+
+    def __len__(self):
+        return len(self.parent)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, referrals=()):
+        """
+        Tree of a tree.snapshot.TreeSnapshot (fully loaded). referrals yields
+        (user_id, referred_by_id); referrers who are not placed get detached entries (no
+        parent, nobody below) after the nodes, so their direct bonuses are kept.
+        """
+        require_numpy()
+        users = np.frombuffer(snapshot.user, dtype=np.int64).copy()
+        present = np.flatnonzero(users != ABSENT)
+        position = np.full(len(users), -1, dtype=np.int64)
+        position[present] = np.arange(len(present))
+        parent_ids = np.frombuffer(snapshot.parent, dtype=np.int64)[present]
+        parent = np.where(parent_ids >= 0, position[parent_ids], -1)
+        lane = np.frombuffer(snapshot.lane, dtype=np.uint8)[present].astype(np.int8)
+        user_ids = users[present]
+        pairs = np.fromiter((v for row in referrals for v in row), dtype=np.int64).reshape(-1, 2)
+        detached = np.setdiff1d(pairs[:, 1], user_ids)
+        tree = cls(
+            parent=np.concatenate([parent, np.full(len(detached), -1, dtype=np.int64)]),
+            lane=np.concatenate([lane, np.zeros(len(detached), dtype=np.int8)]),
+            referrer=np.full(len(present) + len(detached), -1, dtype=np.int64),
+            user_ids=np.concatenate([user_ids, detached]),
+        )
+        if len(pairs):
+            buyers, sponsors = tree.positions_of(pairs[:, 0]), tree.positions_of(pairs[:, 1])
+            placed = buyers >= 0
+            tree.referrer[buyers[placed]] = sponsors[placed]
+        return tree
+
+    @classmethod
+    def from_database(cls):
+        """The current tree and referrers (read only, streamed)."""
+        snapshot = TreeSnapshot()
+        snapshot.refresh()
+        referrals = User.objects.filter(referred_by__isnull=False).values_list("id", "referred_by_id")
+        return cls.from_snapshot(snapshot, referrals.iterator(chunk_size=50000))
+
+    @classmethod
+    def from_shape(cls, nodes, shape="random", seed=42, skew=0.75):
+        """Synthetic tree with the tree.shapes shapes (full, random, skewed, powerlaw)."""
+        require_numpy()
+        parent, lane, sponsor = build_shape(shape, nodes, random.Random(seed), skew)
+        return cls(
+            parent=np.frombuffer(parent, dtype=np.int64).copy(),
+            lane=np.frombuffer(lane, dtype=np.uint8).astype(np.int8),
+            referrer=np.frombuffer(sponsor, dtype=np.int64).copy(),
+        )
+
+    @cached_property
+    def _user_order(self):
+        return np.argsort(self.user_ids, kind="stable")
+
+    def positions_of(self, user_ids):
+        """Positions of user_ids (int64 array) in a database tree, -1 for users not in it."""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if not len(self):
+            return np.full(len(user_ids), -1, dtype=np.int64)
+        order = self._user_order
+        sorted_ids = self.user_ids[order]
+        idx = np.minimum(np.searchsorted(sorted_ids, user_ids), len(order) - 1)
+        return np.where(sorted_ids[idx] == user_ids, order[idx], -1)
+
+    def counters(self):
+        """(left, right, released_pairs) int64 arrays by position from PairingCounter."""
+        rows = np.fromiter(
+            (
+                v
+                for row in PairingCounter.objects.values_list(
+                    "user_id", "left_count", "right_count", "released_pairs"
+                ).iterator(chunk_size=50000)
+                for v in row
+            ),
+            dtype=np.int64,
+        ).reshape(-1, 4)
+        result = tuple(np.zeros(len(self), np.int64) for _ in range(3))
+        at = self.positions_of(rows[:, 0])
+        placed = at >= 0
+        for column, arr in enumerate(result, start=1):
+            arr[at[placed]] = rows[placed, column]
+        return result
+
+
+@dataclass
+class Purchases:
+    """
+    Buyer positions and profits in cents, in stream order. referrer (positions) overrides
+    the tree's referrer of each buyer; buyers at -1 are not placed and only pay direct.
+    """
+    buyer: "np.ndarray"
+    profit_cents: "np.ndarray"
+    referrer: "np.ndarray | None" = None
+
+    def __len__(self):
+        return len(self.buyer)
+
+    @classmethod
+    def from_orders(cls, tree, orders):
+        """
+        Historical purchases of a database tree: the orders queryset in id order, with
+        their markup profit (tasks.engine.order_profits) and the buyer's referrer.
+        """
+        require_numpy()
+        rows = np.fromiter(
+            (
+                -1 if v is None else v
+                for row in orders.order_by("id").values_list("id", "buyer_id", "buyer__referred_by_id")
+                for v in row
+            ),
+            dtype=np.int64,
+        ).reshape(-1, 3)
+        profits = order_profits(orders.values_list("id", flat=True))
+        return cls(
+            buyer=tree.positions_of(rows[:, 1]),
+            profit_cents=np.fromiter((to_cents(profits[o]) for o in rows[:, 0].tolist()), dtype=np.int64),
+            referrer=tree.positions_of(rows[:, 2]),
+        )
+
+    @classmethod
+    def synthetic(cls, tree, count, mean_profit_cents=2000, sigma=1.0, seed=0):
+        """Uniformly random buyers, log-normal profits with the given mean."""
+        require_numpy()
+        rng = np.random.default_rng(seed)
+        buyer = rng.integers(0, len(tree), size=count, dtype=np.int64)
+        profit = rng.lognormal(np.log(mean_profit_cents) - sigma ** 2 / 2, sigma, size=count)
+        return cls(buyer=buyer, profit_cents=profit.astype(np.int64))
+
+
+def split_pools(table, pool_num, pool_den, depths):
+    """
+    DecayTable.split for a chunk: pools of pool_num / pool_den cents (int64 arrays) with
+    depths ancestors each. Returns (len(pool_num), cutoff) int64 cents, row by row the same
+    as table.split.
+    """
+    k = table.cutoff
+    weights = np.asarray(table.weights, dtype=np.int64)
+    prefix = np.asarray((0,) + table.prefix, dtype=np.int64)
+    den = pool_den * table.denominator
+    live = np.arange(k)[None, :] < depths[:, None]
+    shares, rem = np.divmod(pool_num[:, None] * weights[None, :], den)
+    shares = np.where(live, shares, 0)
+    rem = np.where(live, rem, -1)
+    leftover = pool_num * prefix[depths] // den - shares.sum(axis=1)
+    # Largest remainders first, nearer depths first on ties (stable sort).
+    order = np.argsort(-rem, axis=1, kind="stable")
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.broadcast_to(np.arange(k), order.shape), axis=1)
+    return shares + (rank < leftover[:, None])
+
+
+def _upline(tree, buyer, cutoff):
+    """(ancestors, via) (len(buyer), cutoff) arrays: ancestor positions (-1 past the root), lane under each."""
+    ancestors = np.empty((len(buyer), cutoff), np.int64)
+    via = np.empty((len(buyer), cutoff), np.int8)
+    current = buyer
+    for k in range(cutoff):
+        via[:, k] = tree.lane[current]
+        current = np.where(current >= 0, tree.parent[current], -1)
+        ancestors[:, k] = current
+    return ancestors, via
+
+
+def _ranks(keys):
+    """Occurrence number (0, 1, ...) of each key among the earlier equal keys."""
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    first = np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+    ranks = np.empty(len(keys), np.int64)
+    ranks[order] = np.arange(len(keys)) - first
+    return ranks
+
+
+def _bincount(index, n, weights=None):
+    counts = np.bincount(index, weights=weights, minlength=n)
+    return counts if weights is None else np.rint(counts).astype(np.int64)
+
+
+@dataclass
+class SimResult:
+    """Per-position amounts (cents) and counters after simulating one plan."""
+    version: int
+    purchases: int
+    profit_cents: int
+    app_fee_cents: int
+    pool_cents: int
+    direct: "np.ndarray"
+    hierarchy: "np.ndarray"
+    left: "np.ndarray"
+    right: "np.ndarray"
+    pairs: "np.ndarray"
+    released: "np.ndarray"
+    evolution: list[tuple[int, int]] = field(default_factory=list)
+
+    def totals(self):
+        direct, hierarchy = int(self.direct.sum()), int(self.hierarchy.sum())
+        payout = direct + hierarchy
+        return {
+            "plan_version": self.version,
+            "purchases": self.purchases,
+            "profit": from_cents(self.profit_cents),
+            "app_fee": from_cents(self.app_fee_cents),
+            "direct": from_cents(direct),
+            "hierarchy": from_cents(hierarchy),
+            "hierarchy_unpaid": from_cents(self.pool_cents - hierarchy),
+            "pairs": int(self.pairs.sum()),
+            "released": from_cents(int(self.released.sum())),
+            "payout": from_cents(payout),
+            "payout_ratio": round(payout / self.profit_cents, 4) if self.profit_cents else 0.0,
+            "earners": int(np.count_nonzero(self.direct + self.hierarchy)),
+        }
+
+
+def simulate(tree, purchases, config, chunk_size=250_000, counters=None):
+    """
+    Replay purchases through tree under config (bonuses.plan.PlanConfig). counters is an
+    optional (left, right, released_pairs) triple of int64 arrays by position to start from
+    (zeros by default). Returns a SimResult; evolution holds (purchases so far, pairs
+    released so far) after every chunk.
+    """
+    require_numpy()
+    n = len(tree)
+    if counters is None:
+        counters = (np.zeros(n, np.int64),) * 3
+    left, right = counters[0].copy(), counters[1].copy()
+    released_before = counters[2]
+    direct = np.zeros(n, np.int64)
+    app_fee_pct, direct_pct = _percent(config.app_fee_ratio), _percent(config.direct_ratio)
+    hierarchy_pct = _percent(config.hierarchy_ratio)
+    cutoff = config.cutoff
+    table = config.table
+    profit_total = app_fee_total = pool_total = 0
+    evolution = []
+    chunks = range(0, len(purchases), chunk_size)
+
+    for start in chunks:
+        buyer = purchases.buyer[start:start + chunk_size]
+        profit = np.maximum(purchases.profit_cents[start:start + chunk_size], 0)
+        profit_total += int(profit.sum())
+        app_fee_total += int((profit * app_fee_pct // 100).sum())
+        pool_total += int((profit * hierarchy_pct).sum()) // 100
+
+        if purchases.referrer is not None:
+            ref = purchases.referrer[start:start + chunk_size]
+        else:
+            ref = np.where(buyer >= 0, tree.referrer[buyer], -1)
+        has_ref = ref >= 0
+        direct += _bincount(ref[has_ref], n, (profit * direct_pct // 100)[has_ref])
+
+        ancestors, via = _upline(tree, buyer, cutoff)
+        placed = ancestors >= 0
+        left += _bincount(ancestors[placed & (via == 0)], n)
+        right += _bincount(ancestors[placed & (via == 1)], n)
+        done = min(len(purchases), start + chunk_size)
+        evolution.append((done, int((np.minimum(left, right) - released_before).clip(min=0).sum())))
+
+    # Second walk: amounts, and the units among them that the final counters pair.
+    paired = np.minimum(left, right)
+    counts = np.stack([counters[0], counters[1]])  # running unit numbers by (lane, position)
+    hierarchy = np.zeros(n, np.int64)
+    released = np.zeros(n, np.int64)
+    for start in chunks:
+        buyer = purchases.buyer[start:start + chunk_size]
+        pool_num = np.maximum(purchases.profit_cents[start:start + chunk_size], 0) * hierarchy_pct
+        ancestors, via = _upline(tree, buyer, cutoff)
+        placed = ancestors >= 0
+        shares = split_pools(table, pool_num, 100, placed.sum(axis=1))
+        # Row-major order is stream order; an ancestor appears once per purchase.
+        at, lane, share = ancestors[placed], via[placed].astype(np.int64), shares[placed]
+        unit = counts[lane, at] + _ranks(at * 2 + lane) + 1
+        released_unit = unit <= paired[at]
+        hierarchy += _bincount(at, n, share)
+        released += _bincount(at[released_unit], n, share[released_unit])
+        counts[0] += _bincount(at[lane == 0], n)
+        counts[1] += _bincount(at[lane == 1], n)
+
+    return SimResult(
+        version=config.version,
+        purchases=len(purchases),
+        profit_cents=profit_total,
+        app_fee_cents=app_fee_total,
+        pool_cents=pool_total,
+        direct=direct,
+        hierarchy=hierarchy,
+        left=left,
+        right=right,
+        pairs=(paired - released_before).clip(min=0),
+        released=released,
+        evolution=evolution,
+    )
@@ -0,0 +1,86 @@
+"""Tests for bonuses management commands."""
+import json
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from bonuses.models import BonusEvent
+from bonuses.plan import reset_plan_cache
+from bonuses.simulator import np
+from tasks import engine
+from tasks.tests.factories import make_paid_order, make_placed_user
+from tree.models import PairingCounter
+from tree.snapshot import reset_snapshot
+
+
+@skipUnless(np, "NumPy is not installed (optional 'sim' extra).")
+class EvaluatePlanTest(TestCase):
+    def setUp(self):
+        reset_snapshot()
+        reset_plan_cache()
+        self.addCleanup(reset_snapshot)
+        self.addCleanup(reset_plan_cache)
+        # root -> a (L) -> buyer (L); root -> b (R) -> other (R)
+        self.root = make_placed_user("root@test.example")
+        self.a = make_placed_user("a@test.example", self.root.tree_node, "L")
+        self.buyer = make_placed_user("buyer@test.example", self.a.tree_node, "L", referred_by=self.a)
+        self.b = make_placed_user("b@test.example", self.root.tree_node, "R")
+        self.other = make_placed_user("other@test.example", self.b.tree_node, "R", referred_by=self.root)
+        for buyer in (self.buyer, self.buyer, self.other):
+            engine.process_order(make_paid_order(buyer, Decimal("150.00"), Decimal("100.00")).id)  # profit 50
+        engine.sweep_pair_releases()
+
+    def _evaluate(self, **options):
+        out, err = StringIO(), StringIO()
+        call_command("evaluate_plan", stdout=out, stderr=err, **options)
+        return [json.loads(line) for line in out.getvalue().splitlines()], err.getvalue()
+
+    def test_same_plan_matches_ledger(self):
+        rows, summary = self._evaluate()
+        self.assertEqual(rows, [])
+        self.assertIn("0 user(s) changed", summary)
+        rows, _ = self._evaluate(all=True)
+        root = next(r for r in rows if r["user_id"] == self.root.id)
+        self.assertEqual(root["direct"], "20.00")  # other's order
+        self.assertEqual(root["actual_hierarchy"], root["hierarchy"])
+        self.assertEqual(root["delta"], "0.00")
+
+    def test_alternative_split_is_read_only(self):
+        state = (
+            list(BonusEvent.objects.order_by("id").values_list("id", "amount")),
+            list(PairingCounter.objects.order_by("user_id").values_list("left_count", "right_count", "released_pairs")),
+        )
+        rows, summary = self._evaluate(direct_percent=30, hierarchy_percent=50, cutoff=1)
+        by_user = {r["user_id"]: r for r in rows}
+        # a: direct 2 x 15.00 (was 2 x 20.00), hierarchy depth 1 = 25 * 30/100 = 7.50 (was 2 x 6.00)
+        self.assertEqual(
+            (by_user[self.a.id]["direct"], by_user[self.a.id]["hierarchy"], by_user[self.a.id]["delta"]),
+            ("30.00", "15.00", "-7.00"),
+        )
+        # root: cut off (depth 2 under buyer); direct for other's order
+        self.assertEqual(by_user[self.root.id]["hierarchy"], "0.00")
+        self.assertIn("with overrides", summary)
+        self.assertEqual(state, (
+            list(BonusEvent.objects.order_by("id").values_list("id", "amount")),
+            list(PairingCounter.objects.order_by("user_id").values_list("left_count", "right_count", "released_pairs")),
+        ))
+
+    def test_decay_that_exhausts_the_pool(self):
+        rows, summary = self._evaluate(decay_percent=80, cutoff=2)
+        by_user = {r["user_id"]: r for r in rows}
+        # every pool is 20.00: depth 1 gets 80% = 16.00, depth 2 the last 4.00 instead of 40%
+        self.assertEqual(by_user[self.a.id]["hierarchy"], "32.00")
+        self.assertEqual(by_user[self.root.id]["hierarchy"], "12.00")  # depth 2 under buyer x 2 and other
+        self.assertIn("with overrides", summary)
+
+    def test_invalid_overrides(self):
+        with self.assertRaisesMessage(CommandError, "add up to 100"):
+            self._evaluate(direct_percent=50)
+        with self.assertRaisesMessage(CommandError, "--cutoff"):
+            self._evaluate(cutoff=16)
+        with self.assertRaisesMessage(CommandError, "Unknown plan"):
+            self._evaluate(plan=9)
@@ -0,0 +1,109 @@
+from decimal import Decimal
+from fractions import Fraction
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from bonuses.models import CompensationPlan
+from bonuses.plan import (
+    DecayTable,
+    current_plan,
+    decay_table,
+    from_cents,
+    naive_decimal_split,
+    reset_plan_cache,
+    to_cents,
+)
+
+
+class DecayTableTest(SimpleTestCase):
+    def test_weights_match_decay_rule(self):
+        table = decay_table(30, 15)
+        for i, weight in enumerate(table.weights, start=1):
+            self.assertEqual(Fraction(weight, table.denominator), Fraction(30, i * 100))
+
+    def test_split_pays_floor_of_exact_total(self):
+        table = decay_table(30, 15)
+        for pool in (1, 7, 99, 1234, 40_000, 987_654):
+            for depths in (1, 3, 7, 15, 20):
+                shares = table.split(pool, depths)
+                exact = sum(Fraction(30 * pool, i * 100) for i in range(1, min(depths, 15) + 1))
+                self.assertEqual(sum(shares), int(exact))
+                self.assertEqual(len(shares), min(depths, 15))
+
+    def test_split_within_a_cent_of_decimal(self):
+        table = decay_table(30, 15)
+        for pool in (Decimal("0.99"), Decimal("12.34"), Decimal("400.00"), Decimal("9876.53")):
+            naive = naive_decimal_split(pool, 15)
+            cents = table.split(to_cents(pool), 15)
+            for a, b in zip(naive, cents):
+                self.assertIn(b - to_cents(a), (0, 1))
+
+    def test_fractional_pool_and_remainder_order(self):
+        table = decay_table(30, 15)
+        # 40% of 100.01 = 4000.4 cents; no rounding before the split.
+        self.assertEqual(table.split(10001 * 2, 3, pool_cents_den=5), [1200, 600, 400])
+        # 0.07 over 7 depths: exact total 5.4 cents -> 5, remainders go nearest-first on ties.
+        self.assertEqual(table.split(7, 7), [2, 1, 1, 1, 0, 0, 0])
+        self.assertEqual(table.split(7, 7), table.split(7, 7))
+
+    def test_zero_pool(self):
+        self.assertEqual(decay_table(30, 15).split(0, 4), [0, 0, 0, 0])
+
+    def test_overpaying_decay_stops_when_pool_is_exhausted(self):
+        table = DecayTable.build(decay_percent=60, cutoff=15)
+        # 60 + 30 = 90 percent, then depth 3 (20 percent) only gets the last 10.
+        self.assertEqual(Fraction(table.weights[2], table.denominator), Fraction(10, 100))
+        self.assertEqual(table.weights[3:], (0,) * 12)
+        self.assertEqual(table.prefix[-1], table.denominator)
+        for pool in (Decimal("0.99"), Decimal("12.34"), Decimal("400.00"), Decimal("9876.53")):
+            naive = naive_decimal_split(pool, 15, decay_percent=60)
+            cents = table.split(to_cents(pool), 15)
+            self.assertEqual(sum(cents), to_cents(sum(naive)))
+            self.assertEqual(sum(cents), to_cents(pool))
+            for a, b in zip(naive[:2], cents[:2]):
+                self.assertIn(b - to_cents(a), (0, 1))
+            self.assertEqual(cents[3:], [0] * 12)
+            self.assertEqual(naive[3:], [0] * 12)
+
+    def test_cents_round_trip(self):
+        self.assertEqual(to_cents(Decimal("12.349")), 1234)
+        self.assertEqual(from_cents(1234), Decimal("12.34"))
+
+
+class CurrentPlanTest(TestCase):
+    def setUp(self):
+        reset_plan_cache()
+        self.addCleanup(reset_plan_cache)
+
+    def test_seeded_plan_matches_documented_rules(self):
+        plan = current_plan()
+        self.assertEqual(plan.version, 1)
+        self.assertEqual(
+            (plan.app_fee_ratio, plan.direct_ratio, plan.hierarchy_ratio),
+            (Decimal("0.20"), Decimal("0.40"), Decimal("0.40")),
+        )
+        self.assertEqual((plan.decay_percent, plan.cutoff), (30, 15))
+        with self.assertNumQueries(0):
+            self.assertIs(current_plan(), plan)
+
+    @override_settings(COMPENSATION_PLAN_CHECK_SECONDS=0)
+    def test_reloads_only_when_version_changes(self):
+        plan = current_plan()
+        with self.assertNumQueries(1):
+            self.assertIs(current_plan(), plan)
+        CompensationPlan.objects.update(is_active=False)
+        CompensationPlan.objects.create(version=2, cutoff_depth=5, is_active=True)
+        self.assertEqual((current_plan().version, current_plan().cutoff), (2, 5))
+
+    def test_no_active_plan(self):
+        CompensationPlan.objects.update(is_active=False)
+        with self.assertRaises(ImproperlyConfigured):
+            current_plan()
+
+    def test_one_active_plan_and_split_is_whole_profit(self):
+        with transaction.atomic(), self.assertRaises(IntegrityError):
+            CompensationPlan.objects.create(version=2, is_active=True)
+        with transaction.atomic(), self.assertRaises(IntegrityError):
+            CompensationPlan.objects.create(version=3, direct_percent=70)
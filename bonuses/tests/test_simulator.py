@@ -0,0 +1,119 @@
+"""Tests for bonuses.simulator (skipped without the optional NumPy dependency)."""
+import random
+from collections import defaultdict
+from dataclasses import replace
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from bonuses.plan import PlanConfig, decay_table, from_cents
+from bonuses.simulator import Purchases, SimTree, np, simulate, split_pools
+from tasks.engine import plan_purchase
+from tree.models import PairingCounter, TreeNode
+from tree.snapshot import TreeSnapshot
+
+User = get_user_model()
+
+PLAN = PlanConfig(
+    version=1,
+    app_fee_ratio=Decimal("0.20"),
+    direct_ratio=Decimal("0.40"),
+    hierarchy_ratio=Decimal("0.40"),
+    decay_percent=30,
+    cutoff=15,
+)
+
+
+@skipUnless(np, "NumPy is not installed (optional 'sim' extra).")
+class SimulatorTest(SimpleTestCase):
+    def test_split_pools_matches_decay_table(self):
+        rng = random.Random(3)
+        table = decay_table(30, 15)
+        pools = [rng.randrange(0, 2_000_000) for _ in range(500)]
+        depths = [rng.randrange(0, 16) for _ in range(500)]
+        shares = split_pools(table, np.array(pools, dtype=np.int64) * 40, 100, np.array(depths))
+        for pool, depth, row in zip(pools, depths, shares):
+            expected = table.split(pool * 40, depth, pool_cents_den=100)
+            self.assertEqual(list(row[:depth]), expected)
+            self.assertFalse(row[depth:].any())
+
+    def test_amounts_match_engine(self):
+        tree = SimTree.from_shape(300, "random", seed=5)
+        purchases = Purchases.synthetic(tree, 2000, mean_profit_cents=3000, seed=7)
+        plan = replace(PLAN, version=2, cutoff=6, direct_ratio=Decimal("0.30"), hierarchy_ratio=Decimal("0.50"))
+        result = simulate(tree, purchases, plan, chunk_size=333)
+
+        paid = defaultdict(Decimal)
+        lanes = defaultdict(lambda: [0, 0])
+        units = []  # (user, unit, amount) of the hierarchy events, numbered as the engine does
+        for buyer, profit in zip(purchases.buyer.tolist(), purchases.profit_cents.tolist()):
+            upline, child = [], buyer
+            while tree.parent[child] >= 0 and len(upline) < 15:
+                parent = int(tree.parent[child])
+                upline.append((parent, parent, len(upline) + 1, "LR"[tree.lane[child]]))
+                child = parent
+            referrer = int(tree.referrer[buyer])
+            purchase = plan_purchase(0, from_cents(profit), referrer if referrer >= 0 else None, upline, plan)
+            for event in purchase.events:
+                paid[event.user_id] += event.amount
+                if event.bonus_type == "HIERARCHY":
+                    side = "LR".index(event.lane)
+                    units.append((event.user_id, lanes[event.user_id][side] + 1, event.amount))
+            for side, users in enumerate((purchase.lanes["L"], purchase.lanes["R"])):
+                for user in users:
+                    lanes[user][side] += 1
+
+        simulated = result.direct + result.hierarchy
+        self.assertEqual(
+            {i: from_cents(int(c)) for i, c in enumerate(simulated) if c}, {u: a for u, a in paid.items() if a}
+        )
+        self.assertEqual({i: [int(result.left[i]), int(result.right[i])] for i in lanes}, dict(lanes))
+        self.assertTrue((result.pairs == np.minimum(result.left, result.right)).all())
+        released = defaultdict(Decimal)
+        for user, unit, amount in units:
+            if unit <= min(lanes[user]):
+                released[user] += amount
+        self.assertEqual({i: from_cents(int(c)) for i, c in enumerate(result.released) if c},
+                         {u: a for u, a in released.items() if a})
+        self.assertLess(0, int(result.released.sum()))
+        self.assertLess(int(result.released.sum()), int(result.hierarchy.sum()))
+        self.assertEqual(result.evolution[-1], (2000, int(result.pairs.sum())))
+        self.assertEqual(len(result.evolution), 7)
+        totals = result.totals()
+        self.assertEqual(totals["payout"], totals["direct"] + totals["hierarchy"])
+        self.assertEqual(totals["released"], from_cents(int(result.released.sum())))
+        self.assertLessEqual(totals["direct"] + totals["hierarchy"], totals["profit"] * Decimal("0.80"))
+
+
+@skipUnless(np, "NumPy is not installed (optional 'sim' extra).")
+class SimTreeFromDatabaseTest(TestCase):
+    def test_snapshot_tree_maps_users_and_counters(self):
+        def place(email, parent=None, lane="L", referred_by=None):
+            user = User.objects.create_user(username=email, email=email, password="x", referred_by=referred_by)
+            TreeNode.objects.create(user=user, parent=parent, lane=lane, depth=parent.depth + 1 if parent else 0)
+            return user
+
+        root = place("root@test.example")
+        a = place("a@test.example", root.tree_node, "L", referred_by=root)
+        b = place("b@test.example", a.tree_node, "R", referred_by=root)
+        outside = User.objects.create_user(username="out@test.example", email="out@test.example", password="x")
+        c = place("c@test.example", b.tree_node, "L", referred_by=outside)
+        PairingCounter.objects.create(user=root, left_count=4, right_count=2, released_pairs=1)
+        snapshot = TreeSnapshot()
+        snapshot.refresh()
+        tree = SimTree.from_snapshot(snapshot, User.objects.filter(referred_by__isnull=False).values_list(
+            "id", "referred_by_id"
+        ))
+        pos = {u.id: int(p) for u, p in zip((root, a, b), tree.positions_of([root.id, a.id, b.id]))}
+        self.assertEqual(tree.parent[pos[b.id]], pos[a.id])
+        self.assertEqual((tree.lane[pos[a.id]], tree.lane[pos[b.id]]), (0, 1))
+        self.assertEqual(tree.referrer[pos[b.id]], pos[root.id])
+        self.assertEqual(tree.parent[pos[root.id]], -1)
+        self.assertEqual(tree.positions_of([999999]).tolist(), [-1])
+        detached = int(tree.positions_of([outside.id])[0])  # unplaced referrer: kept for direct bonuses
+        self.assertEqual((tree.referrer[tree.positions_of([c.id])[0]], tree.parent[detached]), (detached, -1))
+        self.assertEqual(len(tree), 5)
+        left, right, released = tree.counters()
+        self.assertEqual((left[pos[root.id]], right[pos[root.id]], released[pos[root.id]]), (4, 2, 1))
@@ -36,6 +36,7 @@ urlpatterns = [
     path("wishlist/<int:product_id>/remove/", api_views.api_wishlist_remove),
     path("dashboard/", api_views.api_dashboard),
     path("dashboard/tree/", api_views.api_tree_data),
+    path("dashboard/tree/stats/", api_views.api_tree_stats),
     path("dashboard/bonus-events/", api_views.api_bonus_events),
     path("dashboard/recompute/", api_views.api_dashboard_recompute),
 ]
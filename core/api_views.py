@@ -1,4 +1,6 @@
 """REST API for the React SPA. Session-based auth (cookie)."""
+import gzip
+import hashlib
 import json
 from decimal import Decimal
 from urllib.parse import quote
@@ -7,16 +9,21 @@ from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q, Sum
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.csrf import ensure_csrf_cookie
-from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from django.views.decorators.http import condition, require_GET, require_http_methods, require_POST
 
 from bonuses.models import BonusEvent
 from orders.models import Order, OrderItem
 from products.models import Product
 from sellers.models import Seller, Store
-from tasks.tasks import process_purchase, release_pairs_for_user
-from tree.models import PairingCounter, TreeNode
+from tasks.tasks import enqueue_purchase, release_pairs_for_user
+from tree.counters import add_shard_deltas
+from tree.export import pack_columns, subtree_columns
+from tree.layout import cached_layout
+from tree.models import CLOSURE_MAX_DISTANCE, PairingCounter, TreeNode
+from tree.repository import downline_counts, load_subtree, subtree_page, subtree_stamp
 from users.models import User, ShippingAddress, Wishlist
 
 
@@ -479,7 +486,7 @@ def api_user_update(request):
             return JsonResponse({"error": "An account with this email already exists."}, status=400)
         user.email = email
         user.username = email
-        user.save(update_fields=["email", "username"])
+        user.save(update_fields=["email", "username", "updated_at"])
     return JsonResponse({"user": {"id": user.pk, "email": user.email}})
 
 
@@ -765,7 +772,7 @@ def api_order_cancel(request, order_id):
 @login_required
 @ensure_csrf_cookie
 def api_order_mark_paid(request, order_id):
-    """Mark an order as paid and enqueue process_purchase for bonus calculation."""
+    """Mark an order as paid and hand it to the bonus engine (tasks.tasks.enqueue_purchase)."""
     try:
         order = Order.objects.get(id=order_id, buyer=request.user)
     except Order.DoesNotExist:
@@ -774,7 +781,7 @@ def api_order_mark_paid(request, order_id):
         return JsonResponse({"error": "Only pending orders can be marked paid."}, status=400)
     order.status = Order.Status.PAID
     order.save(update_fields=["status"])
-    process_purchase.delay(order.id)
+    enqueue_purchase(order.id)
     return JsonResponse({"ok": True, "status": order.status})
 
 
@@ -873,6 +880,7 @@ def api_dashboard(request):
     counter, _ = PairingCounter.objects.get_or_create(
         user=user, defaults={"left_count": 0, "right_count": 0, "released_pairs": 0}
     )
+    add_shard_deltas({user.id: counter})
     bonus_qs = BonusEvent.objects.filter(user=user)
     direct = bonus_qs.filter(bonus_type=BonusEvent.BonusType.DIRECT).aggregate(s=Sum("amount"))["s"] or Decimal("0")
     hierarchy = bonus_qs.filter(bonus_type=BonusEvent.BonusType.HIERARCHY).aggregate(s=Sum("amount"))["s"] or Decimal("0")
@@ -891,79 +899,206 @@ def api_dashboard(request):
     })
 
 
-def _count_subtree(node_id):
-    """Return number of nodes in the subtree rooted at node_id (inclusive)."""
-    count = 1
-    for c in TreeNode.objects.filter(parent_id=node_id).values_list("id", flat=True):
-        count += _count_subtree(c)
-    return count
+# Paged tree mode: default and maximum nodes per page.
+TREE_PAGE_LIMIT = 500
+TREE_PAGE_MAX_LIMIT = 2000
+
+
+def _tree_node_payload(n, parent, pc, side, user):
+    invited_by = (parent.user.email or f"User {parent.user_id}") if parent else None
+    return {
+        "id": n.id,
+        "user_id": n.user_id,
+        "label": n.user.email or f"User {n.user_id}",
+        "lane": n.lane,
+        "side": side,
+        "depth": n.depth,
+        "is_current_user": n.user_id == user.id,
+        "created_at": n.created_at.isoformat(),
+        "invited_by": invited_by,
+        "invited_by_user_id": parent.user_id if parent else None,
+        "left_count": pc.left_count if pc else 0,
+        "right_count": pc.right_count if pc else 0,
+        "left_users_below": n.left_size,
+        "right_users_below": n.right_size,
+    }
+
+
+def _parse_tree_cursor(value):
+    """Cursor is "<node id>:<path>" of the last node on the previous page."""
+    if not value:
+        return None
+    node_id, _, path = value.partition(":")
+    if not path:
+        raise ValueError("cursor has no path")
+    return path, int(node_id)
+
+
+def _tree_etag(request):
+    """
+    ETag for api_tree_data: the viewer's subtree stamp plus the representation asked for
+    (query string, and gzip acceptance for encoding=gzip). None if the user has no node.
+    """
+    try:
+        root = request.user.tree_node
+    except TreeNode.DoesNotExist:
+        return None
+    count, changed = subtree_stamp(root)
+    gzip_ok = "gzip" in request.headers.get("Accept-Encoding", "")
+    variant = f"{sorted(request.GET.lists())}:{gzip_ok}"
+    digest = hashlib.sha1(variant.encode("utf-8")).hexdigest()[:12]
+    return f"tree-{root.id}-{count}-{changed.timestamp() if changed else 0}-{digest}"
 
 
 @require_GET
 @login_required
+@condition(etag_func=_tree_etag)
 def api_tree_data(request):
+    """
+    Viewer's subtree as nodes + edges. Without query params the whole subtree is returned;
+    layout=1 adds server-side tidy-tree coordinates (x, y) to each node.
+    format=columnar returns the whole subtree as parallel arrays (see _tree_columnar).
+    Any of max_depth, root_node, cursor or limit switches to paged mode (see _tree_page).
+    Responses carry an ETag; If-None-Match with an unchanged subtree returns 304.
+    """
     user = request.user
     try:
         root = user.tree_node
     except TreeNode.DoesNotExist:
         return JsonResponse({"nodes": [], "edges": []})
-    nodes_list = [root]
-    stack = [root]
-    while stack:
-        n = stack.pop()
-        for c in TreeNode.objects.filter(parent=n).select_related("user").order_by("lane", "id"):
-            nodes_list.append(c)
-            stack.append(c)
-    user_ids = [n.user_id for n in nodes_list]
-    counters = {
-        pc.user_id: {"left_count": pc.left_count, "right_count": pc.right_count}
-        for pc in PairingCounter.objects.filter(user_id__in=user_ids)
-    }
-    parent_by_id = {n.id: n for n in nodes_list}
-    children_by_parent = {}
-    for n in nodes_list:
-        if n.parent_id is not None:
-            children_by_parent.setdefault(n.parent_id, {})[n.lane] = n
-
-    def side_of(node):
-        if node.id == root.id:
-            return node.lane
-        parent = parent_by_id.get(node.parent_id)
-        if parent is None or parent.id == root.id:
-            return node.lane
-        return side_of(parent)
-
-    def left_users_below(node):
-        c = children_by_parent.get(node.id, {}).get("L")
-        return _count_subtree(c.id) if c else 0
-
-    def right_users_below(node):
-        c = children_by_parent.get(node.id, {}).get("R")
-        return _count_subtree(c.id) if c else 0
+    if request.GET.get("format") == "columnar":
+        return _tree_columnar(request, root)
+    if any(k in request.GET for k in ("max_depth", "root_node", "cursor", "limit")):
+        return _tree_page(request, root)
+    subtree = load_subtree(root)
+    nodes = [
+        _tree_node_payload(n, subtree.parent_of(n), subtree.counters.get(n.user_id), subtree.side_of(n), user)
+        for n in subtree.nodes
+    ]
+    if request.GET.get("layout", "").lower() in ("1", "true", "yes"):
+        pos = cached_layout(subtree)
+        for payload in nodes:
+            x, y = pos[payload["id"]]
+            payload["x"] = round(x, 3)
+            payload["y"] = y
+    edges = [{"from": n.parent_id, "to": n.id} for n in subtree.nodes if n.id != root.id]
+    return JsonResponse({"nodes": nodes, "edges": edges})
+
 
+def _tree_columnar(request, root):
+    """
+    Whole subtree as parallel arrays (tree.export). encoding=packed returns the binary
+    packed-array variant; encoding=gzip gzips the JSON when the client accepts it.
+    """
+    cols = subtree_columns(root)
+    encoding = request.GET.get("encoding", "")
+    if encoding == "packed":
+        return HttpResponse(pack_columns(cols), content_type="application/octet-stream")
+    payload = {"format": "columnar", "count": len(cols["ids"]), **cols}
+    if encoding == "gzip" and "gzip" in request.headers.get("Accept-Encoding", ""):
+        body = gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), compresslevel=5)
+        response = HttpResponse(body, content_type="application/json")
+        response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+    return JsonResponse(payload)
+
+
+def _tree_page(request, viewer_root):
+    """
+    One page of root_node's subtree (default: the viewer's node), at most max_depth levels
+    below it, depth-first in (path, id) order. root_node must lie in the viewer's subtree.
+    Nodes on the max_depth boundary that have children are collapsed stubs; their descendant
+    counts let the client decide what to expand next (request again with root_node=<stub id>).
+    """
+    user = request.user
+    try:
+        max_depth = request.GET.get("max_depth")
+        max_depth = max(0, int(max_depth)) if max_depth not in (None, "") else None
+        root_id = request.GET.get("root_node")
+        root_id = int(root_id) if root_id not in (None, "") else None
+        limit = min(TREE_PAGE_MAX_LIMIT, max(1, int(request.GET.get("limit") or TREE_PAGE_LIMIT)))
+        after = _parse_tree_cursor(request.GET.get("cursor"))
+    except ValueError:
+        return JsonResponse({"error": "Invalid tree query parameters."}, status=400)
+
+    root = viewer_root
+    if root_id is not None and root_id != viewer_root.id:
+        root = TreeNode.objects.filter(pk=root_id, path__startswith=viewer_root.path).first()
+        if root is None:
+            return JsonResponse({"error": "Node not found."}, status=404)
+
+    page = subtree_page(root, max_depth=max_depth, after=after, limit=limit + 1)
+    has_more = len(page) > limit
+    page = page[:limit]
+    counters = add_shard_deltas(
+        {pc.user_id: pc for pc in PairingCounter.objects.filter(user_id__in=[n.user_id for n in page])}
+    )
+    boundary = root.depth + max_depth if max_depth is not None else None
     nodes = []
-    for n in nodes_list:
-        parent = parent_by_id.get(n.parent_id) if n.parent_id else None
-        invited_by = (parent.user.email or f"User {parent.user_id}") if parent else None
-        pc = counters.get(n.user_id) or {"left_count": 0, "right_count": 0}
-        nodes.append({
-            "id": n.id,
-            "user_id": n.user_id,
-            "label": n.user.email or f"User {n.user_id}",
-            "lane": n.lane,
-            "side": side_of(n),
-            "depth": n.depth,
-            "is_current_user": n.user_id == user.id,
-            "created_at": n.created_at.isoformat(),
-            "invited_by": invited_by,
-            "invited_by_user_id": parent.user_id if parent else None,
-            "left_count": pc["left_count"],
-            "right_count": pc["right_count"],
-            "left_users_below": left_users_below(n),
-            "right_users_below": right_users_below(n),
-        })
-    edges = [{"from": n.parent_id, "to": n.id} for n in nodes_list if n.parent_id is not None]
-    return JsonResponse({"nodes": nodes, "edges": edges})
+    for n in page:
+        is_viewer = n.id == viewer_root.id
+        payload = _tree_node_payload(
+            n,
+            None if is_viewer else n.parent,
+            counters.get(n.user_id),
+            n.lane if is_viewer else n.path[len(viewer_root.path)],
+            user,
+        )
+        payload["descendants"] = n.left_size + n.right_size
+        payload["collapsed"] = n.depth == boundary and payload["descendants"] > 0
+        nodes.append(payload)
+    edges = [{"from": n.parent_id, "to": n.id} for n in page if n.id != root.id]
+    return JsonResponse({
+        "nodes": nodes,
+        "edges": edges,
+        "root_node": root.id,
+        "next_cursor": f"{page[-1].id}:{page[-1].path}" if has_more else None,
+    })
+
+
+def _tree_stats_depth(request):
+    """max_depth query param for api_tree_stats, clamped to 1..CLOSURE_MAX_DISTANCE."""
+    try:
+        value = int(request.GET.get("max_depth") or CLOSURE_MAX_DISTANCE)
+    except ValueError:
+        return None
+    return min(CLOSURE_MAX_DISTANCE, max(1, value))
+
+
+def _tree_stats_etag(request):
+    """Stats depend on structure only, and placement only adds nodes: the size is the version."""
+    try:
+        root = request.user.tree_node
+    except TreeNode.DoesNotExist:
+        return None
+    return f"tree-stats-{root.id}-{root.left_size + root.right_size}-{_tree_stats_depth(request)}"
+
+
+@require_GET
+@login_required
+@condition(etag_func=_tree_stats_etag)
+def api_tree_stats(request):
+    """
+    Downline histogram of the viewer's subtree: people per level (1..max_depth, at most
+    CLOSURE_MAX_DISTANCE) on each leg, from one aggregate query on tree_closure. Leg totals
+    come from the root's left_size/right_size; "deeper" is everyone below max_depth.
+    """
+    max_depth = _tree_stats_depth(request)
+    if max_depth is None:
+        return JsonResponse({"error": "Invalid max_depth."}, status=400)
+    try:
+        root = request.user.tree_node
+    except TreeNode.DoesNotExist:
+        return JsonResponse({"levels": [], "totals": {"L": 0, "R": 0}, "deeper": {"L": 0, "R": 0}})
+    counts = downline_counts(root.id, max_depth)
+    levels = [
+        {"depth": d, "L": counts.get((d, "L"), 0), "R": counts.get((d, "R"), 0)}
+        for d in range(1, max_depth + 1)
+    ]
+    totals = {"L": root.left_size, "R": root.right_size}
+    deeper = {lane: totals[lane] - sum(level[lane] for level in levels) for lane in ("L", "R")}
+    return JsonResponse({"max_depth": max_depth, "levels": levels, "totals": totals, "deeper": deeper})
 
 
 @require_GET
@@ -176,3 +176,23 @@ CELERY_TASK_SERIALIZER = "json"
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TASK_ALWAYS_EAGER = os.environ.get("CELERY_ALWAYS_EAGER", "false").lower() == "true"
+
+# Server-side dashboard tree layout (?layout=1), cached per (root node, subtree version).
+TREE_LAYOUT_CACHE_SECONDS = int(os.environ.get("TREE_LAYOUT_CACHE_SECONDS", "3600"))
+
+# Per-worker in-memory tree snapshot (tree/snapshot.py); 0 disables it.
+TREE_SNAPSHOT_MAX_BYTES = int(os.environ.get("TREE_SNAPSHOT_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Purchase ingest: "immediate" runs process_purchase per paid order; "batch" queues paid
+# orders and drains them in batches with merged counter increments (tasks.engine).
+PURCHASE_INGEST_MODE = os.environ.get("PURCHASE_INGEST_MODE", "immediate")
+PURCHASE_BATCH_SIZE = int(os.environ.get("PURCHASE_BATCH_SIZE", "200"))
+PURCHASE_BATCH_WINDOW_SECONDS = int(os.environ.get("PURCHASE_BATCH_WINDOW_SECONDS", "2"))
+
+# Striped pairing counters (tree/counters.py): 0 = plain counters; N > 0 spreads lane
+# increments over N shard rows per user, folded back by fold_pairing_counter_shards.
+PAIRING_COUNTER_SHARDS = int(os.environ.get("PAIRING_COUNTER_SHARDS", "0"))
+
+# Seconds a worker uses its cached compensation plan before checking the active version
+# again (bonuses.plan.current_plan); the plan row is reloaded only when the version changed.
+COMPENSATION_PLAN_CHECK_SECONDS = int(os.environ.get("COMPENSATION_PLAN_CHECK_SECONDS", "60"))
@@ -1,4 +1,5 @@
 """API tests for core.api_views. See TESTING.md for full plan."""
+import gzip
 import json
 from unittest.mock import patch
 
@@ -218,6 +219,167 @@ class ApiTreeDataTest(TestCase):
         self.assertIn("right_users_below", data["nodes"][0])
         self.assertEqual(data["edges"], [])
 
+    def test_tree_counts_users_below_each_lane(self):
+        self.client.force_login(self.user)
+        root = TreeNode.objects.create(user=self.user, parent=None, lane="L", depth=0)
+        left = TreeNode.objects.create(user=create_user("l@test.example"), parent=root, lane="L", depth=1)
+        TreeNode.objects.create(user=create_user("ll@test.example"), parent=left, lane="L", depth=2)
+        right = TreeNode.objects.create(user=create_user("r@test.example"), parent=root, lane="R", depth=1)
+        TreeNode.objects.create(user=create_user("rr@test.example"), parent=right, lane="R", depth=2)
+        TreeNode.objects.create(user=create_user("rl@test.example"), parent=right, lane="L", depth=2)
+        resp = self.client.get("/api/dashboard/tree/")
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        by_id = {n["id"]: n for n in data["nodes"]}
+        self.assertEqual(len(by_id), 6)
+        self.assertEqual(by_id[root.id]["left_users_below"], 2)
+        self.assertEqual(by_id[root.id]["right_users_below"], 3)
+        self.assertEqual(by_id[right.id]["left_users_below"], 1)
+        self.assertEqual(len(data["edges"]), 5)
+
+    def test_tree_layout_adds_coordinates(self):
+        self.client.force_login(self.user)
+        root = TreeNode.objects.create(user=self.user, parent=None, lane="L", depth=0)
+        left = TreeNode.objects.create(user=create_user("l@test.example"), parent=root, lane="L", depth=1)
+        data = self.client.get("/api/dashboard/tree/?layout=1").json()
+        by_id = {n["id"]: n for n in data["nodes"]}
+        self.assertEqual((by_id[root.id]["x"], by_id[root.id]["y"]), (0.0, 0))
+        self.assertLess(by_id[left.id]["x"], 0)
+        self.assertEqual(by_id[left.id]["y"], 1)
+        self.assertNotIn("x", self.client.get("/api/dashboard/tree/").json()["nodes"][0])
+
+    def test_tree_columnar_formats(self):
+        self.client.force_login(self.user)
+        root = TreeNode.objects.create(user=self.user, parent=None, lane="L", depth=0)
+        TreeNode.objects.create(user=create_user("r@test.example"), parent=root, lane="R", depth=1)
+        data = self.client.get("/api/dashboard/tree/?format=columnar").json()
+        self.assertEqual(data["count"], 2)
+        self.assertEqual(data["parent_index"], [-1, 0])
+        self.assertEqual(data["lane"], [0, 1])
+        packed = self.client.get("/api/dashboard/tree/?format=columnar&encoding=packed")
+        self.assertEqual(packed["Content-Type"], "application/octet-stream")
+        self.assertEqual(packed.content[:4], b"BTC1")
+        gz = self.client.get("/api/dashboard/tree/?format=columnar&encoding=gzip", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(gz["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(gz.content))["ids"], data["ids"])
+
+    def test_tree_etag_returns_304_until_subtree_changes(self):
+        self.client.force_login(self.user)
+        root = TreeNode.objects.create(user=self.user, parent=None, lane="L", depth=0)
+        counter = PairingCounter.objects.create(user=self.user)
+        etag = self.client.get("/api/dashboard/tree/")["ETag"]
+        resp = self.client.get("/api/dashboard/tree/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertNotEqual(self.client.get("/api/dashboard/tree/?layout=1")["ETag"], etag)
+
+        counter.left_count = 1
+        counter.save()
+        resp = self.client.get("/api/dashboard/tree/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        etag = resp["ETag"]
+        TreeNode.objects.create(user=create_user("new@test.example"), parent=root, lane="R", depth=1)
+        resp = self.client.get("/api/dashboard/tree/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()["nodes"]), 2)
+
+        etag = resp["ETag"]
+        child = User.objects.get(email="new@test.example")
+        child.email = "renamed@test.example"
+        child.save()
+        resp = self.client.get("/api/dashboard/tree/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("renamed@test.example", {n["label"] for n in resp.json()["nodes"]})
+
+    def test_tree_of_inner_node_has_no_edge_to_ancestor(self):
+        top = TreeNode.objects.create(user=create_user("top@test.example"), parent=None, lane="L", depth=0)
+        mine = TreeNode.objects.create(user=self.user, parent=top, lane="R", depth=1)
+        TreeNode.objects.create(user=create_user("c@test.example"), parent=mine, lane="L", depth=2)
+        self.client.force_login(self.user)
+        data = self.client.get("/api/dashboard/tree/").json()
+        self.assertEqual({n["id"] for n in data["nodes"]} - {top.id}, {n["id"] for n in data["nodes"]})
+        self.assertEqual(data["edges"], [{"from": mine.id, "to": data["nodes"][1]["id"]}])
+
+
+class ApiTreePagedTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user("paged@test.example")
+        self.top = TreeNode.objects.create(user=create_user("top@test.example"), parent=None, lane="L", depth=0)
+        self.root = TreeNode.objects.create(user=self.user, parent=self.top, lane="R", depth=1)
+        self.l = TreeNode.objects.create(user=create_user("l@test.example"), parent=self.root, lane="L", depth=2)
+        self.r = TreeNode.objects.create(user=create_user("r@test.example"), parent=self.root, lane="R", depth=2)
+        self.ll = TreeNode.objects.create(user=create_user("ll@test.example"), parent=self.l, lane="L", depth=3)
+        self.lll = TreeNode.objects.create(user=create_user("lll@test.example"), parent=self.ll, lane="L", depth=4)
+        self.client.force_login(self.user)
+
+    def test_max_depth_returns_collapsed_stubs(self):
+        data = self.client.get("/api/dashboard/tree/?max_depth=1").json()
+        by_id = {n["id"]: n for n in data["nodes"]}
+        self.assertEqual(set(by_id), {self.root.id, self.l.id, self.r.id})
+        self.assertTrue(by_id[self.l.id]["collapsed"])
+        self.assertEqual(by_id[self.l.id]["descendants"], 2)
+        self.assertFalse(by_id[self.r.id]["collapsed"])
+        self.assertFalse(by_id[self.root.id]["collapsed"])
+        self.assertIsNone(by_id[self.root.id]["invited_by"])
+        self.assertIsNone(data["next_cursor"])
+
+    def test_expand_stub_with_root_node(self):
+        data = self.client.get(f"/api/dashboard/tree/?root_node={self.l.id}&max_depth=1").json()
+        by_id = {n["id"]: n for n in data["nodes"]}
+        self.assertEqual(set(by_id), {self.l.id, self.ll.id})
+        self.assertEqual(by_id[self.ll.id]["side"], "L")
+        self.assertTrue(by_id[self.ll.id]["collapsed"])
+        self.assertEqual(data["edges"], [{"from": self.l.id, "to": self.ll.id}])
+
+    def test_root_node_outside_subtree_returns_404(self):
+        resp = self.client.get(f"/api/dashboard/tree/?root_node={self.top.id}")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_cursor_pages_through_subtree(self):
+        seen = []
+        url = "/api/dashboard/tree/?limit=2"
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data["nodes"]), 2)
+            seen += [n["id"] for n in data["nodes"]]
+            url = f"/api/dashboard/tree/?limit=2&cursor={data['next_cursor']}" if data["next_cursor"] else None
+        self.assertEqual(seen, [self.root.id, self.l.id, self.ll.id, self.lll.id, self.r.id])
+
+    def test_invalid_params_return_400(self):
+        resp = self.client.get("/api/dashboard/tree/?max_depth=abc")
+        self.assertEqual(resp.status_code, 400)
+
+
+class ApiTreeStatsTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = create_user("stats@test.example")
+        self.client.force_login(self.user)
+
+    def test_stats_empty_without_tree_node(self):
+        data = self.client.get("/api/dashboard/tree/stats/").json()
+        self.assertEqual(data["levels"], [])
+
+    def test_stats_histogram_by_depth_and_lane(self):
+        root = TreeNode.objects.create(user=self.user, parent=None, lane="L", depth=0)
+        l = TreeNode.objects.create(user=create_user("l@test.example"), parent=root, lane="L", depth=1)
+        r = TreeNode.objects.create(user=create_user("r@test.example"), parent=root, lane="R", depth=1)
+        ll = TreeNode.objects.create(user=create_user("ll@test.example"), parent=l, lane="L", depth=2)
+        TreeNode.objects.create(user=create_user("lr@test.example"), parent=l, lane="R", depth=2)
+        TreeNode.objects.create(user=create_user("lll@test.example"), parent=ll, lane="L", depth=3)
+        TreeNode.objects.create(user=create_user("rr@test.example"), parent=r, lane="R", depth=2)
+        data = self.client.get("/api/dashboard/tree/stats/?max_depth=2").json()
+        self.assertEqual(data["levels"], [{"depth": 1, "L": 1, "R": 1}, {"depth": 2, "L": 2, "R": 1}])
+        self.assertEqual(data["totals"], {"L": 4, "R": 2})
+        self.assertEqual(data["deeper"], {"L": 1, "R": 0})
+        full = self.client.get("/api/dashboard/tree/stats/").json()
+        self.assertEqual(len(full["levels"]), 15)
+        self.assertEqual(full["levels"][2], {"depth": 3, "L": 1, "R": 0})
+        self.assertEqual(full["deeper"], {"L": 0, "R": 0})
+        resp = self.client.get("/api/dashboard/tree/stats/", HTTP_IF_NONE_MATCH=self.client.get(
+            "/api/dashboard/tree/stats/")["ETag"])
+        self.assertEqual(resp.status_code, 304)
+
 
 class ApiBonusEventsTest(TestCase):
     def setUp(self):
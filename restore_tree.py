@@ -1,6 +1,7 @@
 """One-off: restore symmetric left+right tree under root (no old seed). Run from project root: uv run python manage.py shell -c \"exec(open('restore_tree.py').read())\" """
 from users.models import User
-from tree.models import TreeNode, PairingCounter
+from tree.models import TreeNode
+from tree.placement import place_user
 
 
 def ensure(user_email, password, inviter, parent_node, lane):
@@ -10,14 +11,10 @@ def ensure(user_email, password, inviter, parent_node, lane):
     user.set_password(password)
     user.referred_by = inviter
     user.save()
-    depth = parent_node.depth + 1
-    tn, _ = TreeNode.objects.get_or_create(
-        user=user, defaults={"parent": parent_node, "lane": lane, "depth": depth}
-    )
-    PairingCounter.objects.get_or_create(
-        user=user, defaults={"left_count": 0, "right_count": 0, "released_pairs": 0}
-    )
-    return tn
+    try:
+        return user.tree_node
+    except TreeNode.DoesNotExist:
+        return place_user(user, parent_node, lane=lane)
 
 
 root = User.objects.get(email="mohamed.hany.ali.hassan@gmail.com")
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import BackgroundTask
+from .models import BackgroundTask, PendingPurchase, ProcessedOrder
 
 
 @admin.register(BackgroundTask)
@@ -9,3 +9,17 @@ class BackgroundTaskAdmin(admin.ModelAdmin):
     search_fields = ("task_name", "related_object_id")
     readonly_fields = ("created_at",)
     ordering = ("-created_at",)
+
+
+@admin.register(PendingPurchase)
+class PendingPurchaseAdmin(admin.ModelAdmin):
+    list_display = ("id", "order", "created_at")
+    readonly_fields = ("order", "created_at")
+    ordering = ("id",)
+
+
+@admin.register(ProcessedOrder)
+class ProcessedOrderAdmin(admin.ModelAdmin):
+    list_display = ("id", "order", "processed_at")
+    readonly_fields = ("order", "processed_at")
+    ordering = ("-processed_at",)
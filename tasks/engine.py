@@ -0,0 +1,452 @@
+"""
+Purchase bonus engine: turns one paid order into ledger rows and lane increments.
+
+Rules (see the compensation rules in .cursor/rules/backend), parameterized by the active
+CompensationPlan (bonuses.plan.current_plan, cached per worker; version 1 shown):
+- profit = sum((price_at_purchase - product.base_price) * quantity), never negative.
+- 20% app fee, 40% DIRECT to the buyer's referrer, 40% hierarchy pool.
+- Hierarchy share at depth i is pool * 30 / i / 100, for i = 1..cutoff (15) or until
+  the pool runs out; amounts are split in integer cents by bonuses.plan.DecayTable, the
+  sub-cent remainder going to the largest fractional shares.
+- Every ancestor up to the cutoff gets +1 on the lane that holds the buyer.
+- Every event records the plan version it was computed with.
+
+plan_purchase() is pure: it works on the upline (one tree_closure query, or none with the
+worker's tree snapshot) and builds unsaved BonusEvent rows. apply_plans() writes plans with
+a fixed number of statements whatever the upline length: ensure counters, lock them (the
+locking read also gives the counts the events' lane units are numbered from), one UPDATE
+per distinct lane delta, one bulk insert of events. Which counters now have a pair to
+release is read once the transaction has committed (tree.counters.ready_user_ids), so
+that read never joins the write transaction's conflicts.
+
+With PURCHASE_INGEST_MODE = "batch", paid orders are queued (tasks.PendingPurchase) and
+drain_pending_purchases() processes them in batches: increments from orders that share
+ancestors are merged, so each counter near the root is updated once per batch instead of
+once per order, while every order still gets its own ledger rows.
+replay_orders() pays out historical paid orders the same way, in id order, for the
+replay_paid_orders backfill. Releasing a pair moves the user's PENDING events to RELEASED
+(release_events); sweep_pair_releases() does that for all users in chunked set-based
+statements.
+"""
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from decimal import ROUND_DOWN, Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from bonuses.models import BonusEvent
+from bonuses.plan import current_plan, from_cents, to_cents
+from orders.models import Order, OrderItem
+from tasks.models import PendingPurchase, ProcessedOrder
+from tree.counters import fold_counter_shards, increment_counters, ready_user_ids, shard_count
+from tree.models import PairingCounter, TreeNode
+from tree.repository import uplines
+from tree.snapshot import get_snapshot, walk_upline
+
+CENT = Decimal("0.01")
+
+
+@dataclass
+class PurchasePlan:
+    """What one order pays out: unsaved events and the ancestor users to bump per lane."""
+    order_id: int
+    profit: Decimal
+    events: list[BonusEvent] = field(default_factory=list)
+    lanes: dict[str, list[int]] = field(default_factory=lambda: {"L": [], "R": []})
+
+    @property
+    def counter_user_ids(self):
+        return self.lanes["L"] + self.lanes["R"]
+
+
+_ITEM_PROFIT = ExpressionWrapper(
+    (F("price_at_purchase") - F("product__base_price")) * F("quantity"),
+    output_field=DecimalField(max_digits=14, decimal_places=2),
+)
+
+
+def _clamp_profit(profit):
+    return max(Decimal("0"), Decimal(profit or 0)).quantize(CENT)
+
+
+def order_profit(order_id):
+    """Markup profit of an order, one aggregate query; zero if the order sold at or below base."""
+    return _clamp_profit(OrderItem.objects.filter(order_id=order_id).aggregate(p=Sum(_ITEM_PROFIT))["p"])
+
+
+def order_profits(order_ids):
+    """order_profit for many orders: {order_id: profit}, one grouped query."""
+    rows = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values_list("order_id")
+        .annotate(p=Sum(_ITEM_PROFIT))
+        .order_by()
+    )
+    profits = {order_id: _clamp_profit(None) for order_id in order_ids}
+    profits.update({order_id: _clamp_profit(p) for order_id, p in rows})
+    return profits
+
+
+def plan_purchase(order_id, profit, referrer_id, upline, config=None):
+    """
+    Build the plan for one order under config (bonuses.plan.PlanConfig, default the active
+    plan). upline is tree.repository.upline() output for the buyer's node:
+    (ancestor_node_id, ancestor_user_id, distance, lane), nearest first. Every ancestor
+    within the cutoff gets a HIERARCHY event for its lane unit, even when its share is 0;
+    the DIRECT event takes the referrer's lane when the referrer is one of them. Units are
+    numbered by apply_plans.
+    """
+    config = config or current_plan()
+    plan = PurchasePlan(order_id=order_id, profit=profit)
+    profit_cents = to_cents(profit)
+    ancestors = [a for a in upline if a[2] <= config.cutoff]
+    direct = to_cents(profit * config.direct_ratio)
+    if referrer_id is not None and direct > 0:
+        plan.events.append(BonusEvent(
+            user_id=referrer_id,
+            order_id=order_id,
+            bonus_type=BonusEvent.BonusType.DIRECT,
+            amount=from_cents(direct),
+            lane=next((a[3] for a in ancestors if a[1] == referrer_id), None),
+            plan_version=config.version,
+        ))
+    ratio_num, ratio_den = config.hierarchy_ratio.as_integer_ratio()
+    shares = config.table.split(profit_cents * ratio_num, len(ancestors), pool_cents_den=ratio_den)
+    for (_, user_id, distance, lane), share in zip(ancestors, shares):
+        plan.lanes[lane].append(user_id)
+        plan.events.append(BonusEvent(
+            user_id=user_id,
+            order_id=order_id,
+            bonus_type=BonusEvent.BonusType.HIERARCHY,
+            amount=from_cents(share),
+            lane=lane,
+            depth=distance,
+            plan_version=config.version,
+        ))
+    return plan
+
+
+@contextmanager
+def serializable():
+    """
+    transaction.atomic() at SERIALIZABLE isolation on Postgres (SQLite transactions already
+    serialize writers). Inside an outer atomic block the outer transaction's level applies.
+    """
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL SERIALIZABLE")
+        yield
+
+
+def apply_plans(plans):
+    """
+    Write plans (call inside serializable()). Lane increments are merged per counter, so
+    each counter row gets exactly one UPDATE however many plans touch it; counters with the
+    same (left, right) delta share the statement (tree.counters.increment_counters, which
+    also handles striped counters). Plain counters number the events' lane units here, from
+    the counts read while locking; striped ones leave them to fold_shards. Returns the user
+    ids whose counters were incremented; check them with tree.counters.ready_user_ids once
+    the transaction has committed.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for plan in plans:
+        for user_id in plan.lanes["L"]:
+            deltas[user_id][0] += 1
+        for user_id in plan.lanes["R"]:
+            deltas[user_id][1] += 1
+    counts = increment_counters(deltas)
+    if counts is not None:
+        _number_units(plans, counts)
+    BonusEvent.objects.bulk_create([e for plan in plans for e in plan.events], batch_size=5000)
+    return sorted(deltas)
+
+
+def _number_units(plans, counts):
+    """Set event.unit from {user_id: (left, right)} counts before the plans, in plan order."""
+    counts = {user_id: list(lr) for user_id, lr in counts.items()}
+    for plan in plans:
+        units = {}
+        for side, lane in enumerate("LR"):
+            for user_id in plan.lanes[lane]:
+                counts[user_id][side] += 1
+                units[user_id] = counts[user_id][side]
+        for event in plan.events:
+            if event.lane is not None:
+                event.unit = units[event.user_id]
+
+
+def apply_purchase(plan):
+    """apply_plans for a single plan."""
+    return apply_plans([plan])
+
+
+def buyer_uplines(buyer_ids, cutoff, snapshot=None):
+    """
+    {buyer_id: upline to cutoff} ([] for buyers who are not placed). No queries with the
+    worker's tree snapshot; otherwise two (buyer nodes, tree_closure) for the whole batch.
+    """
+    snapshot = snapshot if snapshot is not None else get_snapshot()
+    if snapshot is not None:
+        result = {}
+        for buyer_id in buyer_ids:
+            node_id = snapshot.node_for_user(buyer_id)
+            result[buyer_id] = [] if node_id is None else snapshot.upline(node_id, cutoff)
+        return result
+    nodes = dict(TreeNode.objects.filter(user_id__in=buyer_ids).values_list("id", "user_id"))
+    by_node = uplines(list(nodes), cutoff)
+    result = {buyer_id: [] for buyer_id in buyer_ids}
+    result.update({nodes[node_id]: rows for node_id, rows in by_node.items()})
+    return result
+
+
+def buyer_upline(buyer_id, cutoff, snapshot=None):
+    """Upline of the buyer's node to cutoff ([] if the buyer is not placed)."""
+    snapshot = snapshot if snapshot is not None else get_snapshot()
+    if snapshot is not None:
+        node_id = snapshot.node_for_user(buyer_id)
+    else:
+        node_id = TreeNode.objects.filter(user_id=buyer_id).values_list("id", flat=True).first()
+    if node_id is None:
+        return []
+    return walk_upline(node_id, cutoff, snapshot=snapshot)
+
+
+def process_order(order_id):
+    """
+    Pay out one paid order in a single SERIALIZABLE transaction. Returns a result dict;
+    "ready" lists users with a pair to release, read after the commit. Idempotent:
+    the ProcessedOrder row is written in the same transaction, so an order that was
+    already paid out (or is being paid out concurrently) returns status "duplicate".
+    """
+    duplicate = {"order_id": order_id, "status": "duplicate"}
+    if ProcessedOrder.objects.filter(order_id=order_id).exists():
+        return duplicate
+    order = Order.objects.select_related("buyer").filter(pk=order_id).first()
+    if order is None:
+        return {"order_id": order_id, "status": "skipped", "reason": "order_not_found"}
+    if order.status != Order.Status.PAID:
+        return {"order_id": order_id, "status": "skipped", "reason": "order_not_paid"}
+    config = current_plan()
+    try:
+        with serializable():
+            ProcessedOrder.objects.create(order_id=order_id)
+            profit = order_profit(order_id)
+            upline = buyer_upline(order.buyer_id, config.cutoff)
+            plan = plan_purchase(order_id, profit, order.buyer.referred_by_id, upline, config)
+            incremented = apply_purchase(plan)
+    except IntegrityError:
+        if ProcessedOrder.objects.filter(order_id=order_id).exists():
+            return duplicate
+        raise
+    ready = ready_user_ids(incremented) if incremented else []
+    return {
+        "order_id": order_id,
+        "status": "processed",
+        "profit": str(profit),
+        "app_fee": str((profit * config.app_fee_ratio).quantize(CENT, rounding=ROUND_DOWN)),
+        "plan_version": config.version,
+        "events": len(plan.events),
+        "ancestors": len(plan.counter_user_ids),
+        "ready": ready,
+    }
+
+
+def _process_orders(order_ids):
+    """
+    Plan and apply a batch of orders (inside serializable()); unpaid and already processed
+    orders are skipped. ProcessedOrder rows for the batch are inserted with it; a concurrent
+    duplicate fails the unique order and rolls the whole batch back. "incremented" lists
+    the counters written, for ready_user_ids after the commit.
+    """
+    orders = list(
+        Order.objects.filter(pk__in=order_ids, status=Order.Status.PAID, processed__isnull=True)
+        .order_by("id")
+        .values_list("id", "buyer_id", "buyer__referred_by_id")
+    )
+    ProcessedOrder.objects.bulk_create([ProcessedOrder(order_id=o[0]) for o in orders])
+    config = current_plan()
+    profits = order_profits([o[0] for o in orders])
+    upline_of = buyer_uplines({o[1] for o in orders}, config.cutoff)
+    plans = [
+        plan_purchase(order_id, profits[order_id], referrer_id, upline_of[buyer_id], config)
+        for order_id, buyer_id, referrer_id in orders
+    ]
+    incremented = apply_plans(plans)
+    return {
+        "orders": len(plans),
+        "skipped": len(order_ids) - len(plans),
+        "events": sum(len(p.events) for p in plans),
+        "counters": len(incremented),
+        "incremented": incremented,
+    }
+
+
+def drain_pending_purchases(batch_size=200):
+    """
+    Process up to batch_size queued purchases (tasks.PendingPurchase, oldest first) as one
+    batch in one SERIALIZABLE transaction, deleting their queue rows in it. Queue rows are
+    claimed with SKIP LOCKED, so concurrent drains take disjoint batches. Returns None when
+    the queue is empty, else a result dict with "ready" as in process_order.
+    """
+    with serializable():
+        order_ids = list(
+            PendingPurchase.objects.select_for_update(skip_locked=True)
+            .order_by("id")
+            .values_list("order_id", flat=True)[:batch_size]
+        )
+        if not order_ids:
+            return None
+        result = _process_orders(order_ids)
+        PendingPurchase.objects.filter(order_id__in=order_ids).delete()
+    incremented = result.pop("incremented")
+    result["ready"] = ready_user_ids(incremented) if incremented else []
+    return result
+
+
+def replay_orders(orders, batch_size=200, max_retries=10):
+    """
+    Pay out the paid, not yet processed orders in the orders queryset, in id (creation)
+    order, batch_size per SERIALIZABLE transaction (_process_orders). A batch that fails
+    on a serialization conflict, a lock or a concurrent duplicate is retried with jittered
+    backoff (parallel replays contend on the counters above their partitions); its
+    ProcessedOrder rows commit with it, so an interrupted replay resumes where it stopped.
+    Pair releases are left to the caller. Returns {"orders", "batches", "events"}.
+    """
+    pending = orders.filter(status=Order.Status.PAID, processed__isnull=True).order_by("id")
+    totals = {"orders": 0, "batches": 0, "events": 0}
+    last_id = 0
+    while True:
+        order_ids = list(pending.filter(id__gt=last_id).values_list("id", flat=True)[:batch_size])
+        if not order_ids:
+            return totals
+        for attempt in range(max_retries + 1):
+            try:
+                with serializable():
+                    result = _process_orders(order_ids)
+                break
+            except (OperationalError, IntegrityError):
+                if attempt == max_retries:
+                    raise
+                time.sleep(min(2.0, 0.05 * 2 ** attempt) * (1 + random.random()))
+        totals["orders"] += result["orders"]
+        totals["batches"] += 1
+        totals["events"] += result["events"]
+        last_id = order_ids[-1]
+
+
+# Number the unnumbered lane events of the given users (%s placeholders) after the counts
+# in pairing_counters (run before adding the folded deltas), in id order per lane; DIRECT
+# events then take the unit of their referrer's HIERARCHY event from the same order.
+_NUMBER_HIERARCHY_SQL = """
+    UPDATE bonus_events SET unit = numbered.unit FROM (
+        SELECT e.id, ROW_NUMBER() OVER (PARTITION BY e.user_id, e.lane ORDER BY e.id)
+               + CASE WHEN e.lane = 'L' THEN pc.left_count ELSE pc.right_count END AS unit
+        FROM bonus_events e JOIN pairing_counters pc ON pc.user_id = e.user_id
+        WHERE e.user_id IN (%s) AND e.unit IS NULL AND e.lane IS NOT NULL AND e.bonus_type = 'HIERARCHY'
+    ) numbered
+    WHERE bonus_events.id = numbered.id
+"""
+_NUMBER_DIRECT_SQL = """
+    UPDATE bonus_events SET unit = h.unit FROM bonus_events h
+    WHERE bonus_events.user_id IN (%s) AND bonus_events.unit IS NULL AND bonus_events.lane IS NOT NULL
+      AND bonus_events.bonus_type = 'DIRECT' AND h.bonus_type = 'HIERARCHY'
+      AND h.order_id = bonus_events.order_id AND h.user_id = bonus_events.user_id
+"""
+
+
+def _number_folded_units(user_ids):
+    """fold_counter_shards hook: number the lane units of the deltas about to be folded."""
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(_NUMBER_HIERARCHY_SQL % placeholders, list(user_ids))
+        cursor.execute(_NUMBER_DIRECT_SQL % placeholders, list(user_ids))
+
+
+def fold_shards(user_ids=None, chunk_size=5000):
+    """
+    tree.counters.fold_counter_shards that also numbers the folded units' bonus events;
+    fold striped counters through this whenever events were written against them.
+    """
+    return fold_counter_shards(user_ids=user_ids, chunk_size=chunk_size, on_fold=_number_folded_units)
+
+
+# Users per release_events UPDATE: keeps the OR'ed ranges under SQLite's expression depth limit (1000).
+_RELEASE_RANGES = 200
+
+
+def release_events(ranges):
+    """
+    Move PENDING bonus events to RELEASED for pairs just released: ranges holds
+    (user_id, released_pairs before, released_pairs now) per user (call in the transaction
+    that raised released_pairs, counters locked). Pair n releases unit n on L and on R: its
+    HIERARCHY events and the DIRECT events tied to those units. Units past the shorter lane
+    stay pending. A user's pending DIRECT events without a unit (the referrer was not in
+    the buyer's upline within the cutoff) go with the next pair released. Amounts are
+    never touched. One statement per _RELEASE_RANGES users plus one; returns the number of
+    events released.
+    """
+    ranges = [(user_id, before, now) for user_id, before, now in ranges if now > before]
+    if not ranges:
+        return 0
+    paired = 0
+    for start in range(0, len(ranges), _RELEASE_RANGES):
+        # One OR'ed unit range per user, each a range scan of idx_bonus_pending_unit.
+        paired += BonusEvent.objects.filter(status=BonusEvent.Status.PENDING).filter(reduce(or_, (
+            Q(user_id=user_id, unit__gt=before, unit__lte=now)
+            for user_id, before, now in ranges[start:start + _RELEASE_RANGES]
+        ))).update(status=BonusEvent.Status.RELEASED)
+    unpaired = BonusEvent.objects.filter(
+        user_id__in=[r[0] for r in ranges],
+        bonus_type=BonusEvent.BonusType.DIRECT,
+        status=BonusEvent.Status.PENDING,
+        lane__isnull=True,
+    ).update(status=BonusEvent.Status.RELEASED)
+    return paired + unpaired
+
+
+def sweep_pair_releases(chunk_size=5000, max_users=None):
+    """
+    Release every pending pair platform-wide, set-based. Counters with
+    min(left, right) > released_pairs are read through the idx_pairing_releasable partial
+    index in user_id order, chunk_size at a time (striped counters are folded first). Each
+    chunk runs in one transaction: lock the counters, one UPDATE sets released_pairs =
+    min(left, right), then release_events() moves the covered PENDING events to RELEASED.
+    Safe to rerun: a released counter leaves the index. Returns (users, pairs) released.
+    """
+    if shard_count() > 0:
+        fold_shards()
+    releasable = PairingCounter.objects.filter(
+        left_count__gt=F("released_pairs"), right_count__gt=F("released_pairs")
+    )
+    users = pairs = 0
+    last_user_id = 0
+    while max_users is None or users < max_users:
+        limit = chunk_size if max_users is None else min(chunk_size, max_users - users)
+        with transaction.atomic():
+            rows = list(
+                releasable.select_for_update()
+                .filter(user_id__gt=last_user_id)
+                .order_by("user_id")
+                .values_list("user_id", "left_count", "right_count", "released_pairs")[:limit]
+            )
+            if not rows:
+                break
+            user_ids = [r[0] for r in rows]
+            PairingCounter.objects.filter(user_id__in=user_ids).update(
+                released_pairs=Least("left_count", "right_count"), updated_at=timezone.now()
+            )
+            release_events([(user_id, released, min(left, right)) for user_id, left, right, released in rows])
+        users += len(rows)
+        pairs += sum(min(left, right) - released for _, left, right, released in rows)
+        last_user_id = rows[-1][0]
+    return users, pairs
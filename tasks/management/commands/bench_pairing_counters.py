@@ -0,0 +1,104 @@
+"""
+Concurrency benchmark for pairing-counter increments, plain vs striped (tree/counters.py).
+
+Every operation is what tasks.engine.process_order does to the counters: one SERIALIZABLE
+transaction that adds a lane increment to the same --hot counters (like a purchase under
+the top of the tree), then the readiness read (ready_user_ids) after it commits. It runs
+from --threads threads with their own database connections. Failed transactions
+(serialization failures, deadlocks, lock timeouts) are retried and counted. Uses dedicated
+bench-counter-* users and removes their counters and shards afterwards. The bonus_events
+and processed_orders inserts of a real purchase are left out; confirm a gain end to end
+(e.g. replay_paid_orders or the worker under load) before turning striping on.
+
+The numbers only mean something on Postgres: SQLite serializes every writer on one
+database lock whatever the row layout, and the striped readiness read sums every shard
+row, so striping is slower there.
+
+Usage:
+  python manage.py bench_pairing_counters --threads 16 --ops 200 --shards 0 8 32
+"""
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+
+from tasks.engine import serializable
+from tree.counters import fold_counter_shards, increment_counters, ready_user_ids
+from tree.models import PairingCounter, PairingCounterShard
+from users.models import User
+
+
+def _worker(user_ids, ops, shards, seed, stats, lock):
+    rng = random.Random(seed)
+    done = retries = 0
+    try:
+        while done < ops:
+            deltas = {u: (1, 0) if rng.random() < 0.5 else (0, 1) for u in user_ids}
+            try:
+                with serializable():
+                    increment_counters(deltas, shards=shards, rng=rng)
+            except OperationalError:
+                retries += 1
+                continue
+            ready_user_ids(user_ids, shards=shards)
+            done += 1
+    finally:
+        connections.close_all()
+    with lock:
+        stats["ops"] += done
+        stats["retries"] += retries
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent pairing-counter increments with and without striping."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent writers (default 8).")
+        parser.add_argument("--ops", type=int, default=100, help="Transactions per thread (default 100).")
+        parser.add_argument("--hot", type=int, default=15, help="Counters touched per transaction (default 15).")
+        parser.add_argument(
+            "--shards", type=int, nargs="+", default=[0, 8], help="Shard counts to compare; 0 = plain (default: 0 8)."
+        )
+
+    def handle(self, *args, **options):
+        users = [
+            User.objects.get_or_create(
+                username=f"bench-counter-{i}@synthetic.example",
+                defaults={"email": f"bench-counter-{i}@synthetic.example", "password": "!"},
+            )[0].id
+            for i in range(options["hot"])
+        ]
+        self.stdout.write(f"Database: {connection.vendor}; {options['threads']} threads x {options['ops']} ops.")
+        try:
+            for shards in options["shards"]:
+                self._reset(users)
+                stats = defaultdict(int)
+                lock = threading.Lock()
+                threads = [
+                    threading.Thread(target=_worker, args=(users, options["ops"], shards, i, stats, lock))
+                    for i in range(options["threads"])
+                ]
+                started = time.monotonic()
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                elapsed = time.monotonic() - started
+                fold_counter_shards(user_ids=users)
+                totals = PairingCounter.objects.filter(user_id__in=users).values_list("left_count", "right_count")
+                consistent = all(left + right == stats["ops"] for left, right in totals)
+                label = "plain" if shards <= 0 else f"{shards} shards"
+                self.stdout.write(
+                    f"  {label:>10}: {stats['ops'] / elapsed:8.1f} tx/s, {stats['retries']} retries, "
+                    f"{elapsed:.1f}s, counts {'consistent' if consistent else 'INCONSISTENT'}"
+                )
+        finally:
+            self._reset(users)
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    def _reset(self, users):
+        PairingCounterShard.objects.filter(user_id__in=users).delete()
+        PairingCounter.objects.filter(user_id__in=users).delete()
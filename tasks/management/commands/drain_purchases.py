@@ -0,0 +1,33 @@
+"""
+Drain the batch-mode purchase queue (tasks.PendingPurchase) inline, batch by batch.
+Usage: python manage.py drain_purchases [--batch-size 200]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from tasks import engine
+from tasks.tasks import release_pairs_for_user
+
+
+class Command(BaseCommand):
+    help = "Process queued paid orders in batches with merged pairing-counter increments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200, help="Orders per batch (default 200).")
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options["batch_size"])
+        started = time.monotonic()
+        orders = batches = 0
+        ready = set()
+        while (result := engine.drain_pending_purchases(batch_size)) is not None:
+            batches += 1
+            orders += result["orders"]
+            ready.update(result["ready"])
+        for user_id in ready:
+            release_pairs_for_user.delay(user_id, all_pending=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {orders} order(s) in {batches} batch(es) in {time.monotonic() - started:.1f}s; "
+            f"queued {len(ready)} release(s)."
+        ))
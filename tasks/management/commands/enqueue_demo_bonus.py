@@ -1,6 +1,6 @@
 """
 Enqueue release_pairs_for_user for a given user (dev/demo).
-Usage: python manage.py enqueue_demo_bonus --user <id>
+Usage: python manage.py enqueue_demo_bonus --user <id> [--all-pending]
 """
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
@@ -20,11 +20,16 @@ class Command(BaseCommand):
             required=True,
             help="User ID to enqueue release_pairs_for_user for.",
         )
+        parser.add_argument(
+            "--all-pending",
+            action="store_true",
+            help="Release every pending pair in one run instead of one pair.",
+        )
 
     def handle(self, *args, **options):
         user_id = options["user"]
         if not User.objects.filter(pk=user_id).exists():
             self.stderr.write(self.style.ERROR(f"User with id={user_id} not found."))
             return
-        release_pairs_for_user.delay(user_id)
+        release_pairs_for_user.delay(user_id, all_pending=options["all_pending"])
         self.stdout.write(self.style.SUCCESS(f"Queued release_pairs_for_user for user_id={user_id}."))
@@ -0,0 +1,31 @@
+"""
+Release every pending pair platform-wide in chunked set-based statements.
+Runs inline by default; --enqueue sends it to Celery (release_all_pending_pairs) instead.
+Usage: python manage.py release_pending_pairs [--chunk-size 5000] [--enqueue]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from tasks import engine
+from tasks.tasks import release_all_pending_pairs
+
+
+class Command(BaseCommand):
+    help = "Release all pending pairs (min(L, R) > released_pairs): PENDING bonus events become RELEASED."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Counters per transaction (default 5000).")
+        parser.add_argument("--enqueue", action="store_true", help="Queue the Celery task instead of running inline.")
+
+    def handle(self, *args, **options):
+        chunk = max(1, options["chunk_size"])
+        if options["enqueue"]:
+            release_all_pending_pairs.delay(chunk_size=chunk)
+            self.stdout.write(self.style.SUCCESS("Queued release_all_pending_pairs."))
+            return
+        started = time.monotonic()
+        users, pairs = engine.sweep_pair_releases(chunk)
+        self.stdout.write(self.style.SUCCESS(
+            f"Released {pairs} pair(s) for {users} user(s) in {time.monotonic() - started:.1f}s."
+        ))
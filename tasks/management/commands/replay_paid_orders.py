@@ -0,0 +1,122 @@
+"""
+Backfill: pay out every paid order that has no ProcessedOrder row yet (tasks.engine).
+
+Orders are partitioned by the buyer's path prefix at --split-depth (top-level legs by
+default). Partitions share only the ancestors above the split, so workers write disjoint
+counter rows except for at most --split-depth shared ones, which get one merged UPDATE per
+batch. Orders of buyers above the split (or not placed) run first in this process; the
+partitions then run in a process pool, each in id (creation) order, --batch-size orders per
+transaction. ProcessedOrder rows commit with each batch, so an interrupted run resumes
+where it stopped when started again.
+
+Global creation order is not kept: every order above the split is replayed before any
+partition, and partitions interleave. Amounts do not depend on order (each purchase is
+paid from its own profit over a fixed upline), and the final counters are the same sums,
+but bonus_events ids, created_at and lane unit numbers differ from a serial replay, so a
+released pair (tasks.engine.release_events) can cover other orders' events.
+Pair releases are deferred to one sweep_pair_releases at the end instead of one release
+task per ready ancestor.
+On SQLite, which serializes all writers, the partitions run one after another in-process.
+
+Usage:
+  python manage.py replay_paid_orders --workers 4 --split-depth 2
+  python manage.py replay_paid_orders --dry-run
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Q
+
+from orders.models import Order
+from tasks import engine
+from tasks.models import BackgroundTask
+
+
+def _pending():
+    # The system order only carries release/adjustment events; it is not a purchase.
+    return Order.objects.filter(status=Order.Status.PAID, processed__isnull=True).exclude(payment_method="system")
+
+
+def _init_worker():
+    django.setup()
+    connections.close_all()
+
+
+def _replay_partition(args):
+    prefix, batch_size = args
+    return prefix, engine.replay_orders(Order.objects.filter(buyer__tree_node__path__startswith=prefix), batch_size)
+
+
+class Command(BaseCommand):
+    help = "Replay paid orders without a ProcessedOrder row, partitioned by tree leg, in a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Process pool size (default 4; 1 = no pool).")
+        parser.add_argument(
+            "--split-depth", type=int, default=1, help="Partition by path prefix at this depth (1 = top-level legs)."
+        )
+        parser.add_argument("--batch-size", type=int, default=200, help="Orders per transaction (default 200).")
+        parser.add_argument("--no-release", action="store_true", help="Skip the final pair-release sweep.")
+        parser.add_argument("--dry-run", action="store_true", help="Only report orders per partition.")
+
+    def handle(self, *args, **options):
+        split_depth = max(1, options["split_depth"])
+        batch_size = max(1, options["batch_size"])
+        top = _pending().filter(Q(buyer__tree_node__isnull=True) | Q(buyer__tree_node__depth__lt=split_depth))
+        sizes = self._partition_sizes(split_depth)
+        if options["dry_run"]:
+            self.stdout.write(f"  {'(top)':>12}: {top.count()} order(s)")
+            for prefix, n in sizes.items():
+                self.stdout.write(f"  {prefix:>12}: {n} order(s)")
+            return
+
+        bt = BackgroundTask.objects.create(task_name="replay_paid_orders", status="running")
+        started = time.monotonic()
+        try:
+            totals = engine.replay_orders(top, batch_size)
+            self.stdout.write(f"  {'(top)':>12}: {totals['orders']} order(s)")
+            jobs = [(prefix, batch_size) for prefix in sizes]
+            workers = options["workers"]
+            if workers > 1 and connection.vendor == "sqlite":
+                self.stderr.write("SQLite allows a single writer; replaying partitions in this process.")
+                workers = 1
+            if workers <= 1 or len(jobs) <= 1:
+                self._collect(map(_replay_partition, jobs), totals)
+            else:
+                connections.close_all()
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                    self._collect(pool.map(_replay_partition, jobs), totals)
+            remaining = _pending().count()
+            released = (0, 0) if options["no_release"] else engine.sweep_pair_releases()
+        except BaseException:
+            BackgroundTask.objects.filter(pk=bt.pk).update(status="failed")
+            raise
+        BackgroundTask.objects.filter(pk=bt.pk).update(status="completed")
+        summary = (
+            f"Replayed {totals['orders']} order(s) in {totals['batches']} batch(es), {totals['events']} event(s), "
+            f"in {time.monotonic() - started:.1f}s; released {released[1]} pair(s) for {released[0]} user(s)."
+        )
+        if remaining:
+            raise CommandError(f"{summary} {remaining} paid order(s) still unprocessed; rerun to resume.")
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def _collect(self, results, totals):
+        for prefix, part in results:
+            self.stdout.write(f"  {prefix:>12}: {part['orders']} order(s)")
+            for key in totals:
+                totals[key] += part[key]
+
+    def _partition_sizes(self, split_depth):
+        """{path prefix at split_depth: pending orders}, largest first, so big legs start early."""
+        rows = (
+            _pending().filter(buyer__tree_node__depth__gte=split_depth)
+            .values_list("buyer__tree_node__path", flat=True)
+        )
+        sizes = {}
+        for path in rows.iterator(chunk_size=10000):
+            prefix = path[: path.index(":") + 1 + split_depth]
+            sizes[prefix] = sizes.get(prefix, 0) + 1
+        return dict(sorted(sizes.items(), key=lambda item: -item[1]))
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_shipping_and_order_fields'),
+        ('tasks', '0002_pending_purchases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('processed_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, related_name='processed', to='orders.order')),
+            ],
+            options={
+                'db_table': 'processed_orders',
+            },
+        ),
+    ]
@@ -13,3 +13,34 @@ class BackgroundTask(models.Model):
 
     def __str__(self):
         return f"{self.task_name} #{self.pk} {self.status}"
+
+
+class PendingPurchase(models.Model):
+    """
+    Ingest queue for paid orders when PURCHASE_INGEST_MODE is "batch": drained in batches
+    by tasks.engine.drain_pending_purchases, which deletes the rows it processed.
+    """
+    order = models.OneToOneField("orders.Order", on_delete=models.CASCADE, related_name="pending_purchase")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "pending_purchases"
+
+    def __str__(self):
+        return f"PendingPurchase order={self.order_id}"
+
+
+class ProcessedOrder(models.Model):
+    """
+    Idempotency ledger for the bonus engine: one row per order whose bonuses and lane
+    increments were written, inserted in the same transaction. A retried or duplicated
+    process_purchase finds the row (or hits the unique order) and does nothing.
+    """
+    order = models.OneToOneField("orders.Order", on_delete=models.PROTECT, related_name="processed")
+    processed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "processed_orders"
+
+    def __str__(self):
+        return f"ProcessedOrder order={self.order_id}"
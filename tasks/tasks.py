@@ -2,68 +2,50 @@
 Celery tasks for purchase processing and bonus calculation.
 All bonus logic runs here (never in HTTP request). Idempotent and append-only.
 """
-from decimal import Decimal
-
 from celery import shared_task
-from django.db import transaction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, OperationalError, transaction
 from django.contrib.auth import get_user_model
 
+from tasks import engine
+from tree.counters import shard_count
 from tree.models import PairingCounter
-from bonuses.models import BonusEvent
-from orders.models import Order
-from tasks.models import BackgroundTask
+from tasks.models import BackgroundTask, PendingPurchase
 
 User = get_user_model()
 
-# Fixed amount for one released pair (demo/placeholder until real rules).
-RELEASE_PAIR_BONUS_AMOUNT = Decimal("10.00")
-
-
-def _get_system_order():
-    """Get or create a single system order used for demo/adjustment bonus events."""
-    system_user, created = User.objects.get_or_create(
-        email="system@internal",
-        defaults={"username": "system"},
-    )
-    if created:
-        system_user.set_unusable_password()
-        system_user.save(update_fields=["password"])
-    order = Order.objects.filter(buyer=system_user).first()
-    if not order:
-        order = Order.objects.create(
-            buyer=system_user,
-            total_price=Decimal("0"),
-            status=Order.Status.PAID,
-            shipping_full_name="",
-            shipping_address_line1="",
-            shipping_address_line2="",
-            shipping_city="",
-            shipping_state="",
-            shipping_zip_code="",
-            shipping_country="",
-            shipping_phone="",
-            payment_method="system",
-        )
-    return order
-
 
-@shared_task(bind=True)
+@shared_task(bind=True, max_retries=5, acks_late=True, reject_on_worker_lost=True)
 def process_purchase(self, order_id: int):
     """
-    Process a paid order: traverse hierarchy, create bonus events, update pairing counters.
-    Idempotent; safe to retry.
+    Process a paid order (tasks.engine): DIRECT and HIERARCHY bonus_events (PENDING) and
+    lane increments on the buyer's upline, in one SERIALIZABLE transaction. Ancestors whose
+    min(L, R) passed released_pairs get release_pairs_for_user(all_pending=True) once it commits.
+    Idempotent through tasks.ProcessedOrder, so it is acked late and safe to redeliver.
     """
-    # Placeholder: will traverse buyer's ancestors, create DIRECT/HIERARCHY bonus_events,
-    # increment pairing counters, and release pairs when min(L,R) increases.
-    return {"order_id": order_id, "status": "queued"}
+    try:
+        result = engine.process_order(order_id)
+    except OperationalError as exc:
+        # Serialization failure: the transaction was rolled back as a whole, so rerun it.
+        raise self.retry(exc=exc, countdown=2 ** self.request.retries)
+    ready = result.pop("ready", [])
+    transaction.on_commit(lambda: [release_pairs_for_user.delay(user_id, all_pending=True) for user_id in ready])
+    result["releases_queued"] = len(ready)
+    return result
 
 
 @shared_task(bind=True)
-def release_pairs_for_user(self, user_id: int):
+def release_pairs_for_user(self, user_id: int, all_pending: bool = False):
     """
-    Release one pair's worth of bonuses for user when min(left_count, right_count) increased.
-    Idempotent: only releases one pair per call if min(L, R) > released_pairs.
-    Creates a BonusEvent (RELEASED) and increments PairingCounter.released_pairs.
+    Release pairs for user when min(left_count, right_count) increased.
+    Idempotent: releases only while min(L, R) > released_pairs, under a row lock.
+    Default: one pair per call. all_pending=True releases the whole delta at once.
+    Releasing moves the user's PENDING bonus events of the released units to RELEASED
+    (tasks.engine.release_events); amounts are never touched. Striped counters are folded
+    first: all of the user's PAIRING_COUNTER_SHARDS shard rows are read and locked on
+    every release (tree.counters.fold_counter_shards), which for a hot user competes
+    with the increments striping spreads out.
     """
     task_id = None
     try:
@@ -85,6 +67,8 @@ def release_pairs_for_user(self, user_id: int):
                     BackgroundTask.objects.filter(pk=task_id).update(status="skipped")
                 return result
 
+            if shard_count() > 0:
+                engine.fold_shards(user_ids=[user_id])
             counter = (
                 PairingCounter.objects.select_for_update()
                 .get_or_create(user=user, defaults={"left_count": 0, "right_count": 0, "released_pairs": 0})[0]
@@ -96,19 +80,18 @@ def release_pairs_for_user(self, user_id: int):
                     BackgroundTask.objects.filter(pk=task_id).update(status="completed")
                 return result
 
-            counter.released_pairs += 1
+            pairs = min_lr - counter.released_pairs if all_pending else 1
+            before = counter.released_pairs
+            counter.released_pairs += pairs
             counter.save(update_fields=["released_pairs", "updated_at"])
-
-            system_order = _get_system_order()
-            BonusEvent.objects.create(
-                user=user,
-                order=system_order,
-                bonus_type=BonusEvent.BonusType.HIERARCHY,
-                amount=RELEASE_PAIR_BONUS_AMOUNT,
-                status=BonusEvent.Status.RELEASED,
-                depth=0,
-            )
-        result = {"user_id": user_id, "status": "released", "released_pairs": counter.released_pairs}
+            events = engine.release_events([(user.pk, before, counter.released_pairs)])
+        result = {
+            "user_id": user_id,
+            "status": "released",
+            "released": pairs,
+            "released_pairs": counter.released_pairs,
+            "events": events,
+        }
         if task_id:
             BackgroundTask.objects.filter(pk=task_id).update(status="completed")
         return result
@@ -116,3 +99,88 @@ def release_pairs_for_user(self, user_id: int):
         if task_id:
             BackgroundTask.objects.filter(pk=task_id).update(status="failed")
         raise
+
+
+@shared_task(bind=True)
+def release_all_pending_pairs(self, chunk_size: int = 5000):
+    """
+    Nightly sweep: release every pending pair for all users with set-based statements
+    (tasks.engine.sweep_pair_releases) instead of one release_pairs_for_user task per user.
+    """
+    bt = BackgroundTask.objects.create(task_name="release_all_pending_pairs", status="running")
+    try:
+        users, pairs = engine.sweep_pair_releases(chunk_size)
+    except Exception:
+        BackgroundTask.objects.filter(pk=bt.pk).update(status="failed")
+        raise
+    BackgroundTask.objects.filter(pk=bt.pk).update(status="completed")
+    return {"status": "released", "users": users, "pairs": pairs}
+
+
+DRAIN_SCHEDULED_KEY = "purchase-drain-scheduled"
+
+
+def _schedule_drain():
+    """Queue drain_purchase_queue unless one is already scheduled (gate key in the cache)."""
+    window = getattr(settings, "PURCHASE_BATCH_WINDOW_SECONDS", 2)
+    if cache.add(DRAIN_SCHEDULED_KEY, 1, timeout=window):
+        drain_purchase_queue.apply_async(countdown=window)
+
+
+def enqueue_purchase(order_id: int):
+    """
+    Hand a paid order to the bonus engine. PURCHASE_INGEST_MODE "immediate" (default) runs
+    process_purchase per order; "batch" queues it for drain_purchase_queue, which is
+    scheduled at most once per PURCHASE_BATCH_WINDOW_SECONDS. The gate is checked once the
+    queue row has committed, so a drain that clears it and finds the row will run again.
+    The gate lives in the cache: batch mode needs a cache shared by the web and worker
+    processes (Redis, Memcached); with a per-process cache (LocMem) a drain cannot clear
+    the web process's gate and orders queued meanwhile wait for the next window.
+    """
+    if getattr(settings, "PURCHASE_INGEST_MODE", "immediate") != "batch":
+        transaction.on_commit(lambda: process_purchase.delay(order_id))
+        return
+    PendingPurchase.objects.get_or_create(order_id=order_id)
+    transaction.on_commit(_schedule_drain)
+
+
+@shared_task(bind=True, max_retries=5, acks_late=True)
+def drain_purchase_queue(self, batch_size: int = 0, max_batches: int = 50):
+    """
+    Process queued purchases (tasks.engine.drain_pending_purchases) batch by batch until the
+    queue is empty or max_batches ran; queues itself again if work is left. On an empty
+    queue it clears the scheduling gate and checks once more, so an order whose enqueue saw
+    the gate still set is not stranded. Also safe to run periodically (Celery beat) as a
+    backstop: concurrent drains take disjoint batches.
+    """
+    batch_size = batch_size or getattr(settings, "PURCHASE_BATCH_SIZE", 200)
+    orders = batches = 0
+    ready = set()
+    try:
+        while batches < max_batches:
+            result = engine.drain_pending_purchases(batch_size)
+            if result is None:
+                break
+            batches += 1
+            orders += result["orders"]
+            ready.update(result["ready"])
+    except (OperationalError, IntegrityError) as exc:
+        # Serialization failure or a concurrent duplicate (another drain or process_purchase
+        # took an order first): the failed batch was rolled back and is still queued.
+        raise self.retry(exc=exc, countdown=2 ** self.request.retries)
+    finally:
+        for user_id in ready:
+            release_pairs_for_user.delay(user_id, all_pending=True)
+    if batches == max_batches:
+        drain_purchase_queue.delay(batch_size, max_batches)
+    else:
+        cache.delete(DRAIN_SCHEDULED_KEY)
+        if PendingPurchase.objects.exists():
+            _schedule_drain()
+    return {"status": "drained", "batches": batches, "orders": orders, "releases_queued": len(ready)}
+
+
+@shared_task(bind=True)
+def fold_pairing_counter_shards(self, chunk_size: int = 5000):
+    """Periodic: compact striped counter deltas into PairingCounter (tree.counters)."""
+    return {"status": "folded", "users": engine.fold_shards(chunk_size=chunk_size)}
@@ -0,0 +1,23 @@
+"""Shared test data builders for the purchase-engine tests."""
+from django.contrib.auth import get_user_model
+
+from orders.models import Order, OrderItem
+from products.models import Product
+from sellers.models import Store
+from tree.models import TreeNode
+
+User = get_user_model()
+
+
+def make_placed_user(email, parent=None, lane="L", referred_by=None):
+    user = User.objects.create_user(username=email, email=email, password="x", referred_by=referred_by)
+    TreeNode.objects.create(user=user, parent=parent, lane=lane, depth=parent.depth + 1 if parent else 0)
+    return user
+
+
+def make_paid_order(buyer, price, base_price, quantity=1):
+    store = Store.objects.get_or_create(name="Engine store")[0]
+    product = Product.objects.create(store=store, name="Widget", base_price=base_price, markup_price=price)
+    order = Order.objects.create(buyer=buyer, total_price=price * quantity, status=Order.Status.PAID)
+    OrderItem.objects.create(order=order, product=product, quantity=quantity, price_at_purchase=price)
+    return order
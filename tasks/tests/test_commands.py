@@ -0,0 +1,109 @@
+"""Tests for tasks management commands."""
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+
+from bonuses.models import BonusEvent, CompensationPlan
+from bonuses.plan import reset_plan_cache
+from tasks.management.commands.replay_paid_orders import _init_worker
+from tasks.models import BackgroundTask, ProcessedOrder
+from tasks.tests.factories import make_paid_order, make_placed_user
+from tree.models import PairingCounter
+from tree.snapshot import reset_snapshot
+
+
+class ReplayPaidOrdersTest(TestCase):
+    def setUp(self):
+        reset_snapshot()
+        reset_plan_cache()
+        self.addCleanup(reset_snapshot)
+        self.addCleanup(reset_plan_cache)
+        # root -> a (L) -> a2 (L); root -> b (R) -> b2 (R)
+        self.root = make_placed_user("root@test.example")
+        self.a = make_placed_user("a@test.example", self.root.tree_node, "L")
+        self.a2 = make_placed_user("a2@test.example", self.a.tree_node, "L", referred_by=self.a)
+        self.b = make_placed_user("b@test.example", self.root.tree_node, "R")
+        self.b2 = make_placed_user("b2@test.example", self.b.tree_node, "R")
+
+    def _order(self, buyer):
+        return make_paid_order(buyer, Decimal("150.00"), Decimal("100.00"))
+
+    def test_replays_partitions_and_resumes(self):
+        orders = [self._order(u) for u in (self.a2, self.b2, self.a2, self.root, self.b)]
+        ProcessedOrder.objects.create(order=orders[2])  # checkpoint from an interrupted run
+        out = StringIO()
+        call_command("replay_paid_orders", workers=1, split_depth=2, batch_size=1, stdout=out)
+        self.assertIn("Replayed 4 order(s)", out.getvalue())
+        self.assertEqual(ProcessedOrder.objects.count(), 5)
+        self.assertFalse(BonusEvent.objects.filter(order=orders[2]).exists())
+        counters = {
+            pc.user_id: (pc.left_count, pc.right_count, pc.released_pairs) for pc in PairingCounter.objects.all()
+        }
+        # root gets L from a2 and R from b2 and b: one pair, released by the final sweep,
+        # which moves root's L and R unit 1 events to RELEASED: a2's, and b's (above the
+        # split, so replayed before the partitions).
+        self.assertEqual(counters, {self.a.id: (1, 0, 0), self.root.id: (1, 2, 1), self.b.id: (0, 1, 0)})
+        released = BonusEvent.objects.filter(user=self.root, status=BonusEvent.Status.RELEASED)
+        self.assertEqual(sorted(released.values_list("order__buyer", flat=True)), sorted([self.a2.id, self.b.id]))
+        self.assertEqual(BackgroundTask.objects.get(task_name="replay_paid_orders").status, "completed")
+
+        events = BonusEvent.objects.count()
+        out = StringIO()
+        call_command("replay_paid_orders", workers=1, stdout=out)
+        self.assertIn("Replayed 0 order(s)", out.getvalue())
+        self.assertEqual(BonusEvent.objects.count(), events)
+
+    def test_dry_run_reports_partitions(self):
+        for buyer in (self.a2, self.a2, self.b2, self.root):
+            self._order(buyer)
+        out = StringIO()
+        call_command("replay_paid_orders", split_depth=2, dry_run=True, stdout=out)
+        lines = out.getvalue().split("\n")
+        self.assertIn("(top): 1 order(s)", lines[0])
+        self.assertIn(f"{self.root.id}:LL: 2 order(s)", lines[1])
+        self.assertIn(f"{self.root.id}:RR: 1 order(s)", lines[2])
+        self.assertFalse(ProcessedOrder.objects.exists())
+
+
+def _thread_pool(max_workers, initializer):
+    # One thread: concurrent writers lock each other's tables in SQLite's shared in-memory cache.
+    return ThreadPoolExecutor(max_workers=1, initializer=initializer)
+
+
+class ReplayPaidOrdersPoolTest(TransactionTestCase):
+    """--workers path; threads stand in for the process pool, which cannot see the in-memory test database."""
+
+    def setUp(self):
+        reset_snapshot()
+        reset_plan_cache()
+        self.addCleanup(reset_snapshot)
+        self.addCleanup(reset_plan_cache)
+        CompensationPlan.objects.get_or_create(version=1, defaults={"is_active": True})  # flushed between tests
+        # root -> a (L) -> a2 (L); root -> b (R) -> b2 (R)
+        self.root = make_placed_user("root@test.example")
+        self.a = make_placed_user("a@test.example", self.root.tree_node, "L")
+        self.a2 = make_placed_user("a2@test.example", self.a.tree_node, "L", referred_by=self.a)
+        self.b = make_placed_user("b@test.example", self.root.tree_node, "R")
+        self.b2 = make_placed_user("b2@test.example", self.b.tree_node, "R")
+
+    def test_partitions_replay_in_the_pool(self):
+        for buyer in (self.a2, self.b2, self.a2, self.root, self.b):
+            make_paid_order(buyer, Decimal("150.00"), Decimal("100.00"))
+        out = StringIO()
+        with mock.patch("tasks.management.commands.replay_paid_orders.ProcessPoolExecutor", _thread_pool), \
+                mock.patch("tasks.management.commands.replay_paid_orders.connection", vendor="postgresql"), \
+                mock.patch("tasks.management.commands.replay_paid_orders._init_worker", wraps=_init_worker) as init:
+            call_command("replay_paid_orders", workers=2, split_depth=1, batch_size=1, stdout=out)
+        init.assert_called_once_with()
+        self.assertIn("Replayed 5 order(s)", out.getvalue())
+        self.assertIn(f"{self.root.id}:L: 2 order(s)", out.getvalue())
+        self.assertIn(f"{self.root.id}:R: 2 order(s)", out.getvalue())
+        self.assertEqual(ProcessedOrder.objects.count(), 5)
+        counters = {
+            pc.user_id: (pc.left_count, pc.right_count, pc.released_pairs) for pc in PairingCounter.objects.all()
+        }
+        self.assertEqual(counters, {self.a.id: (2, 0, 0), self.root.id: (2, 2, 2), self.b.id: (0, 1, 0)})
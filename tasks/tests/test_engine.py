@@ -0,0 +1,184 @@
+"""Tests for tasks.engine (purchase bonus engine)."""
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from bonuses.models import BonusEvent, CompensationPlan
+from bonuses.plan import reset_plan_cache
+from orders.models import Order
+from tasks import engine
+from tasks.models import PendingPurchase, ProcessedOrder
+from tasks.tasks import enqueue_purchase, process_purchase
+from tasks.tests.factories import make_paid_order, make_placed_user
+from tree.models import PairingCounter
+from tree.snapshot import reset_snapshot
+
+
+class PurchaseEngineTest(TestCase):
+    def setUp(self):
+        reset_snapshot()
+        reset_plan_cache()
+        self.addCleanup(reset_snapshot)
+        self.addCleanup(reset_plan_cache)
+        # root -> a (L) -> buyer (L); root -> b (R)
+        self.root = make_placed_user("root@test.example")
+        self.a = make_placed_user("a@test.example", self.root.tree_node, "L")
+        self.b = make_placed_user("b@test.example", self.root.tree_node, "R")
+        self.buyer = make_placed_user("buyer@test.example", self.a.tree_node, "L", referred_by=self.a)
+
+    def test_split_and_decay(self):
+        order = make_paid_order(self.buyer, Decimal("150.00"), Decimal("100.00"), quantity=2)  # profit 100
+        result = engine.process_order(order.id)
+        self.assertEqual(result["profit"], "100.00")
+        self.assertEqual(result["app_fee"], "20.00")
+        events = {
+            (e.user_id, e.bonus_type, e.depth, e.lane): e.amount
+            for e in BonusEvent.objects.filter(order=order)
+        }
+        self.assertEqual(events, {
+            (self.a.id, BonusEvent.BonusType.DIRECT, None, "L"): Decimal("40.00"),  # tied to a's L unit
+            (self.a.id, BonusEvent.BonusType.HIERARCHY, 1, "L"): Decimal("12.00"),  # 40 * 30/1/100
+            (self.root.id, BonusEvent.BonusType.HIERARCHY, 2, "L"): Decimal("6.00"),  # 40 * 30/2/100
+        })
+        self.assertFalse(BonusEvent.objects.filter(order=order, status=BonusEvent.Status.RELEASED).exists())
+        counters = {pc.user_id: (pc.left_count, pc.right_count) for pc in PairingCounter.objects.all()}
+        self.assertEqual(counters, {self.a.id: (1, 0), self.root.id: (1, 0)})
+
+    def test_decay_cut_off_at_fifteen_levels(self):
+        upline = [(i, 1000 + i, i, "R") for i in range(1, 20)]
+        plan = engine.plan_purchase(1, Decimal("1000.00"), None, upline)
+        self.assertEqual(len(plan.events), 15)
+        self.assertEqual(plan.lanes["R"], [1000 + i for i in range(1, 16)])
+        self.assertLessEqual(sum(e.amount for e in plan.events), Decimal("400.00"))
+        self.assertEqual(plan.events[2].amount, Decimal("40.00"))  # 400 * 30/3/100
+
+    def test_events_record_active_plan_version(self):
+        CompensationPlan.objects.update(is_active=False)
+        CompensationPlan.objects.create(
+            version=2, app_fee_percent=20, direct_percent=30, hierarchy_percent=50, cutoff_depth=1, is_active=True
+        )
+        order = make_paid_order(self.buyer, Decimal("200.00"), Decimal("100.00"))  # profit 100
+        result = engine.process_order(order.id)
+        self.assertEqual(result["plan_version"], 2)
+        events = {(e.user_id, e.bonus_type, e.plan_version): e.amount for e in BonusEvent.objects.filter(order=order)}
+        self.assertEqual(events, {
+            (self.a.id, BonusEvent.BonusType.DIRECT, 2): Decimal("30.00"),
+            (self.a.id, BonusEvent.BonusType.HIERARCHY, 2): Decimal("15.00"),  # 50 * 30/1/100, cut off at 1
+        })
+        self.assertEqual(list(PairingCounter.objects.values_list("user_id", flat=True)), [self.a.id])
+
+    def test_no_negative_bonuses(self):
+        order = make_paid_order(self.buyer, Decimal("90.00"), Decimal("100.00"))
+        engine.process_order(order.id)
+        events = BonusEvent.objects.filter(order=order)
+        self.assertEqual(  # zero-amount unit events, no DIRECT
+            sorted(events.values_list("user_id", "bonus_type", "amount", "unit")),
+            sorted([(self.a.id, "HIERARCHY", Decimal("0.00"), 1), (self.root.id, "HIERARCHY", Decimal("0.00"), 1)]),
+        )
+        self.assertEqual(PairingCounter.objects.get(user=self.root).left_count, 1)
+
+    def test_statement_count_does_not_grow_with_upline(self):
+        shallow_buyer = make_placed_user("bl@test.example", self.b.tree_node, "L")
+        warm, shallow = (make_paid_order(shallow_buyer, Decimal("150.00"), Decimal("100.00")) for _ in range(2))
+        parent, deep = self.buyer, None
+        for i in range(12):
+            deep = make_placed_user(f"d{i}@test.example", parent.tree_node, "R")
+            parent = deep
+        deep_order = make_paid_order(deep, Decimal("150.00"), Decimal("100.00"))
+        engine.process_order(warm.id)  # warm the snapshot
+        with self.assertNumQueries(13):
+            engine.process_order(shallow.id)
+        with self.assertNumQueries(13):
+            engine.process_order(deep_order.id)
+        self.assertEqual(BonusEvent.objects.filter(order=deep_order).count(), 14)
+
+    def test_pair_ready_triggers_release(self):
+        PairingCounter.objects.create(user=self.root, right_count=1)
+        order = make_paid_order(self.buyer, Decimal("150.00"), Decimal("100.00"))
+        with patch("tasks.tasks.release_pairs_for_user.delay") as delay, self.captureOnCommitCallbacks(execute=True):
+            result = process_purchase.apply(args=[order.id]).get()
+        self.assertEqual(result["status"], "processed")
+        delay.assert_called_once_with(self.root.id, all_pending=True)
+
+    def test_retry_is_a_no_op(self):
+        order = make_paid_order(self.buyer, Decimal("150.00"), Decimal("100.00"))
+        self.assertEqual(process_purchase.apply(args=[order.id]).get()["status"], "processed")
+        events = BonusEvent.objects.count()
+        with self.assertNumQueries(1):
+            self.assertEqual(engine.process_order(order.id)["status"], "duplicate")
+        self.assertEqual(BonusEvent.objects.count(), events)
+        self.assertEqual(PairingCounter.objects.get(user=self.root).left_count, 1)
+        self.assertTrue(ProcessedOrder.objects.filter(order=order).exists())
+
+    def test_concurrent_duplicate_hits_unique_order(self):
+        order = make_paid_order(self.buyer, Decimal("150.00"), Decimal("100.00"))
+        ProcessedOrder.objects.create(order=order)
+        with patch("tasks.engine.ProcessedOrder.objects.filter") as filter_:
+            filter_.return_value.exists.side_effect = [False, True]  # the other worker commits in between
+            self.assertEqual(engine.process_order(order.id)["status"], "duplicate")
+        self.assertFalse(BonusEvent.objects.exists())
+        self.assertFalse(PairingCounter.objects.exists())
+
+    def test_unpaid_order_is_skipped(self):
+        order = make_paid_order(self.buyer, Decimal("150.00"), Decimal("100.00"))
+        Order.objects.filter(pk=order.pk).update(status=Order.Status.PENDING)
+        self.assertEqual(engine.process_order(order.id)["reason"], "order_not_paid")
+        self.assertFalse(BonusEvent.objects.exists())
+
+
+class PurchaseBatchTest(TestCase):
+    def setUp(self):
+        reset_snapshot()
+        reset_plan_cache()
+        self.addCleanup(reset_snapshot)
+        self.addCleanup(reset_plan_cache)
+        self.root = make_placed_user("root@test.example")
+        self.a = make_placed_user("a@test.example", self.root.tree_node, "L")
+        self.b = make_placed_user("b@test.example", self.root.tree_node, "R")
+        self.buyer = make_placed_user("buyer@test.example", self.a.tree_node, "L", referred_by=self.a)
+        self.other = make_placed_user("other@test.example", self.b.tree_node, "L")
+
+    @override_settings(PURCHASE_INGEST_MODE="batch")
+    def test_batch_merges_counter_updates_and_keeps_per_order_ledger(self):
+        orders = [make_paid_order(self.buyer, Decimal("150.00"), Decimal("100.00")) for _ in range(3)]
+        orders.append(make_paid_order(self.other, Decimal("150.00"), Decimal("100.00")))
+        with patch("tasks.tasks.drain_purchase_queue.apply_async"), self.captureOnCommitCallbacks(execute=True):
+            for order in orders:
+                enqueue_purchase(order.id)
+        self.assertEqual(PendingPurchase.objects.count(), 4)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = engine.drain_pending_purchases(batch_size=10)
+        updates = [q["sql"] for q in queries.captured_queries if q["sql"].startswith('UPDATE "pairing_counters"')]
+        self.assertEqual(len(updates), 3)  # one per distinct delta: a (3, 0), root (3, 1), b (1, 0)
+        self.assertEqual(result["orders"], 4)
+        self.assertFalse(PendingPurchase.objects.exists())
+        counters = {pc.user_id: (pc.left_count, pc.right_count) for pc in PairingCounter.objects.all()}
+        self.assertEqual(counters, {self.a.id: (3, 0), self.root.id: (3, 1), self.b.id: (1, 0)})
+        for order in orders[:3]:
+            self.assertEqual(BonusEvent.objects.filter(order=order).count(), 3)  # direct + 2 hierarchy
+        self.assertCountEqual(result["ready"], [self.root.id])
+        self.assertIsNone(engine.drain_pending_purchases())
+
+        PendingPurchase.objects.create(order=orders[0])  # queued again: already processed
+        self.assertEqual(engine.drain_pending_purchases()["skipped"], 1)
+        self.assertEqual(PairingCounter.objects.get(user=self.root).left_count, 3)
+
+    @override_settings(TREE_SNAPSHOT_MAX_BYTES=0)
+    def test_batch_uplines_from_closure_without_snapshot(self):
+        deep = make_placed_user("deep@test.example", self.buyer.tree_node, "R")
+        uplines = engine.buyer_uplines([deep.id, self.other.id, self.root.id], 15)
+        self.assertEqual([row[1] for row in uplines[deep.id]], [self.buyer.id, self.a.id, self.root.id])
+        self.assertEqual([row[3] for row in uplines[deep.id]], ["R", "L", "L"])
+        self.assertEqual([row[1] for row in uplines[self.other.id]], [self.b.id, self.root.id])
+        self.assertEqual(uplines[self.root.id], [])
+
+    def test_immediate_mode_enqueues_process_purchase(self):
+        order = make_paid_order(self.buyer, Decimal("150.00"), Decimal("100.00"))
+        with patch("tasks.tasks.process_purchase.delay") as delay, self.captureOnCommitCallbacks(execute=True):
+            enqueue_purchase(order.id)
+        delay.assert_called_once_with(order.id)
+        self.assertFalse(PendingPurchase.objects.exists())
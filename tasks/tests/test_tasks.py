@@ -0,0 +1,178 @@
+"""Tests for tasks.tasks."""
+from decimal import Decimal
+from unittest.mock import patch
+
+from celery.exceptions import Retry
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from bonuses.models import BonusEvent
+from tasks.models import PendingPurchase
+from tasks.tasks import (
+    DRAIN_SCHEDULED_KEY,
+    drain_purchase_queue,
+    release_all_pending_pairs,
+    release_pairs_for_user,
+)
+from bonuses.plan import reset_plan_cache
+from tasks import engine
+from tasks.tests.factories import make_paid_order, make_placed_user
+from tree.models import PairingCounter, PairingCounterShard
+from tree.snapshot import reset_snapshot
+
+User = get_user_model()
+
+
+def add_units(user, lanes, released=0):
+    """One HIERARCHY event per lane unit ({"L": n, "R": n}), units up to released already RELEASED."""
+    order = make_paid_order(user, Decimal("150.00"), Decimal("100.00"))
+    for lane, count in lanes.items():
+        for unit in range(1, count + 1):
+            BonusEvent.objects.create(
+                user=user, order=order, bonus_type=BonusEvent.BonusType.HIERARCHY, amount=Decimal("1.50"),
+                lane=lane, depth=1, unit=unit,
+                status=BonusEvent.Status.RELEASED if unit <= released else BonusEvent.Status.PENDING,
+            )
+    return order
+
+
+def add_direct(user, order, lane=None, unit=None):
+    return BonusEvent.objects.create(
+        user=user, order=order, bonus_type=BonusEvent.BonusType.DIRECT, amount=Decimal("4.00"), lane=lane, unit=unit
+    )
+
+
+def released_units(user):
+    """{lane: sorted released unit numbers} of the user's HIERARCHY events."""
+    released = BonusEvent.objects.filter(
+        user=user, bonus_type=BonusEvent.BonusType.HIERARCHY, status=BonusEvent.Status.RELEASED
+    )
+    return {lane: sorted(released.filter(lane=lane).values_list("unit", flat=True)) for lane in "LR"}
+
+
+class ReleasePairsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="pairs@test.example", email="pairs@test.example", password="x")
+        PairingCounter.objects.create(user=self.user, left_count=5, right_count=3, released_pairs=1)
+        order = add_units(self.user, {"L": 5, "R": 3}, released=1)
+        self.direct_2 = add_direct(self.user, order, "R", 2)
+        self.direct_4 = add_direct(self.user, order, "L", 4)
+
+    def _status(self, event):
+        event.refresh_from_db()
+        return event.status
+
+    def test_default_releases_one_pair(self):
+        result = release_pairs_for_user.apply(args=[self.user.id]).get()
+        self.assertEqual((result["released"], result["released_pairs"], result["events"]), (1, 2, 3))
+        self.assertEqual(released_units(self.user), {"L": [1, 2], "R": [1, 2]})
+        self.assertEqual((self._status(self.direct_2), self._status(self.direct_4)), ("RELEASED", "PENDING"))
+
+    def test_all_pending_moves_events_without_new_rows(self):
+        before = list(BonusEvent.objects.order_by("id").values_list("id", "amount"))
+        result = release_pairs_for_user.apply(args=[self.user.id], kwargs={"all_pending": True}).get()
+        self.assertEqual((result["released"], result["released_pairs"], result["events"]), (2, 3, 5))
+        self.assertEqual(released_units(self.user), {"L": [1, 2, 3], "R": [1, 2, 3]})  # L units 4 and 5 wait
+        self.assertEqual(self._status(self.direct_4), "PENDING")
+        self.assertEqual(list(BonusEvent.objects.order_by("id").values_list("id", "amount")), before)
+        retry = release_pairs_for_user.apply(args=[self.user.id], kwargs={"all_pending": True}).get()
+        self.assertEqual(retry["status"], "no_op")
+        self.assertEqual(released_units(self.user), {"L": [1, 2, 3], "R": [1, 2, 3]})
+
+    def test_direct_without_unit_goes_with_the_next_pair(self):
+        unpaired = add_direct(self.user, self.direct_2.order)
+        release_pairs_for_user.apply(args=[self.user.id]).get()
+        self.assertEqual(self._status(unpaired), "RELEASED")
+
+
+class ReleaseAllPendingPairsTest(TestCase):
+    def test_sweep_releases_every_pending_pair_in_chunks(self):
+        expected = {}
+        for i, (left, right, released) in enumerate([(5, 3, 1), (2, 2, 2), (0, 4, 0), (7, 9, 0), (1, 1, 0)]):
+            user = User.objects.create_user(username=f"s{i}@test.example", email=f"s{i}@test.example", password="x")
+            PairingCounter.objects.create(user=user, left_count=left, right_count=right, released_pairs=released)
+            add_units(user, {"L": left, "R": right}, released=released)
+            expected[user] = list(range(1, min(left, right) + 1))
+        events = BonusEvent.objects.count()
+        result = release_all_pending_pairs.apply(kwargs={"chunk_size": 2}).get()
+        self.assertEqual((result["users"], result["pairs"]), (3, 10))
+        for user, units in expected.items():
+            self.assertEqual(released_units(user), {"L": units, "R": units})
+        self.assertEqual(BonusEvent.objects.count(), events)
+        self.assertFalse(PairingCounter.objects.filter(left_count__gt=F("released_pairs"),
+                                                       right_count__gt=F("released_pairs")).exists())
+        again = release_all_pending_pairs.apply().get()
+        self.assertEqual((again["users"], again["pairs"]), (0, 0))
+
+
+class UnitReleaseTest(TestCase):
+    def setUp(self):
+        reset_snapshot()
+        reset_plan_cache()
+        self.addCleanup(reset_snapshot)
+        self.addCleanup(reset_plan_cache)
+        # root -> a (L) -> buyer (L); root -> b (R); buyer referred by root
+        self.root = make_placed_user("root@test.example")
+        self.a = make_placed_user("a@test.example", self.root.tree_node, "L")
+        self.b = make_placed_user("b@test.example", self.root.tree_node, "R")
+        self.buyer = make_placed_user("buyer@test.example", self.a.tree_node, "L", referred_by=self.root)
+
+    def _buy_and_release(self):
+        loss = make_paid_order(self.buyer, Decimal("90.00"), Decimal("100.00"))  # root's L unit 1 pays 0
+        paid = make_paid_order(self.buyer, Decimal("150.00"), Decimal("100.00"))  # root's L unit 2
+        right = make_paid_order(self.b, Decimal("150.00"), Decimal("100.00"))  # root's R unit 1
+        for order in (loss, paid, right):
+            engine.process_order(order.id)
+        result = release_pairs_for_user.apply(args=[self.root.id], kwargs={"all_pending": True}).get()
+        self.assertEqual(result["released_pairs"], 1)
+        return loss, paid, right
+
+    def _root_events(self, status):
+        return sorted(
+            BonusEvent.objects.filter(user=self.root, status=status)
+            .values_list("order_id", "bonus_type", "lane", "unit")
+        )
+
+    def _check_zero_profit_unit_pairs_first(self):
+        loss, paid, right = self._buy_and_release()
+        self.assertEqual(self._root_events(BonusEvent.Status.RELEASED), [
+            (loss.id, "HIERARCHY", "L", 1),
+            (right.id, "HIERARCHY", "R", 1),
+        ])
+        self.assertEqual(self._root_events(BonusEvent.Status.PENDING), [
+            (paid.id, "DIRECT", "L", 2),  # tied to the unpaired L unit
+            (paid.id, "HIERARCHY", "L", 2),
+        ])
+
+    def test_zero_profit_unit_is_paired_in_its_place(self):
+        self._check_zero_profit_unit_pairs_first()
+
+    @override_settings(PAIRING_COUNTER_SHARDS=4)
+    def test_striped_counters_number_units_on_fold(self):
+        self._check_zero_profit_unit_pairs_first()
+        self.assertFalse(PairingCounterShard.objects.filter(user=self.root, left_delta__gt=0).exists())
+
+
+class DrainPurchaseQueueTest(TestCase):
+    def setUp(self):
+        cache.delete(DRAIN_SCHEDULED_KEY)
+        self.addCleanup(cache.delete, DRAIN_SCHEDULED_KEY)
+
+    def test_empty_drain_reschedules_rows_queued_behind_the_gate(self):
+        cache.add(DRAIN_SCHEDULED_KEY, 1)  # an enqueue saw this and did not schedule
+        user = User.objects.create_user(username="queued@test.example", email="queued@test.example", password="x")
+        PendingPurchase.objects.create(order=make_paid_order(user, Decimal("150.00"), Decimal("100.00")))
+        with patch("tasks.engine.drain_pending_purchases", return_value=None), \
+                patch("tasks.tasks.drain_purchase_queue.apply_async") as apply_async:
+            result = drain_purchase_queue.apply().get()
+        self.assertEqual(result["batches"], 0)
+        apply_async.assert_called_once()
+
+    def test_concurrent_duplicate_is_retried(self):
+        with patch("tasks.engine.drain_pending_purchases", side_effect=IntegrityError("duplicate")), \
+                patch.object(drain_purchase_queue, "retry", side_effect=Retry()) as retry:
+            drain_purchase_queue.apply()
+        self.assertIsInstance(retry.call_args.kwargs["exc"], IntegrityError)
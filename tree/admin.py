@@ -1,17 +1,24 @@
 from django.contrib import admin
 
-from .models import PairingCounter, TreeNode
+from .models import PairingCounter, TreeClosure, TreeNode
 
 
 @admin.register(TreeNode)
 class TreeNodeAdmin(admin.ModelAdmin):
-    list_display = ("user", "parent", "lane", "depth", "created_at")
+    list_display = ("user", "parent", "lane", "depth", "left_size", "right_size", "created_at")
     list_filter = ("lane", "depth")
     search_fields = ("user__email",)
-    readonly_fields = ("user", "parent", "lane", "depth", "created_at")
+    readonly_fields = ("user", "parent", "lane", "depth", "path", "left_size", "right_size", "created_at")
     ordering = ("-created_at",)
 
 
+@admin.register(TreeClosure)
+class TreeClosureAdmin(admin.ModelAdmin):
+    list_display = ("ancestor", "descendant", "distance", "lane")
+    list_filter = ("distance", "lane")
+    readonly_fields = ("ancestor", "descendant", "distance", "lane")
+
+
 @admin.register(PairingCounter)
 class PairingCounterAdmin(admin.ModelAdmin):
     list_display = ("user", "left_count", "right_count", "released_pairs", "updated_at")
@@ -0,0 +1,186 @@
+"""
+Pairing-counter writes and reads, plain or striped.
+
+With settings.PAIRING_COUNTER_SHARDS = 0 (default) lane increments go straight to
+PairingCounter. With N > 0 every increment lands on one of N PairingCounterShard rows of the
+user, picked at random, so concurrent purchases under the same hot ancestors near the root
+mostly touch different rows. Effective counts are the counter plus its shard deltas: reads
+add them in (add_shard_deltas) and fold_counter_shards() moves them into PairingCounter,
+from a periodic task and at the start of every release. After turning sharding off, fold
+once so no deltas are left behind.
+"""
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import PairingCounter, PairingCounterShard
+
+
+def shard_count():
+    return getattr(settings, "PAIRING_COUNTER_SHARDS", 0)
+
+
+def _grouped(deltas):
+    """{(left, right): [user ids]} in user id order, for one UPDATE per distinct delta."""
+    groups = defaultdict(list)
+    for user_id in sorted(deltas):
+        groups[tuple(deltas[user_id])].append(user_id)
+    return sorted(groups.items())
+
+
+def increment_counters(deltas, shards=None, rng=random):
+    """
+    Add {user_id: (left, right)} lane increments; call inside a transaction. Rows are
+    created if missing and locked in key order first, so concurrent writers cannot deadlock,
+    then written with one UPDATE per distinct delta (per shard when striped). Striped
+    increments also insert-or-ignore the users' base PairingCounter rows (never locked or
+    updated here), which reads and releases start from. Plain increments return the
+    {user_id: (left, right)} counts read while locking, before the increments; striped
+    ones return None (the effective counts would need every shard row).
+    """
+    shards = shard_count() if shards is None else shards
+    if not deltas:
+        return {} if shards <= 0 else None
+    now = timezone.now()
+    if shards <= 0:
+        user_ids = sorted(deltas)
+        PairingCounter.objects.bulk_create([PairingCounter(user_id=u) for u in user_ids], ignore_conflicts=True)
+        counts = {
+            user_id: (left, right)
+            for user_id, left, right in PairingCounter.objects.select_for_update()
+            .filter(user_id__in=user_ids)
+            .order_by("user_id")
+            .values_list("user_id", "left_count", "right_count")
+        }
+        for (left, right), ids in _grouped(deltas):
+            PairingCounter.objects.filter(user_id__in=ids).update(
+                left_count=F("left_count") + left, right_count=F("right_count") + right, updated_at=now
+            )
+        return counts
+    PairingCounter.objects.bulk_create(
+        [PairingCounter(user_id=u) for u in sorted(deltas)], ignore_conflicts=True
+    )
+    by_shard = defaultdict(dict)
+    for user_id, delta in deltas.items():
+        by_shard[rng.randrange(shards)][user_id] = delta
+    PairingCounterShard.objects.bulk_create(
+        [PairingCounterShard(user_id=u, shard=s) for s, part in by_shard.items() for u in part],
+        ignore_conflicts=True,
+    )
+    for shard, part in sorted(by_shard.items()):
+        list(
+            PairingCounterShard.objects.select_for_update()
+            .filter(shard=shard, user_id__in=list(part))
+            .order_by("user_id")
+            .values_list("id", flat=True)
+        )
+        for (left, right), ids in _grouped(part):
+            PairingCounterShard.objects.filter(shard=shard, user_id__in=ids).update(
+                left_delta=F("left_delta") + left, right_delta=F("right_delta") + right, updated_at=now
+            )
+
+
+def ready_user_ids(user_ids, shards=None):
+    """
+    Users among user_ids whose effective min(left, right) exceeds released_pairs. One query.
+    Run it after the incrementing transaction commits, not inside it: under SERIALIZABLE
+    the sum over every shard row would conflict with concurrent increments.
+    """
+    shards = shard_count() if shards is None else shards
+    qs = PairingCounter.objects.filter(user_id__in=user_ids)
+    if shards <= 0:
+        return list(
+            qs.filter(left_count__gt=F("released_pairs"), right_count__gt=F("released_pairs"))
+            .values_list("user_id", flat=True)
+        )
+    return list(
+        qs.annotate(
+            left=F("left_count") + Coalesce(Sum("user__counter_shards__left_delta"), Value(0)),
+            right=F("right_count") + Coalesce(Sum("user__counter_shards__right_delta"), Value(0)),
+        )
+        .filter(left__gt=F("released_pairs"), right__gt=F("released_pairs"))
+        .values_list("user_id", flat=True)
+    )
+
+
+def shard_deltas(user_filter):
+    """
+    {user_id: (left, right)} pending in shards for users matching user_filter (a list of
+    ids or a subquery of user ids). One query; {} without touching the database when
+    sharding is off.
+    """
+    if shard_count() <= 0:
+        return {}
+    rows = (
+        PairingCounterShard.objects.filter(user_id__in=user_filter)
+        .values_list("user_id")
+        .annotate(left=Sum("left_delta"), right=Sum("right_delta"))
+        .order_by()
+    )
+    return {user_id: (left, right) for user_id, left, right in rows}
+
+
+def add_shard_deltas(counters, user_filter=None):
+    """
+    Add pending shard deltas to PairingCounter instances in place ({user_id: counter}).
+    Pass user_filter (a subquery) for large sets instead of listing every id. Returns counters.
+    """
+    if not counters:
+        return counters
+    deltas = shard_deltas(list(counters) if user_filter is None else user_filter)
+    for user_id, (left, right) in deltas.items():
+        counter = counters.get(user_id)
+        if counter is not None:
+            counter.left_count += left
+            counter.right_count += right
+    return counters
+
+
+def fold_counter_shards(user_ids=None, chunk_size=5000, on_fold=None):
+    """
+    Move shard deltas into PairingCounter (all users, or only user_ids), chunk_size users
+    per transaction: lock the shard rows, add their sums to the counters with one UPDATE
+    per distinct delta, zero the shards. on_fold(user_ids) runs in that transaction after
+    the locks and before the counters change (tasks.engine.fold_shards numbers bonus event
+    units there). Every shard row of a folded user is locked, not only those with deltas:
+    an unlocked shard could commit an increment, and its events, that the fold would see
+    without folding its delta. So a fold reads PAIRING_COUNTER_SHARDS rows per user, and
+    waits for and briefly blocks that user's concurrent increments; for a hot user folded
+    on every release that is the price of striping. Returns the number of users folded.
+    """
+    pending = PairingCounterShard.objects.filter(Q(left_delta__gt=0) | Q(right_delta__gt=0))
+    if user_ids is not None:
+        pending = pending.filter(user_id__in=user_ids)
+    folded = 0
+    last_user_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                pending.filter(user_id__gt=last_user_id)
+                .order_by("user_id")
+                .values_list("user_id", flat=True)
+                .distinct()[:chunk_size]
+            )
+            if not batch:
+                return folded
+            rows = list(
+                PairingCounterShard.objects.select_for_update()
+                .filter(user_id__in=batch)
+                .order_by("user_id", "shard")
+                .values_list("id", "user_id", "left_delta", "right_delta")
+            )
+            deltas = defaultdict(lambda: [0, 0])
+            for _, user_id, left, right in rows:
+                deltas[user_id][0] += left
+                deltas[user_id][1] += right
+            if on_fold is not None:
+                on_fold(batch)
+            increment_counters(deltas, shards=0)
+            PairingCounterShard.objects.filter(id__in=[r[0] for r in rows]).update(left_delta=0, right_delta=0)
+        folded += len(batch)
+        last_user_id = batch[-1]
@@ -0,0 +1,107 @@
+"""
+Columnar subtree export for large downlines (GET dashboard/tree/?format=columnar).
+
+Instead of one JSON object per node, a subtree is sent as parallel arrays indexed by
+position (root first, then by depth): ids, user_ids, labels, parent_index (-1 for the
+root), lane (0 = L, 1 = R), depth (relative to the root), left_count, right_count,
+left_users_below, right_users_below. Rows are read with values_list, so no model
+instances are built.
+
+pack_columns() produces a binary variant (application/octet-stream), little-endian:
+    b"BTC1", uint32 count,
+    int64 ids[count], int64 user_ids[count], int32 parent_index[count], uint8 lane[count],
+    uint32 depth, left_count, right_count, left_users_below, right_users_below [count each],
+    uint32 labels_bytes, UTF-8 labels joined by "\\n".
+"""
+import struct
+import sys
+from array import array
+
+from .counters import shard_deltas
+from .models import PairingCounter
+from .repository import subtree_queryset
+
+PACKED_MAGIC = b"BTC1"
+
+# (column, array typecode) in packed order; labels follow as a length-prefixed blob.
+PACKED_COLUMNS = (
+    ("ids", "q"),
+    ("user_ids", "q"),
+    ("parent_index", "i"),
+    ("lane", "B"),
+    ("depth", "I"),
+    ("left_count", "I"),
+    ("right_count", "I"),
+    ("left_users_below", "I"),
+    ("right_users_below", "I"),
+)
+
+
+def subtree_columns(root):
+    """Parallel arrays for root's subtree. Two queries (nodes, counters), plus striped deltas if on."""
+    rows = list(
+        subtree_queryset(root.id)
+        .order_by("depth", "lane", "id")
+        .values_list("id", "parent_id", "lane", "depth", "left_size", "right_size", "user_id", "user__email")
+    )
+    counters = {
+        user_id: (left, right)
+        for user_id, left, right in PairingCounter.objects.filter(
+            user__tree_node__in=subtree_queryset(root.id).values("id")
+        ).values_list("user_id", "left_count", "right_count")
+    }
+    for user_id, (left, right) in shard_deltas(subtree_queryset(root.id).values("user_id")).items():
+        base_left, base_right = counters.get(user_id, (0, 0))
+        counters[user_id] = (base_left + left, base_right + right)
+    index = {}
+    cols = {name: [] for name, _ in PACKED_COLUMNS}
+    cols["labels"] = []
+    for i, (node_id, parent_id, lane, depth, left_size, right_size, user_id, email) in enumerate(rows):
+        index[node_id] = i
+        left, right = counters.get(user_id, (0, 0))
+        cols["ids"].append(node_id)
+        cols["user_ids"].append(user_id)
+        cols["labels"].append(email or f"User {user_id}")
+        cols["parent_index"].append(index.get(parent_id, -1) if node_id != root.id else -1)
+        cols["lane"].append(0 if lane == "L" else 1)
+        cols["depth"].append(depth - root.depth)
+        cols["left_count"].append(left)
+        cols["right_count"].append(right)
+        cols["left_users_below"].append(left_size)
+        cols["right_users_below"].append(right_size)
+    return cols
+
+
+def pack_columns(cols):
+    """Binary packed-array encoding of subtree_columns() output (see module docstring)."""
+    count = len(cols["ids"])
+    parts = [PACKED_MAGIC, struct.pack("<I", count)]
+    for name, typecode in PACKED_COLUMNS:
+        arr = array(typecode, cols[name])
+        if sys.byteorder != "little":
+            arr.byteswap()
+        parts.append(arr.tobytes())
+    labels = "\n".join(cols["labels"]).encode("utf-8")
+    parts += [struct.pack("<I", len(labels)), labels]
+    return b"".join(parts)
+
+
+def unpack_columns(data):
+    """Inverse of pack_columns (used by tests and Python clients)."""
+    if data[:4] != PACKED_MAGIC:
+        raise ValueError("Not a packed subtree.")
+    (count,) = struct.unpack_from("<I", data, 4)
+    pos = 8
+    cols = {}
+    for name, typecode in PACKED_COLUMNS:
+        arr = array(typecode)
+        size = arr.itemsize * count
+        arr.frombytes(data[pos:pos + size])
+        if sys.byteorder != "little":
+            arr.byteswap()
+        cols[name] = arr.tolist()
+        pos += size
+    (label_len,) = struct.unpack_from("<I", data, pos)
+    labels = data[pos + 4:pos + 4 + label_len].decode("utf-8")
+    cols["labels"] = labels.split("\n") if count else []
+    return cols
@@ -0,0 +1,102 @@
+"""
+Tidy layout for binary subtrees (Reingold-Tilford style), computed on the server.
+
+x is in node-spacing units with the subtree root at 0 (left lane negative); y is the number
+of levels below the root. Siblings are pushed apart just enough that their subtrees keep at
+least one unit between them on every level; a lone child sits half a unit toward its lane.
+
+Each subtree keeps its left/right contour (min/max x per level, stored deepest level first
+with a lazy shift), and merging reuses the taller child's contour, so the cost is linear for
+complete and chain-like trees and O(n log n) in the worst case. No recursion.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+class _Contour:
+    __slots__ = ("mins", "maxs", "shift")
+
+    def __init__(self):
+        self.mins = [0.0]
+        self.maxs = [0.0]
+        self.shift = 0.0
+
+    def __len__(self):
+        return len(self.mins)
+
+    def level(self, j):
+        """(min, max) of level j below this subtree's root, relative to the root."""
+        i = len(self.mins) - 1 - j
+        return self.mins[i] + self.shift, self.maxs[i] + self.shift
+
+
+def _separation(left, right):
+    """Smallest distance between the two child roots so that no level overlaps."""
+    gap = 1.0
+    for j in range(min(len(left), len(right))):
+        gap = max(gap, left.level(j)[1] - right.level(j)[0] + 1.0)
+    return gap
+
+
+def _merge(left, left_off, right, right_off):
+    """Contour of a parent whose children sit at the given offsets (either may be None)."""
+    parts = [(c, off) for c, off in ((left, left_off), (right, right_off)) if c is not None]
+    parts.sort(key=lambda p: len(p[0]), reverse=True)
+    tall, tall_off = parts[0]
+    tall.shift += tall_off
+    if len(parts) == 2:
+        short, short_off = parts[1]
+        for j in range(len(short)):
+            i = len(tall.mins) - 1 - j
+            lo, hi = short.level(j)
+            tall.mins[i] = min(tall.mins[i], lo + short_off - tall.shift)
+            tall.maxs[i] = max(tall.maxs[i], hi + short_off - tall.shift)
+    tall.mins.append(-tall.shift)
+    tall.maxs.append(-tall.shift)
+    return tall
+
+
+def tidy_layout(subtree):
+    """{node_id: (x, y)} for every node of a loaded Subtree (see tree.repository)."""
+    offset = {}
+    contour = {}
+    # subtree.nodes is ordered by depth, so reversed order visits children before parents.
+    for n in reversed(subtree.nodes):
+        left = subtree.child(n, "L")
+        right = subtree.child(n, "R")
+        lc = contour.pop(left.id) if left else None
+        rc = contour.pop(right.id) if right else None
+        if lc is None and rc is None:
+            contour[n.id] = _Contour()
+            continue
+        half = _separation(lc, rc) / 2 if lc and rc else 0.5
+        if left:
+            offset[left.id] = -half
+        if right:
+            offset[right.id] = half
+        contour[n.id] = _merge(lc, -half, rc, half)
+
+    root = subtree.root
+    pos = {root.id: (0.0, 0)}
+    for n in subtree.nodes:
+        if n.id == root.id:
+            continue
+        x, _ = pos[n.parent_id]
+        pos[n.id] = (x + offset[n.id], n.depth - root.depth)
+    return pos
+
+
+def subtree_version(root):
+    """Structure version of root's subtree: placement is immutable, so its size identifies it."""
+    return root.left_size + root.right_size
+
+
+def cached_layout(subtree):
+    """tidy_layout cached per (root node, subtree version)."""
+    root = subtree.root
+    key = f"tree-layout:{root.id}:{subtree_version(root)}"
+    pos = cache.get(key)
+    if pos is None:
+        pos = tidy_layout(subtree)
+        cache.set(key, pos, getattr(settings, "TREE_LAYOUT_CACHE_SECONDS", 3600))
+    return pos
@@ -0,0 +1,135 @@
+"""
+Generate a large synthetic referral tree for benchmarking.
+
+Creates N users (unusable passwords), tree nodes under a new root, open slots, pairing
+counters and the closure table. The shape is built in memory first (compact arrays),
+then written with chunked bulk inserts using pre-assigned primary keys, so referred_by,
+parent_id, path and subtree sizes are known up front and nothing is updated afterwards.
+
+Shapes (tree/shapes.py): full, random, skewed (left lane with probability --skew) and
+powerlaw.
+
+Usage:
+  python manage.py generate_tree --nodes 1000000 --shape random
+  python manage.py generate_tree --nodes 200000 --shape powerlaw --counter-max 50 --prefix bench
+
+Do not run it while the app is placing users: ids are assigned by the command and the
+sequences are reset at the end.
+"""
+import random
+import time
+from array import array
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from tree.management.commands.rebuild_tree_closure import rebuild_closure
+from tree.models import OpenSlot, PairingCounter, TreeNode
+from tree.shapes import LANE_CHARS, LEFT, RIGHT, SHAPES, build_shape, subtree_sizes
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Generate a large synthetic tree (users, nodes, slots, counters, closure) for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--nodes", type=int, required=True, help="Number of users/nodes to create (root included).")
+        parser.add_argument("--shape", choices=SHAPES, default="random", help="Tree shape (default: random).")
+        parser.add_argument(
+            "--skew", type=float, default=0.75, help="Left-lane probability for --shape skewed (default 0.75)."
+        )
+        parser.add_argument("--seed", type=int, default=42, help="Random seed (default 42).")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows per bulk insert (default 5000).")
+        parser.add_argument(
+            "--prefix", type=str, default="synth", help="Email prefix, e.g. synth-17@synthetic.example."
+        )
+        parser.add_argument(
+            "--counter-max",
+            type=int,
+            default=0,
+            help="If > 0, pairing counters get random left/right counts in [0, counter-max].",
+        )
+        parser.add_argument("--skip-closure", action="store_true", help="Do not rebuild tree_closure afterwards.")
+
+    def handle(self, *args, **options):
+        n = options["nodes"]
+        shape = options["shape"]
+        chunk = max(1, options["chunk_size"])
+        prefix = options["prefix"]
+        if n < 1:
+            raise CommandError("--nodes must be at least 1.")
+        if shape == "skewed" and not 0 < options["skew"] < 1:
+            raise CommandError("--skew must be between 0 and 1 (exclusive).")
+        if User.objects.filter(email__startswith=f"{prefix}-", email__endswith="@synthetic.example").exists():
+            raise CommandError(f"Users with prefix {prefix!r} already exist; pick another --prefix.")
+        rng = random.Random(options["seed"])
+
+        started = time.monotonic()
+        parent, lane, sponsor = build_shape(shape, n, rng, options["skew"])
+        left, right = subtree_sizes(parent, lane)
+        self.stdout.write(f"Built {shape} shape for {n} nodes in {time.monotonic() - started:.1f}s.")
+
+        with transaction.atomic():
+            self._write(n, parent, lane, sponsor, left, right, chunk, prefix, options["counter_max"], rng)
+            if not options["skip_closure"]:
+                t = time.monotonic()
+                with connection.cursor() as cursor:
+                    rows = rebuild_closure(cursor)
+                self.stdout.write(f"Rebuilt tree_closure ({rows} rows) in {time.monotonic() - t:.1f}s.")
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [User, TreeNode, OpenSlot]):
+                    cursor.execute(sql)
+        self.stdout.write(self.style.SUCCESS(f"Generated {n} nodes in {time.monotonic() - started:.1f}s."))
+
+    def _write(self, n, parent, lane, sponsor, left, right, chunk, prefix, counter_max, rng):
+        user_base = (User.objects.aggregate(m=Max("id"))["m"] or 0) + 1
+        node_base = (TreeNode.objects.aggregate(m=Max("id"))["m"] or 0) + 1
+        has_child = bytearray(n)  # bit 1: left child, bit 2: right child
+        for i in range(1, n):
+            has_child[parent[i]] |= 1 << lane[i]
+        depth = array("I", [0]) * n
+        paths = [""] * n
+        t = time.monotonic()
+        for start in range(0, n, chunk):
+            end = min(n, start + chunk)
+            users, nodes, slots, counters = [], [], [], []
+            for i in range(start, end):
+                p = parent[i]
+                if p < 0:
+                    paths[i] = f"{user_base + i}:"
+                else:
+                    depth[i] = depth[p] + 1
+                    paths[i] = paths[p] + LANE_CHARS[lane[i]]
+                email = f"{prefix}-{i}@synthetic.example"
+                users.append(User(
+                    id=user_base + i,
+                    username=email,
+                    email=email,
+                    password="!",
+                    referred_by_id=user_base + sponsor[i] if sponsor[i] >= 0 else None,
+                ))
+                nodes.append(TreeNode(
+                    id=node_base + i,
+                    user_id=user_base + i,
+                    parent_id=node_base + p if p >= 0 else None,
+                    lane=LANE_CHARS[lane[i]] if p >= 0 else "L",
+                    depth=depth[i],
+                    path=paths[i],
+                    left_size=left[i],
+                    right_size=right[i],
+                ))
+                for side in (LEFT, RIGHT):
+                    if not has_child[i] & (1 << side):
+                        slots.append(OpenSlot.below(nodes[-1], LANE_CHARS[side]))
+                counters.append(PairingCounter(
+                    user_id=user_base + i,
+                    left_count=rng.randint(0, counter_max) if counter_max else 0,
+                    right_count=rng.randint(0, counter_max) if counter_max else 0,
+                ))
+            User.objects.bulk_create(users)
+            TreeNode.objects.bulk_create(nodes)
+            OpenSlot.objects.bulk_create(slots)
+            PairingCounter.objects.bulk_create(counters)
+            self.stdout.write(f"  {end}/{n} nodes written ({time.monotonic() - t:.1f}s)")
@@ -0,0 +1,48 @@
+"""
+Place a user in the tree below a sponsor using the spillover placement engine.
+
+Usage:
+  python manage.py place_user --email new@example.com --sponsor root@example.com
+  python manage.py place_user --email new@example.com --sponsor root@example.com --strategy extreme_left
+"""
+from django.core.management.base import BaseCommand
+
+from tree.models import TreeNode
+from tree.placement import PlacementError, Strategy, place_user
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Place a user below a sponsor (shallowest free slot of the chosen leg)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--email", type=str, required=True, help="Email of the user to place.")
+        parser.add_argument("--sponsor", type=str, required=True, help="Email of the sponsor (already in the tree).")
+        parser.add_argument(
+            "--strategy",
+            type=str,
+            choices=Strategy.values,
+            default=Strategy.BALANCED,
+            help="Leg choice: extreme_left, extreme_right or balanced (default).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email__iexact=options["email"].strip())
+            sponsor_user = User.objects.get(email__iexact=options["sponsor"].strip())
+        except User.DoesNotExist:
+            self.stderr.write(self.style.ERROR("User or sponsor not found."))
+            return
+        try:
+            sponsor = sponsor_user.tree_node
+        except TreeNode.DoesNotExist:
+            self.stderr.write(self.style.ERROR(f"Sponsor {sponsor_user.email!r} is not in the tree."))
+            return
+        try:
+            node = place_user(user, sponsor, options["strategy"])
+        except PlacementError as e:
+            self.stderr.write(self.style.ERROR(str(e)))
+            return
+        self.stdout.write(
+            self.style.SUCCESS(f"Placed {user.email} under node {node.parent_id} (lane={node.lane}, depth={node.depth}).")
+        )
@@ -0,0 +1,53 @@
+"""
+Rebuild tree_open_slots from the current tree.
+
+Slots are normally maintained on insert; use this after bulk loads or to repair.
+Streams nodes that lack a child on each lane and inserts their slots in batches,
+so memory stays flat.
+
+Usage:
+  python manage.py rebuild_open_slots
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+# Nodes with no child on lane %s, in id order. run_base (see OpenSlot) is computed in Python.
+FREE_LANE_SQL = """
+    SELECT n.id, n.depth, n.path FROM tree_nodes n
+    WHERE NOT EXISTS (
+        SELECT 1 FROM tree_nodes c WHERE c.parent_id = n.id AND c.lane = %s
+    )
+    ORDER BY n.id
+"""
+
+INSERT_SQL = """
+    INSERT INTO tree_open_slots (parent_id, lane, depth, path, run_base)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+
+def rebuild_open_slots(cursor, batch_size=5000):
+    """Repopulate tree_open_slots. Returns the number of slots."""
+    cursor.execute("DELETE FROM tree_open_slots")
+    total = 0
+    with connection.cursor() as reader:
+        for lane in ("L", "R"):
+            reader.execute(FREE_LANE_SQL, [lane])
+            while rows := reader.fetchmany(batch_size):
+                params = [
+                    (node_id, lane, depth + 1, path + lane, (path + lane).rstrip(lane))
+                    for node_id, depth, path in rows
+                ]
+                cursor.executemany(INSERT_SQL, params)
+                total += len(params)
+    return total
+
+
+class Command(BaseCommand):
+    help = "Rebuild tree_open_slots (free L/R positions used by the placement engine)."
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            slots = rebuild_open_slots(cursor)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt open slots: {slots} free positions."))
@@ -0,0 +1,49 @@
+"""
+Rebuild the tree_closure table from parent pointers.
+
+Closure rows are normally written on insert; use this after bulk loads or to repair.
+One INSERT ... SELECT per distance (at most CLOSURE_MAX_DISTANCE + 1 statements).
+
+Usage:
+  python manage.py rebuild_tree_closure
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from tree.models import CLOSURE_MAX_DISTANCE, TreeClosure
+
+SELF_ROWS_SQL = """
+    INSERT INTO tree_closure (ancestor_id, descendant_id, distance, lane)
+    SELECT id, id, 0, NULL FROM tree_nodes
+"""
+
+# Rows at distance %s for every node, derived from its parent's rows one level closer.
+NEXT_LEVEL_SQL = """
+    INSERT INTO tree_closure (ancestor_id, descendant_id, distance, lane)
+    SELECT c.ancestor_id, n.id, c.distance + 1, COALESCE(c.lane, n.lane)
+    FROM tree_nodes n
+    JOIN tree_closure c ON c.descendant_id = n.parent_id AND c.distance = %s
+"""
+
+
+def rebuild_closure(cursor, max_distance=CLOSURE_MAX_DISTANCE):
+    """Repopulate tree_closure with set-based inserts. Returns the number of rows."""
+    cursor.execute("DELETE FROM tree_closure")
+    cursor.execute(SELF_ROWS_SQL)
+    total = cursor.rowcount
+    for distance in range(max_distance):
+        cursor.execute(NEXT_LEVEL_SQL, [distance])
+        if cursor.rowcount == 0:
+            break
+        total += cursor.rowcount
+    return total
+
+
+class Command(BaseCommand):
+    help = f"Rebuild tree_closure (ancestor/descendant pairs up to {CLOSURE_MAX_DISTANCE} levels apart)."
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            rows = rebuild_closure(cursor)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt tree_closure: {rows} rows ({TreeClosure._meta.db_table})."))
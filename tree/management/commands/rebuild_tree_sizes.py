@@ -0,0 +1,42 @@
+"""
+Recompute TreeNode.left_size / right_size for the whole tree.
+
+Sizes are normally maintained on insert; use this after bulk loads or to repair drift.
+Works bottom-up, one set-based UPDATE per depth level, so memory stays flat.
+
+Usage:
+  python manage.py rebuild_tree_sizes
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from tree.models import TreeNode
+
+
+def rebuild_subtree_sizes(node_model=TreeNode):
+    """Recompute sizes level by level from the deepest nodes up. Returns the number of levels."""
+    max_depth = node_model.objects.aggregate(m=Max("depth"))["m"]
+    if max_depth is None:
+        return 0
+    children = node_model.objects.filter(parent=OuterRef("pk")).annotate(
+        size=F("left_size") + F("right_size") + 1,
+    )
+    left = Subquery(children.filter(lane="L").values("size")[:1])
+    right = Subquery(children.filter(lane="R").values("size")[:1])
+    for depth in range(max_depth, -1, -1):
+        node_model.objects.filter(depth=depth).update(
+            left_size=Coalesce(left, Value(0)),
+            right_size=Coalesce(right, Value(0)),
+        )
+    return max_depth + 1
+
+
+class Command(BaseCommand):
+    help = "Recompute left_size/right_size on every tree node (bottom-up, one UPDATE per depth)."
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        levels = rebuild_subtree_sizes()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt subtree sizes over {levels} depth levels."))
@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
-from tree.models import TreeNode, PairingCounter
+from tree.models import OpenSlot, TreeNode, PairingCounter
 from users.models import User
 
 
@@ -40,6 +40,9 @@ class Command(BaseCommand):
 
         # Delete all nodes except the chosen root node.
         deleted_nodes, _ = TreeNode.objects.exclude(id=root_node.id).delete()
+        TreeNode.objects.filter(id=root_node.id).update(left_size=0, right_size=0)
+        OpenSlot.objects.filter(parent=root_node).delete()
+        OpenSlot.objects.bulk_create([OpenSlot.below(root_node, lane) for lane in TreeNode.Lane.values])
 
         # Optionally clean up PairingCounter for users no longer in the tree.
         PairingCounter.objects.exclude(user_id=root_node.user_id).delete()
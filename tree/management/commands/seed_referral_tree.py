@@ -14,6 +14,7 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 
 from tree.models import TreeNode, PairingCounter
+from tree.placement import PlacementError, open_lanes, place_user
 from users.models import User
 
 
@@ -29,12 +30,16 @@ def ensure_user(email: str, password: str = "demo1234"):
     return user
 
 
-def ensure_tree_node(user: User, parent: TreeNode | None, lane: str, depth: int) -> TreeNode:
-    node, created = TreeNode.objects.get_or_create(
-        user=user,
-        defaults={"parent": parent, "lane": lane, "depth": depth},
-    )
-    return node
+def ensure_tree_node(user: User, parent: TreeNode, lane: str) -> TreeNode | None:
+    """User's node, placed in parent's lane slot (tree.placement) if not in the tree yet; None if that slot is taken."""
+    try:
+        return user.tree_node
+    except TreeNode.DoesNotExist:
+        pass
+    try:
+        return place_user(user, parent, lane=lane)
+    except PlacementError:
+        return None
 
 
 def ensure_pairing_counter(user: User) -> PairingCounter:
@@ -92,17 +97,17 @@ class Command(BaseCommand):
             except TreeNode.DoesNotExist:
                 # Root exists but is another user; add our user as a child of that root
                 # Prefer right lane if free
+                free = open_lanes(existing_root)
                 for lane in ("R", "L"):
-                    if not TreeNode.objects.filter(parent=existing_root, lane=lane).exists():
-                        root_node = ensure_tree_node(root_user, existing_root, lane, existing_root.depth + 1)
-                        ensure_pairing_counter(root_user)
+                    if lane in free:
+                        root_node = ensure_tree_node(root_user, existing_root, lane)
                         self.stdout.write(self.style.SUCCESS(f"Added {root_user.email} to tree under existing root (lane={lane})."))
                         break
                 else:
                     self.stdout.write(self.style.WARNING("Existing root has both L and R children; no new root added."))
                     return
         else:
-            root_node = ensure_tree_node(root_user, None, "L", 0)
+            root_node = TreeNode.objects.create(user=root_user, parent=None, lane="L", depth=0)
             ensure_pairing_counter(root_user)
             self.stdout.write(self.style.SUCCESS(f"Created root node for {root_user.email}."))
 
@@ -111,12 +116,12 @@ class Command(BaseCommand):
             ("tree-left@example.com", "L"),
             ("tree-right@example.com", "R"),
         ]
+        free = open_lanes(root_node)
         for child_email, lane in placeholders:
-            if TreeNode.objects.filter(parent=root_node, lane=lane).exists():
+            if lane not in free:
                 continue
             child_user = ensure_user(child_email, password)
-            ensure_tree_node(child_user, root_node, lane, root_node.depth + 1)
-            ensure_pairing_counter(child_user)
+            ensure_tree_node(child_user, root_node, lane)
             self.stdout.write(f"  Added {child_email} under root (lane={lane}).")
 
         # Second level: 2 under left, 2 under right
@@ -124,18 +129,19 @@ class Command(BaseCommand):
         right_child = TreeNode.objects.filter(parent=root_node, lane="R").first()
         second_level: list[tuple[str, TreeNode, str]] = []
         if left_child:
+            free = open_lanes(left_child)
             for lane, addr in [("L", "tree-ll@example.com"), ("R", "tree-lr@example.com")]:
-                if not TreeNode.objects.filter(parent=left_child, lane=lane).exists():
+                if lane in free:
                     second_level.append((addr, left_child, lane))
         if right_child:
+            free = open_lanes(right_child)
             for lane, addr in [("L", "tree-rl@example.com"), ("R", "tree-rr@example.com")]:
-                if not TreeNode.objects.filter(parent=right_child, lane=lane).exists():
+                if lane in free:
                     second_level.append((addr, right_child, lane))
 
         for child_email, parent_node, lane in second_level:
             child_user = ensure_user(child_email, password)
-            ensure_tree_node(child_user, parent_node, lane, parent_node.depth + 1)
-            ensure_pairing_counter(child_user)
+            ensure_tree_node(child_user, parent_node, lane)
             self.stdout.write(f"  Added {child_email} (depth={parent_node.depth + 1}, lane={lane}).")
 
         # Levels 3–5: recursively add children under every node at depth 2 (then their descendants)
@@ -143,15 +149,16 @@ class Command(BaseCommand):
             depth = parent.depth + 1
             if depth > max_depth:
                 return
+            free = open_lanes(parent)
             for lane, suffix in [("L", "l"), ("R", "r")]:
-                if TreeNode.objects.filter(parent=parent, lane=lane).exists():
+                if lane not in free:
                     continue
                 child_email = f"tree-{prefix}{suffix}@example.com"
                 child_user = ensure_user(child_email, password)
-                ensure_tree_node(child_user, parent, lane, depth)
-                ensure_pairing_counter(child_user)
+                child_node = ensure_tree_node(child_user, parent, lane)
+                if child_node is None:
+                    continue
                 self.stdout.write(f"  Added {child_email} (depth={depth}, lane={lane}).")
-                child_node = child_user.tree_node
                 add_children_under(child_node, prefix + suffix, max_depth)
 
         # All nodes at depth 2 (under root's L and R children)
@@ -166,7 +173,7 @@ class Command(BaseCommand):
             if root_counter.left_count == 0 and root_counter.right_count == 0:
                 root_counter.left_count = TreeNode.objects.filter(parent=root_node, lane="L").count() or 1
                 root_counter.right_count = TreeNode.objects.filter(parent=root_node, lane="R").count() or 1
-                root_counter.save(update_fields=["left_count", "right_count"])
+                root_counter.save(update_fields=["left_count", "right_count", "updated_at"])
                 self.stdout.write("  Updated root pairing counts for display.")
         except PairingCounter.DoesNotExist:
             pass
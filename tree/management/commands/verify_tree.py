@@ -0,0 +1,188 @@
+"""
+Verify tree invariants with bounded memory, reporting violations as NDJSON.
+
+Checks, streaming tree_nodes in id-ordered chunks:
+- root:  a node without parent has depth 0 and path "<user id>:".
+- depth: depth == parent.depth + 1.
+- path:  path == parent.path + lane, lane is L or R.
+- sizes: left_size/right_size == 1 + size of the child on that lane (0 if none).
+- lanes: no parent has two children on the same lane (one aggregate query).
+Cycles need no separate pass: along a cycle depth would have to increase at every step
+and come back to where it started, so any cycle shows up as a depth violation.
+
+--workers N splits the nodes by path prefix at --split-depth (top-level legs by default)
+and verifies the partitions in a process pool, each streamed in (path, id) chunks off the
+path order index; nodes above the split are checked in the main process. A coverage check
+reports nodes that no partition reached (broken paths).
+
+Usage:
+  python manage.py verify_tree
+  python manage.py verify_tree --workers 4 --split-depth 2 --output violations.ndjson
+"""
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count, Q
+
+from tree.models import TreeNode
+from tree.repository import path_key, path_prefix_range
+
+NODE_FIELDS = (
+    "id", "user_id", "parent_id", "lane", "depth", "path", "left_size", "right_size",
+    "parent__depth", "parent__path",
+)
+
+
+def _node_violations(row, child_sizes):
+    node_id, user_id, parent_id, lane, depth, path, left_size, right_size, parent_depth, parent_path = row
+    if parent_id is None:
+        if depth != 0:
+            yield {"node_id": node_id, "check": "root", "field": "depth", "expected": 0, "actual": depth}
+        if path != f"{user_id}:":
+            yield {"node_id": node_id, "check": "root", "field": "path", "expected": f"{user_id}:", "actual": path}
+    else:
+        if depth != parent_depth + 1:
+            yield {"node_id": node_id, "check": "depth", "expected": parent_depth + 1, "actual": depth}
+        if lane not in TreeNode.Lane.values or path != f"{parent_path}{lane}":
+            yield {"node_id": node_id, "check": "path", "expected": f"{parent_path}{lane}", "actual": path}
+    for side, actual in (("L", left_size), ("R", right_size)):
+        expected = child_sizes.get((node_id, side), 0)
+        if actual != expected:
+            yield {"node_id": node_id, "check": "sizes", "lane": side, "expected": expected, "actual": actual}
+
+
+def _chunks(qs, prefix, chunk_size):
+    """
+    Row chunks of qs: keyed on id, or with prefix on (path, id) within the prefix's path
+    range, so every chunk of a partition is one range scan of the path order index.
+    """
+    if prefix is None:
+        last_id = 0
+        while rows := list(qs.filter(id__gt=last_id).order_by("id").values_list(*NODE_FIELDS)[:chunk_size]):
+            yield rows
+            last_id = rows[-1][0]
+        return
+    low, high = path_prefix_range(prefix)
+    qs = qs.alias(key=path_key()).filter(key__gte=low, key__lt=high).order_by("key", "id")
+    after = Q()
+    while rows := list(qs.filter(after).values_list(*NODE_FIELDS)[:chunk_size]):
+        yield rows
+        node_id, path = rows[-1][0], rows[-1][5]
+        after = Q(key__gt=path) | Q(key=path, id__gt=node_id)
+
+
+def verify_nodes(qs, chunk_size=5000, max_violations=10000, prefix=None):
+    """
+    Stream qs (in id order, or only the nodes under path prefix in (path, id) order) and
+    check every node. Returns (scanned, violation_count, violations), keeping at most
+    max_violations violation records in memory.
+    """
+    scanned = count = 0
+    violations = []
+    for rows in _chunks(qs, prefix, chunk_size):
+        child_sizes = {
+            (parent_id, lane): 1 + left + right
+            for parent_id, lane, left, right in TreeNode.objects.filter(
+                parent_id__in=[r[0] for r in rows]
+            ).values_list("parent_id", "lane", "left_size", "right_size")
+        }
+        for row in rows:
+            for v in _node_violations(row, child_sizes):
+                count += 1
+                if len(violations) < max_violations:
+                    violations.append(v)
+        scanned += len(rows)
+    return scanned, count, violations
+
+
+def _init_worker():
+    django.setup()
+    connections.close_all()
+
+
+def _verify_partition(args):
+    prefix, chunk_size, max_violations = args
+    return prefix, *verify_nodes(TreeNode.objects.all(), chunk_size, max_violations, prefix=prefix)
+
+
+class Command(BaseCommand):
+    help = "Stream tree_nodes and verify depth/path/lane/size invariants; violations as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Nodes per query (default 5000).")
+        parser.add_argument("--workers", type=int, default=1, help="Process pool size (default 1: no pool).")
+        parser.add_argument(
+            "--split-depth",
+            type=int,
+            default=1,
+            help="With --workers, partition by path prefix at this depth (1 = top-level legs).",
+        )
+        parser.add_argument("--max-violations", type=int, default=10000, help="Violations kept per partition.")
+        parser.add_argument("--output", type=str, default=None, help="Write NDJSON here instead of stdout.")
+
+    def handle(self, *args, **options):
+        chunk = max(1, options["chunk_size"])
+        limit = options["max_violations"]
+        out = open(options["output"], "w", encoding="utf-8") if options["output"] else self.stdout
+        try:
+            scanned, count = self._run(options["workers"], max(1, options["split_depth"]), chunk, limit, out)
+        finally:
+            if options["output"]:
+                out.close()
+        summary = f"Verified {scanned} nodes: {count} violation(s)."
+        if count:
+            raise CommandError(summary)
+        self.stderr.write(self.style.SUCCESS(summary))
+
+    def _emit(self, out, violations):
+        for v in violations:
+            out.write(json.dumps(v, separators=(",", ":")) + "\n")
+
+    def _run(self, workers, split_depth, chunk, limit, out):
+        count = 0
+        duplicates = (
+            TreeNode.objects.filter(parent__isnull=False)
+            .values("parent_id", "lane")
+            .annotate(n=Count("id"))
+            .filter(n__gt=1)
+            .order_by()
+        )
+        for d in duplicates.iterator():
+            count += 1
+            self._emit(out, [{"node_id": d["parent_id"], "check": "lanes", "lane": d["lane"], "actual": d["n"]}])
+
+        if workers <= 1:
+            scanned, n, violations = verify_nodes(TreeNode.objects.all(), chunk, limit)
+            self._emit(out, violations)
+            return scanned, count + n
+
+        # Nodes above the split in this process; everything below it by path prefix in the pool.
+        scanned, n, violations = verify_nodes(TreeNode.objects.filter(depth__lt=split_depth), chunk, limit)
+        self._emit(out, violations)
+        count += n
+        prefixes = [
+            prefix
+            for path in TreeNode.objects.filter(parent__isnull=True).values_list("path", flat=True).iterator()
+            for prefix in self._prefixes(path, split_depth)
+        ]
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for _, part_scanned, n, violations in pool.map(_verify_partition, [(p, chunk, limit) for p in prefixes]):
+                scanned += part_scanned
+                count += n
+                self._emit(out, violations)
+        total = TreeNode.objects.count()
+        if scanned != total:
+            count += 1
+            self._emit(out, [{"check": "coverage", "expected": total, "actual": scanned}])
+        return scanned, count
+
+    @staticmethod
+    def _prefixes(root_path, depth):
+        prefixes = [root_path]
+        for _ in range(depth):
+            prefixes = [p + lane for p in prefixes for lane in TreeNode.Lane.values]
+        return prefixes
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:57
+
+from django.db import migrations, models
+from django.db.models import F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_sizes(apps, schema_editor):
+    TreeNode = apps.get_model("tree", "TreeNode")
+    max_depth = TreeNode.objects.aggregate(m=Max("depth"))["m"]
+    if max_depth is None:
+        return
+    children = TreeNode.objects.filter(parent=OuterRef("pk")).annotate(
+        size=F("left_size") + F("right_size") + 1,
+    )
+    left = Subquery(children.filter(lane="L").values("size")[:1])
+    right = Subquery(children.filter(lane="R").values("size")[:1])
+    for depth in range(max_depth, -1, -1):
+        TreeNode.objects.filter(depth=depth).update(
+            left_size=Coalesce(left, Value(0)),
+            right_size=Coalesce(right, Value(0)),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tree', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treenode',
+            name='left_size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='treenode',
+            name='right_size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_sizes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import CharField, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat
+
+
+def backfill_paths(apps, schema_editor):
+    """Top-down, one UPDATE per depth level: root is "<user id>:", children append their lane."""
+    TreeNode = apps.get_model("tree", "TreeNode")
+    max_depth = TreeNode.objects.aggregate(m=Max("depth"))["m"]
+    if max_depth is None:
+        return
+    TreeNode.objects.filter(parent__isnull=True).update(
+        path=Concat(Cast("user_id", CharField()), Value(":")),
+    )
+    parent_path = Subquery(TreeNode.objects.filter(pk=OuterRef("parent_id")).values("path")[:1])
+    for depth in range(1, max_depth + 1):
+        TreeNode.objects.filter(depth=depth, parent__isnull=False).update(
+            path=Concat(parent_path, F("lane")),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tree', '0002_subtree_sizes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treenode',
+            name='path',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='treenode',
+            index=models.Index(fields=['path'], name='idx_tree_path', opclasses=['text_pattern_ops']),
+        ),
+    ]
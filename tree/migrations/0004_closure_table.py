@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_closure(apps, schema_editor):
+    """Self rows, then one INSERT ... SELECT per distance up to the cutoff (15)."""
+    schema_editor.execute(
+        "INSERT INTO tree_closure (ancestor_id, descendant_id, distance, lane) "
+        "SELECT id, id, 0, NULL FROM tree_nodes"
+    )
+    for distance in range(15):
+        schema_editor.execute(
+            "INSERT INTO tree_closure (ancestor_id, descendant_id, distance, lane) "
+            "SELECT c.ancestor_id, n.id, c.distance + 1, COALESCE(c.lane, n.lane) "
+            "FROM tree_nodes n JOIN tree_closure c ON c.descendant_id = n.parent_id AND c.distance = %s",
+            params=[distance],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tree', '0003_materialized_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreeClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.PositiveSmallIntegerField()),
+                ('lane', models.CharField(blank=True, choices=[('L', 'Left'), ('R', 'Right')], max_length=1, null=True)),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='tree.treenode')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='tree.treenode')),
+            ],
+            options={
+                'db_table': 'tree_closure',
+                'indexes': [models.Index(fields=['descendant', 'distance'], name='idx_closure_upline'), models.Index(fields=['ancestor', 'distance', 'lane'], name='idx_closure_downline')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='tree_closure_unique_pair')],
+            },
+        ),
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
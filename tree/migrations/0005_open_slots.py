@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_slots(apps, schema_editor):
+    """One slot per missing (node, lane) child, streamed in id order."""
+    TreeNode = apps.get_model("tree", "TreeNode")
+    OpenSlot = apps.get_model("tree", "OpenSlot")
+    taken = set(TreeNode.objects.filter(parent__isnull=False).values_list("parent_id", "lane"))
+    batch = []
+    for node_id, depth, path in TreeNode.objects.order_by("id").values_list("id", "depth", "path").iterator():
+        for lane in ("L", "R"):
+            if (node_id, lane) in taken:
+                continue
+            slot_path = path + lane
+            batch.append(OpenSlot(
+                parent_id=node_id, lane=lane, depth=depth + 1, path=slot_path, run_base=slot_path.rstrip(lane),
+            ))
+        if len(batch) >= 5000:
+            OpenSlot.objects.bulk_create(batch)
+            batch = []
+    OpenSlot.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tree', '0004_closure_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpenSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lane', models.CharField(choices=[('L', 'Left'), ('R', 'Right')], max_length=1)),
+                ('depth', models.PositiveIntegerField()),
+                ('path', models.TextField()),
+                ('run_base', models.TextField()),
+                ('parent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='open_slots', to='tree.treenode')),
+            ],
+            options={
+                'db_table': 'tree_open_slots',
+                'indexes': [models.Index(fields=['run_base', 'lane'], name='idx_open_slot_edge')],
+                'constraints': [models.UniqueConstraint(fields=('parent', 'lane'), name='tree_open_slot_unique_parent_lane')],
+            },
+        ),
+        migrations.RunPython(backfill_slots, migrations.RunPython.noop),
+    ]
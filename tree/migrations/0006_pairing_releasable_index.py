@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tree', '0005_open_slots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pairingcounter',
+            index=models.Index(condition=models.Q(('left_count__gt', models.F('released_pairs')), ('right_count__gt', models.F('released_pairs'))), fields=['user'], name='idx_pairing_releasable'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tree', '0006_pairing_releasable_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PairingCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('left_delta', models.PositiveIntegerField(default=0)),
+                ('right_delta', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'pairing_counter_shards',
+                'constraints': [models.UniqueConstraint(fields=('user', 'shard'), name='pairing_counter_shard_unique')],
+            },
+        ),
+    ]
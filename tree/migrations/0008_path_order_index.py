@@ -0,0 +1,26 @@
+from django.db import migrations
+
+# Postgres only: SQLite compares paths bytewise already, so idx_tree_path serves the sort.
+CREATE_SQL = 'CREATE INDEX IF NOT EXISTS idx_tree_path_order ON tree_nodes ((path COLLATE "C"), id)'
+DROP_SQL = "DROP INDEX IF EXISTS idx_tree_path_order"
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tree', '0007_pairing_counter_shards'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
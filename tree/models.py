@@ -1,10 +1,32 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+# Closure rows are kept only this many levels apart (the hierarchy bonus cutoff).
+CLOSURE_MAX_DISTANCE = 15
+
+# Ancestors of node %s whose path down to the node leaves them through lane %s.
+_UPLINE_BY_LANE_SQL = """
+    WITH RECURSIVE upline(id, lane) AS (
+        SELECT parent_id, lane FROM tree_nodes WHERE id = %s
+        UNION ALL
+        SELECT t.parent_id, t.lane FROM tree_nodes t JOIN upline u ON t.id = u.id
+        WHERE t.parent_id IS NOT NULL
+    )
+    SELECT id FROM upline WHERE lane = %s
+"""
 
 
 class TreeNode(models.Model):
     """
     Binary tree placement. parent and lane are immutable after insert.
+    left_size/right_size count the nodes below each lane; they are bumped along
+    the ancestor path in the same transaction that inserts a node.
+
+    path is the root-to-node route, "<root user id>:" followed by one L/R per level
+    (e.g. "7:LRR" is depth 3). It is set on insert and never rewritten, so ancestors
+    are path prefixes and descendants share this node's path as a prefix.
     """
     class Lane(models.TextChoices):
         L = "L", "Left"
@@ -25,6 +47,9 @@ class TreeNode(models.Model):
     )
     lane = models.CharField(max_length=1, choices=Lane.choices)
     depth = models.PositiveIntegerField()
+    left_size = models.PositiveIntegerField(default=0)
+    right_size = models.PositiveIntegerField(default=0)
+    path = models.TextField(editable=False, default="")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -38,11 +63,134 @@ class TreeNode(models.Model):
         indexes = [
             models.Index(fields=["parent"], name="idx_tree_parent"),
             models.Index(fields=["depth"], name="idx_tree_depth"),
+            # text_pattern_ops lets Postgres use the index for path LIKE 'prefix%'.
+            models.Index(fields=["path"], name="idx_tree_path", opclasses=["text_pattern_ops"]),
+            # Postgres also gets idx_tree_path_order on (path COLLATE "C", id) for keyset
+            # pages in path order (migration 0008; tree.repository.path_key).
         ]
 
     def __str__(self):
         return f"{self.user_id} @ {self.lane} depth={self.depth}"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        if not self.path:
+            self.path = f"{self.parent.path}{self.lane}" if self.parent_id else f"{self.user_id}:"
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._grow_ancestors()
+            self._link_ancestors()
+            self._claim_slot()
+
+    def _grow_ancestors(self):
+        """Count this (new) node in left_size/right_size of every ancestor: two UPDATEs."""
+        if self.parent_id is None:
+            return
+        for lane, field in ((self.Lane.L, "left_size"), (self.Lane.R, "right_size")):
+            TreeNode.objects.filter(
+                id__in=RawSQL(_UPLINE_BY_LANE_SQL, [self.id, lane]),
+            ).update(**{field: F(field) + 1})
+
+    def _link_ancestors(self):
+        """Insert closure rows for this (new) node from its parent's rows: two queries."""
+        rows = [TreeClosure(ancestor_id=self.id, descendant_id=self.id, distance=0)]
+        if self.parent_id is not None:
+            upline = TreeClosure.objects.filter(
+                descendant_id=self.parent_id, distance__lt=CLOSURE_MAX_DISTANCE
+            ).values_list("ancestor_id", "distance", "lane")
+            rows += [
+                TreeClosure(
+                    ancestor_id=ancestor_id,
+                    descendant_id=self.id,
+                    distance=distance + 1,
+                    lane=lane or self.lane,
+                )
+                for ancestor_id, distance, lane in upline
+            ]
+        TreeClosure.objects.bulk_create(rows)
+
+    def _claim_slot(self):
+        """Remove the slot this node took and open both slots below it."""
+        if self.parent_id is not None:
+            OpenSlot.objects.filter(parent_id=self.parent_id, lane=self.lane).delete()
+        OpenSlot.objects.bulk_create([OpenSlot.below(self, lane) for lane in self.Lane.values])
+
+
+class TreeClosure(models.Model):
+    """
+    Ancestor/descendant pairs at most CLOSURE_MAX_DISTANCE levels apart, including
+    a distance-0 row per node. lane is the ancestor's leg that holds the descendant
+    (NULL on the self row). Rows are written once, when the descendant is placed.
+    """
+    ancestor = models.ForeignKey(
+        TreeNode,
+        on_delete=models.CASCADE,
+        related_name="descendant_links",
+    )
+    descendant = models.ForeignKey(
+        TreeNode,
+        on_delete=models.CASCADE,
+        related_name="ancestor_links",
+    )
+    distance = models.PositiveSmallIntegerField()
+    lane = models.CharField(max_length=1, choices=TreeNode.Lane.choices, null=True, blank=True)
+
+    class Meta:
+        db_table = "tree_closure"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ancestor", "descendant"],
+                name="tree_closure_unique_pair",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["descendant", "distance"], name="idx_closure_upline"),
+            models.Index(fields=["ancestor", "distance", "lane"], name="idx_closure_downline"),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} d={self.distance} lane={self.lane}"
+
+
+class OpenSlot(models.Model):
+    """
+    A free (parent, lane) position in the tree; rows are added for both lanes when a
+    node is placed and removed when the slot is taken.
+    path is the path a node placed here would get. run_base is path with its trailing
+    run of lane characters stripped, so the extreme-left/right slot below any node
+    is a single equality lookup on (run_base, lane).
+    """
+    parent = models.ForeignKey(
+        TreeNode,
+        on_delete=models.CASCADE,
+        related_name="open_slots",
+    )
+    lane = models.CharField(max_length=1, choices=TreeNode.Lane.choices)
+    depth = models.PositiveIntegerField()
+    path = models.TextField()
+    run_base = models.TextField()
+
+    class Meta:
+        db_table = "tree_open_slots"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["parent", "lane"],
+                name="tree_open_slot_unique_parent_lane",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["run_base", "lane"], name="idx_open_slot_edge"),
+        ]
+
+    def __str__(self):
+        return f"slot under {self.parent_id} @ {self.lane} depth={self.depth}"
+
+    @classmethod
+    def below(cls, node, lane):
+        path = f"{node.path}{lane}"
+        return cls(parent_id=node.id, lane=lane, depth=node.depth + 1, path=path, run_base=path.rstrip(lane))
+
 
 class PairingCounter(models.Model):
     """
@@ -62,6 +210,41 @@ class PairingCounter(models.Model):
 
     class Meta:
         db_table = "pairing_counters"
+        indexes = [
+            # Only counters with a pair waiting for release (tasks.engine.sweep_pair_releases).
+            models.Index(
+                fields=["user"],
+                name="idx_pairing_releasable",
+                condition=Q(left_count__gt=F("released_pairs"), right_count__gt=F("released_pairs")),
+            ),
+        ]
 
     def __str__(self):
         return f"user={self.user_id} L={self.left_count} R={self.right_count} pairs={self.released_pairs}"
+
+
+class PairingCounterShard(models.Model):
+    """
+    Striped lane increments for hot counters (settings.PAIRING_COUNTER_SHARDS > 0): each
+    purchase adds to one random shard row instead of the user's single PairingCounter row.
+    Effective counts are PairingCounter plus the sum of the user's shard deltas;
+    tree.counters.fold_counter_shards moves the deltas back into PairingCounter.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="counter_shards",
+    )
+    shard = models.PositiveSmallIntegerField()
+    left_delta = models.PositiveIntegerField(default=0)
+    right_delta = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "pairing_counter_shards"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "shard"], name="pairing_counter_shard_unique"),
+        ]
+
+    def __str__(self):
+        return f"user={self.user_id} shard={self.shard} +L={self.left_delta} +R={self.right_delta}"
@@ -0,0 +1,103 @@
+"""
+Spillover placement: put a new user in the first free slot of a sponsor's leg.
+
+Strategies:
+- extreme_left / extreme_right: bottom of the sponsor's outer left/right edge; a single
+  equality lookup on the open-slot index (OpenSlot.run_base, lane).
+- balanced: go into the sponsor's lighter leg, then keep descending into the lighter side
+  (left_size/right_size) until that side is empty; one indexed lookup per level, and depth
+  stays logarithmic under this strategy.
+
+place_user(..., lane=...) claims one given slot instead (seeding, restores), through the
+same open-slot rows.
+
+Concurrent signups are serialized on the slot row (SELECT ... FOR UPDATE) and, as a last
+resort, by the tree_unique_parent_lane constraint: a lost race is retried on a fresh slot.
+A user placed concurrently fails the unique user instead and raises AlreadyPlaced at once.
+"""
+from django.db import IntegrityError, models, transaction
+
+from .models import OpenSlot, PairingCounter, TreeNode
+
+
+class Strategy(models.TextChoices):
+    EXTREME_LEFT = "extreme_left", "Extreme left"
+    EXTREME_RIGHT = "extreme_right", "Extreme right"
+    BALANCED = "balanced", "Balanced"
+
+
+class PlacementError(Exception):
+    """No slot could be claimed (user already placed, slot taken, or too many lost races)."""
+
+
+class AlreadyPlaced(PlacementError):
+    """The user already has a tree node; placement is permanent."""
+
+
+def _edge_slot(sponsor, lane):
+    return OpenSlot.objects.filter(run_base=sponsor.path.rstrip(lane), lane=lane).first()
+
+
+def _balanced_slot(sponsor):
+    node = sponsor
+    while True:
+        lane = TreeNode.Lane.L if node.left_size <= node.right_size else TreeNode.Lane.R
+        if (node.left_size if lane == TreeNode.Lane.L else node.right_size) == 0:
+            return OpenSlot.objects.filter(parent_id=node.id, lane=lane).first()
+        node = TreeNode.objects.only("id", "path", "left_size", "right_size").get(path=node.path + lane)
+
+
+def find_slot(sponsor, strategy=Strategy.BALANCED):
+    """Shallowest free slot for sponsor's chosen leg, or None (stale index)."""
+    if strategy == Strategy.EXTREME_LEFT:
+        return _edge_slot(sponsor, TreeNode.Lane.L)
+    if strategy == Strategy.EXTREME_RIGHT:
+        return _edge_slot(sponsor, TreeNode.Lane.R)
+    return _balanced_slot(sponsor)
+
+
+def open_lanes(node):
+    """Lanes of node that are still free, from the open-slot index. One query."""
+    return set(OpenSlot.objects.filter(parent_id=node.id).values_list("lane", flat=True))
+
+
+def place_user(user, sponsor, strategy=Strategy.BALANCED, lane=None, max_attempts=5):
+    """
+    Place user below sponsor (a TreeNode) and create their PairingCounter. With lane, take
+    exactly sponsor's slot on that lane (PlacementError if it is taken) instead of
+    spilling over by strategy. Returns the new TreeNode. Placement is permanent; callers
+    confirm the leg first.
+    """
+    if TreeNode.objects.filter(user=user).exists():
+        raise AlreadyPlaced(f"User {user.pk} is already placed.")
+    for _ in range(max_attempts):
+        if lane is None:
+            sponsor.refresh_from_db(fields=["left_size", "right_size"])
+            slot = find_slot(sponsor, strategy)
+        else:
+            slot = OpenSlot.objects.filter(parent_id=sponsor.pk, lane=lane).first()
+        if slot is None:
+            break
+        try:
+            with transaction.atomic():
+                slot = OpenSlot.objects.select_for_update().filter(pk=slot.pk).first()
+                if slot is None:
+                    continue  # taken while we waited; look again
+                node = TreeNode.objects.create(
+                    user=user,
+                    parent_id=slot.parent_id,
+                    lane=slot.lane,
+                    depth=slot.depth,
+                    path=slot.path,
+                )
+                PairingCounter.objects.get_or_create(
+                    user=user, defaults={"left_count": 0, "right_count": 0, "released_pairs": 0}
+                )
+                return node
+        except IntegrityError:
+            if TreeNode.objects.filter(user=user).exists():
+                raise AlreadyPlaced(f"User {user.pk} was placed concurrently.")
+            continue  # lost the slot race; look again
+    if lane is not None:
+        raise PlacementError(f"Slot {lane} below node {sponsor.pk} is taken.")
+    raise PlacementError(f"Could not find a free slot below node {sponsor.pk}.")
@@ -0,0 +1,213 @@
+"""
+Read-side access to the binary tree.
+
+Subtrees are loaded with a recursive CTE (supported by SQLite and Postgres), so the
+number of queries stays constant no matter how large the downline is. Upline and
+membership checks use the materialized TreeNode.path instead (prefix lookups), and
+bounded upline/downline questions use the tree_closure table.
+"""
+from dataclasses import dataclass, field
+
+from django.db import connection
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Collate
+from django.db.models.expressions import RawSQL
+
+from .counters import add_shard_deltas, shard_count
+from .models import CLOSURE_MAX_DISTANCE, PairingCounter, PairingCounterShard, TreeClosure, TreeNode
+
+# Ids of every node in the subtree rooted at %s (inclusive).
+SUBTREE_IDS_SQL = """
+    WITH RECURSIVE subtree(id) AS (
+        SELECT id FROM tree_nodes WHERE id = %s
+        UNION ALL
+        SELECT t.id FROM tree_nodes t JOIN subtree s ON t.parent_id = s.id
+    )
+    SELECT id FROM subtree
+"""
+
+
+def subtree_queryset(root_id):
+    """TreeNode queryset for the subtree rooted at root_id (inclusive), one SQL query."""
+    return TreeNode.objects.filter(id__in=RawSQL(SUBTREE_IDS_SQL, [root_id]))
+
+
+@dataclass
+class Subtree:
+    """A fully loaded subtree: nodes (root first, by depth), their users and pairing counters."""
+    root: TreeNode
+    nodes: list[TreeNode]
+    counters: dict[int, PairingCounter] = field(default_factory=dict)
+    by_id: dict[int, TreeNode] = field(default_factory=dict)
+    children: dict[int, dict[str, TreeNode]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        for n in self.nodes:
+            self.by_id[n.id] = n
+            if n.parent_id is not None and n.id != self.root.id:
+                self.children.setdefault(n.parent_id, {})[n.lane] = n
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def parent_of(self, node):
+        """Parent inside this subtree, or None for the root."""
+        if node.id == self.root.id:
+            return None
+        return self.by_id.get(node.parent_id)
+
+    def child(self, node, lane):
+        return self.children.get(node.id, {}).get(lane)
+
+    def side_of(self, node):
+        """Leg of the subtree root that holds node (the root's own lane for the root). O(1) via path."""
+        if node.id == self.root.id:
+            return node.lane
+        return node.path[len(self.root.path)]
+
+
+def load_subtree(root):
+    """
+    Load the subtree rooted at root with its users and pairing counters.
+    Two queries in total (nodes + users, counters), independent of subtree size; a third
+    adds pending striped-counter deltas when PAIRING_COUNTER_SHARDS is on.
+    """
+    nodes = list(
+        subtree_queryset(root.id)
+        .select_related("user")
+        .order_by("depth", "lane", "id")
+    )
+    counters = {
+        pc.user_id: pc
+        for pc in PairingCounter.objects.filter(user__tree_node__in=RawSQL(SUBTREE_IDS_SQL, [root.id]))
+    }
+    add_shard_deltas(counters, subtree_queryset(root.id).values("user_id"))
+    return Subtree(root=root, nodes=nodes, counters=counters)
+
+
+def path_key():
+    """
+    TreeNode.path compared bytewise: COLLATE "C" on Postgres (matching the
+    idx_tree_path_order index), SQLite's default BINARY collation elsewhere.
+    """
+    return Collate("path", "C") if connection.vendor == "postgresql" else F("path")
+
+
+def path_prefix_range(prefix):
+    """(low, high) so that low <= path < high, bytewise, is exactly path.startswith(prefix)."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def subtree_page(root, max_depth=None, after=None, limit=500):
+    """
+    One page of root's subtree (inclusive) in (path, id) order: depth-first, every node
+    after its parent and L before R. The prefix filter, the keyset and the sort are one
+    range scan of the idx_tree_path_order index; after is the (path, id) of the previous
+    page's last node. Without max_depth a page reads about limit index entries however
+    large the subtree is. max_depth bounds levels below root but is only a filter on that
+    scan: the deeper descendants between two returned nodes are read and discarded, so a
+    page can cost up to the size of the subtree below the depth bound. Nodes come with
+    their user and parent user loaded.
+    """
+    low, high = path_prefix_range(root.path)
+    qs = TreeNode.objects.alias(key=path_key()).filter(key__gte=low, key__lt=high)
+    if max_depth is not None:
+        qs = qs.filter(depth__lte=root.depth + max_depth)
+    if after is not None:
+        path, node_id = after
+        qs = qs.filter(Q(key__gt=path) | Q(key=path, id__gt=node_id))
+    return list(qs.select_related("user", "parent__user").order_by("key", "id")[:limit])
+
+
+def subtree_stamp(root):
+    """
+    Version stamp of root's subtree as (node count, latest change), the change being the
+    newest updated_at of a pairing counter (or striped delta) or a user in the subtree.
+    Placement only ever adds nodes, every counter write bumps updated_at and profile edits
+    bump User.updated_at, so the stamp changes whenever the dashboard payload could.
+
+    This is not O(1): the aggregates read one path-index entry per node of the subtree, so
+    a 304 saves loading, serializing and sending the payload but not that scan. A per-node
+    version would be a single row, but it would have to be bumped on every ancestor up to
+    the root in every purchase transaction.
+    """
+    changed = TreeNode.objects.filter(path__startswith=root.path).aggregate(
+        counter=Max("user__pairing_counter__updated_at"), profile=Max("user__updated_at")
+    )
+    stamps = [changed["counter"], changed["profile"]]
+    if shard_count() > 0:
+        stamps.append(
+            PairingCounterShard.objects.filter(user__tree_node__path__startswith=root.path).aggregate(
+                m=Max("updated_at")
+            )["m"]
+        )
+    return 1 + root.left_size + root.right_size, max(filter(None, stamps), default=None)
+
+
+def ancestor_paths(node, max_distance=None):
+    """Paths of node's ancestors, nearest first; at most max_distance of them if given."""
+    base = node.path.index(":") + 1
+    levels = len(node.path) - base
+    stop = 0 if max_distance is None else max(0, levels - max_distance)
+    return [node.path[:base + d] for d in range(levels - 1, stop - 1, -1)]
+
+
+def ancestors(node, max_distance=None):
+    """Ancestors of node (nearest first), up to max_distance levels up. One indexed query."""
+    paths = ancestor_paths(node, max_distance)
+    if not paths:
+        return TreeNode.objects.none()
+    return TreeNode.objects.filter(path__in=paths).order_by("-depth")
+
+
+def lane_under(ancestor, node):
+    """Lane of ancestor whose subtree contains node; None if node is not strictly below it."""
+    if len(node.path) <= len(ancestor.path) or not node.path.startswith(ancestor.path):
+        return None
+    return node.path[len(ancestor.path)]
+
+
+def subtree_contains(root, node_id):
+    """True if node_id is root or one of its descendants. One indexed query."""
+    return TreeNode.objects.filter(pk=node_id, path__startswith=root.path).exists()
+
+
+def upline(node_id, max_distance=CLOSURE_MAX_DISTANCE):
+    """
+    Ancestors of node_id up to max_distance (<= CLOSURE_MAX_DISTANCE) levels up, nearest first,
+    as (ancestor_node_id, ancestor_user_id, distance, lane) tuples. One query on tree_closure.
+    """
+    return list(
+        TreeClosure.objects.filter(descendant_id=node_id, distance__gte=1, distance__lte=max_distance)
+        .order_by("distance")
+        .values_list("ancestor_id", "ancestor__user_id", "distance", "lane")
+    )
+
+
+def uplines(node_ids, max_distance=CLOSURE_MAX_DISTANCE):
+    """upline() for many nodes at once: {node_id: [(ancestor_id, ancestor_user_id, distance, lane)]}. One query."""
+    result = {node_id: [] for node_id in node_ids}
+    rows = (
+        TreeClosure.objects.filter(descendant_id__in=node_ids, distance__gte=1, distance__lte=max_distance)
+        .order_by("descendant_id", "distance")
+        .values_list("descendant_id", "ancestor_id", "ancestor__user_id", "distance", "lane")
+    )
+    for node_id, *row in rows:
+        result[node_id].append(tuple(row))
+    return result
+
+
+def downline_at(root_id, distance):
+    """TreeNode queryset of the nodes exactly distance levels below root_id."""
+    return TreeNode.objects.filter(ancestor_links__ancestor_id=root_id, ancestor_links__distance=distance)
+
+
+def downline_counts(root_id, max_distance=CLOSURE_MAX_DISTANCE):
+    """{(distance, lane): count} for levels 1..max_distance below root_id. One aggregate query."""
+    rows = (
+        TreeClosure.objects.filter(ancestor_id=root_id, distance__gte=1, distance__lte=max_distance)
+        .values_list("distance", "lane")
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    return {(distance, lane): n for distance, lane, n in rows}
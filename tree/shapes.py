@@ -0,0 +1,104 @@
+"""
+Synthetic binary-tree shapes as compact arrays indexed by node position (0 = root), for
+the generate_tree command and the bonus simulator. Every builder returns
+(parent, lane, sponsor): parent index (-1 for the root), lane under the parent (0 = L,
+1 = R) and sponsor (referrer) index; children always come after their parents.
+
+Shapes:
+- full:     complete binary tree, filled level by level.
+- random:   every node takes a uniformly random open slot (random spillover).
+- skewed:   like random, but a slot on the left lane is chosen with probability skew.
+- powerlaw: sponsors are chosen by preferential attachment; the node is placed in the
+            sponsor's lighter leg, descending into the lighter side (balanced spillover).
+"""
+from array import array
+
+SHAPES = ("full", "random", "skewed", "powerlaw")
+LEFT, RIGHT = 0, 1
+LANE_CHARS = "LR"
+
+
+def slot_shape(n, rng, skew=None):
+    """Random (or left-skewed) spillover: each node takes an open slot at random."""
+    parent = array("q", [-1]) * n
+    lane = bytearray(n)
+    open_slots = [[0], [0]]  # per lane: indexes of nodes whose slot on that lane is free
+    for i in range(1, n):
+        if skew is None:
+            total = len(open_slots[LEFT]) + len(open_slots[RIGHT])
+            side = LEFT if rng.randrange(total) < len(open_slots[LEFT]) else RIGHT
+        else:
+            side = LEFT if rng.random() < skew else RIGHT
+        slots = open_slots[side]
+        k = rng.randrange(len(slots))
+        slots[k], slots[-1] = slots[-1], slots[k]
+        parent[i] = slots.pop()
+        lane[i] = side
+        open_slots[LEFT].append(i)
+        open_slots[RIGHT].append(i)
+    return parent, lane, parent
+
+
+def full_shape(n):
+    """Complete binary tree, filled level by level."""
+    parent = array("q", [-1]) * n
+    lane = bytearray(n)
+    for i in range(1, n):
+        parent[i] = (i - 1) // 2
+        lane[i] = LEFT if i % 2 else RIGHT
+    return parent, lane, parent
+
+
+def powerlaw_shape(n, rng):
+    """Preferential-attachment sponsors, balanced spillover below the sponsor."""
+    parent = array("q", [-1]) * n
+    sponsor = array("q", [-1]) * n
+    lane = bytearray(n)
+    child = (array("q", [-1]) * n, array("q", [-1]) * n)
+    size = (array("q", [0]) * n, array("q", [0]) * n)
+    targets = array("q", [0])  # node i appears 1 + (number of people it sponsored) times
+    for i in range(1, n):
+        s = targets[rng.randrange(len(targets))]
+        sponsor[i] = s
+        node = s
+        while True:
+            side = LEFT if size[LEFT][node] <= size[RIGHT][node] else RIGHT
+            if child[side][node] < 0:
+                break
+            node = child[side][node]
+        parent[i] = node
+        lane[i] = side
+        child[side][node] = i
+        # Grow sizes along the whole ancestor path.
+        c, p = i, node
+        while p >= 0:
+            size[lane[c]][p] += 1
+            c, p = p, parent[p]
+        targets.append(s)
+        targets.append(i)
+    return parent, lane, sponsor
+
+
+def subtree_sizes(parent, lane):
+    """Bottom-up left/right sizes; children always have larger indexes than parents."""
+    n = len(parent)
+    left = array("q", [0]) * n
+    right = array("q", [0]) * n
+    for i in range(n - 1, 0, -1):
+        below = 1 + left[i] + right[i]
+        if lane[i] == LEFT:
+            left[parent[i]] += below
+        else:
+            right[parent[i]] += below
+    return left, right
+
+
+def build_shape(shape, n, rng, skew=0.75):
+    """(parent, lane, sponsor) arrays for one of SHAPES; skew only applies to "skewed"."""
+    if shape == "full":
+        return full_shape(n)
+    if shape == "powerlaw":
+        return powerlaw_shape(n, rng)
+    if shape in ("random", "skewed"):
+        return slot_shape(n, rng, skew if shape == "skewed" else None)
+    raise ValueError(f"Unknown shape {shape!r}.")
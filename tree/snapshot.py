@@ -0,0 +1,155 @@
+"""
+In-process snapshot of the tree structure for Celery workers.
+
+Placement is immutable: a node's parent, lane and depth never change once written, so a
+worker keeps them in compact typed arrays indexed by node id, loaded once per process and
+then extended with the nodes above a high-water mark (the largest node id seen). Upline
+walks read no rows. Per node: parent and user (int64), depth (uint32), lane (one byte),
+plus an int64 user -> node entry, about 30 bytes or ~30 MB per million nodes.
+
+settings.TREE_SNAPSHOT_MAX_BYTES caps the memory (0 disables the snapshot). A process whose
+snapshot would grow past it drops it for good, and walk_upline() falls back to tree_closure
+(tree.repository.upline). A node committed after a higher id was already loaded is fetched
+the first time a walk reaches it. reset_tree_to_root deletes nodes: restart the workers (or
+call reset_snapshot()) after running it.
+"""
+from array import array
+
+from django.conf import settings
+
+from .models import CLOSURE_MAX_DISTANCE, TreeNode
+from .repository import upline
+
+ABSENT = -1
+LANE_CHARS = "LR"
+FIELDS = ("id", "parent_id", "lane", "depth", "user_id")
+
+
+def _grow(arr, size):
+    if len(arr) < size:
+        arr.extend(array(arr.typecode, [ABSENT]) * (size - len(arr)))
+
+
+class TreeSnapshot:
+    """Parent/lane/depth/user arrays indexed by node id, plus node id by user id."""
+
+    def __init__(self):
+        self.parent = array("q")
+        self.user = array("q")
+        self.depth = array("I")
+        self.lane = bytearray()
+        self.node_of_user = array("q")
+        self.high_water = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        arrays = (self.parent, self.user, self.depth, self.node_of_user)
+        return sum(len(a) * a.itemsize for a in arrays) + len(self.lane)
+
+    def _add(self, rows):
+        if not rows:
+            return
+        size = max(r[0] for r in rows) + 1
+        if len(self.user) < size:
+            _grow(self.parent, size)
+            _grow(self.user, size)
+            self.depth.extend(array("I", [0]) * (size - len(self.depth)))
+            self.lane.extend(bytes(size - len(self.lane)))
+        _grow(self.node_of_user, max(r[4] for r in rows) + 1)
+        for node_id, parent_id, lane, depth, user_id in rows:
+            if self.user[node_id] == ABSENT:
+                self.count += 1
+            self.parent[node_id] = ABSENT if parent_id is None else parent_id
+            self.user[node_id] = user_id
+            self.depth[node_id] = depth
+            self.lane[node_id] = 0 if lane == "L" else 1
+            self.node_of_user[user_id] = node_id
+
+    def refresh(self, chunk_size=50000, max_bytes=None):
+        """
+        Load the nodes above the high-water mark, chunk_size rows per query. Returns False
+        (leaving the snapshot partially loaded) as soon as it grows past max_bytes.
+        """
+        while True:
+            rows = list(
+                TreeNode.objects.filter(id__gt=self.high_water).order_by("id").values_list(*FIELDS)[:chunk_size]
+            )
+            if rows:
+                self._add(rows)
+                self.high_water = rows[-1][0]
+            if max_bytes is not None and self.nbytes > max_bytes:
+                return False
+            if len(rows) < chunk_size:
+                return True
+
+    def _ensure(self, node_id):
+        """True if node_id is in the snapshot, fetching it first if it was committed late."""
+        if node_id < len(self.user) and self.user[node_id] != ABSENT:
+            return True
+        rows = list(TreeNode.objects.filter(pk=node_id).values_list(*FIELDS))
+        self._add(rows)
+        return bool(rows)
+
+    def node_for_user(self, user_id):
+        """Node id of user_id's node, or None if the user is not placed."""
+        if user_id < len(self.node_of_user) and self.node_of_user[user_id] != ABSENT:
+            return self.node_of_user[user_id]
+        row = TreeNode.objects.filter(user_id=user_id).values_list(*FIELDS).first()
+        if row is None:
+            return None
+        self._add([row])
+        return row[0]
+
+    def upline(self, node_id, max_distance=CLOSURE_MAX_DISTANCE):
+        """Same result as tree.repository.upline, walked over the arrays."""
+        result = []
+        if not self._ensure(node_id):
+            return result
+        child = node_id
+        for distance in range(1, max_distance + 1):
+            parent = self.parent[child]
+            if parent == ABSENT or not self._ensure(parent):
+                break
+            result.append((parent, self.user[parent], distance, LANE_CHARS[self.lane[child]]))
+            child = parent
+        return result
+
+
+_snapshot = None
+_disabled = False
+
+
+def get_snapshot():
+    """
+    This process's snapshot, brought up to the latest committed node (one indexed query when
+    nothing changed). None when disabled or over TREE_SNAPSHOT_MAX_BYTES.
+    """
+    global _snapshot, _disabled
+    max_bytes = getattr(settings, "TREE_SNAPSHOT_MAX_BYTES", 256 * 1024 * 1024)
+    if _disabled or max_bytes <= 0:
+        return None
+    if _snapshot is None:
+        _snapshot = TreeSnapshot()
+    if not _snapshot.refresh(max_bytes=max_bytes):
+        _snapshot = None
+        _disabled = True
+    return _snapshot
+
+
+def reset_snapshot():
+    """Drop this process's snapshot; the next get_snapshot() reloads it from scratch."""
+    global _snapshot, _disabled
+    _snapshot = None
+    _disabled = False
+
+
+def walk_upline(node_id, max_distance=CLOSURE_MAX_DISTANCE, snapshot=None):
+    """tree.repository.upline from the snapshot when one is available, else from tree_closure."""
+    snapshot = snapshot if snapshot is not None else get_snapshot()
+    if snapshot is None:
+        return upline(node_id, max_distance)
+    return snapshot.upline(node_id, max_distance)
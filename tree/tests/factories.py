@@ -0,0 +1,16 @@
+"""Shared test data builders for the tree tests."""
+from django.contrib.auth import get_user_model
+
+from tree.models import TreeNode
+
+User = get_user_model()
+
+
+def make_node(email, parent=None, lane="L"):
+    user = User.objects.create_user(username=email, email=email, password="x")
+    return TreeNode.objects.create(
+        user=user,
+        parent=parent,
+        lane=lane,
+        depth=parent.depth + 1 if parent else 0,
+    )
@@ -0,0 +1,98 @@
+"""Tests for tree management commands."""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase
+
+from tree.models import OpenSlot, PairingCounter, TreeClosure, TreeNode
+from users.models import User
+
+
+class GenerateTreeTest(TestCase):
+    def _snapshot(self):
+        return (
+            set(TreeNode.objects.values_list("id", "left_size", "right_size")),
+            set(OpenSlot.objects.values_list("parent_id", "lane", "depth", "path", "run_base")),
+            set(TreeClosure.objects.values_list("ancestor_id", "descendant_id", "distance", "lane")),
+        )
+
+    def test_generated_tree_is_consistent_for_every_shape(self):
+        for shape in ("full", "random", "skewed", "powerlaw"):
+            call_command("generate_tree", nodes=60, shape=shape, prefix=shape, chunk_size=7, stdout=StringIO())
+        self.assertEqual(TreeNode.objects.count(), 240)
+        self.assertEqual(PairingCounter.objects.count(), 240)
+        self.assertEqual(OpenSlot.objects.count(), 244)  # n + 1 per tree
+        for node in TreeNode.objects.filter(parent__isnull=False).select_related("parent"):
+            self.assertEqual(node.depth, node.parent.depth + 1)
+            self.assertEqual(node.path, node.parent.path + node.lane)
+        generated = self._snapshot()
+        call_command("rebuild_tree_sizes", stdout=StringIO())
+        call_command("rebuild_open_slots", stdout=StringIO())
+        call_command("rebuild_tree_closure", stdout=StringIO())
+        self.assertEqual(self._snapshot(), generated)
+
+    def test_referred_by_points_at_sponsor(self):
+        call_command("generate_tree", nodes=30, shape="full", prefix="ref", stdout=StringIO())
+        node = TreeNode.objects.filter(depth=2).select_related("user", "parent").first()
+        self.assertEqual(node.user.referred_by_id, node.parent.user_id)
+        self.assertFalse(User.objects.get(email="ref-0@synthetic.example").has_usable_password())
+
+
+class VerifyTreeTest(TestCase):
+    def setUp(self):
+        call_command("generate_tree", nodes=40, shape="random", prefix="verify", stdout=StringIO())
+
+    def _verify(self, **options):
+        out = StringIO()
+        call_command("verify_tree", chunk_size=7, stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_consistent_tree_has_no_violations(self):
+        self.assertEqual(self._verify(), "")
+
+    def test_violations_are_reported_as_ndjson(self):
+        node = TreeNode.objects.filter(depth=3).first()
+        TreeNode.objects.filter(pk=node.pk).update(depth=7, left_size=node.left_size + 1)
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("verify_tree", chunk_size=7, stdout=out, stderr=StringIO())
+        reported = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertIn({"node_id": node.pk, "check": "depth", "expected": 3, "actual": 7}, reported)
+        self.assertIn({"node_id": node.pk, "check": "sizes", "lane": "L", "expected": node.left_size,
+                       "actual": node.left_size + 1}, reported)
+        # Children of the node now disagree with it as well.
+        self.assertTrue(any(v["check"] == "depth" and v["expected"] == 8 for v in reported))
+
+
+class VerifyTreePoolTest(TransactionTestCase):
+    """--workers path; threads stand in for the process pool, which cannot see the in-memory test database."""
+
+    def setUp(self):
+        call_command("generate_tree", nodes=60, shape="random", prefix="pool", stdout=StringIO())
+
+    def _verify(self, out, err, **options):
+        with mock.patch("tree.management.commands.verify_tree.ProcessPoolExecutor", ThreadPoolExecutor):
+            call_command("verify_tree", workers=3, chunk_size=4, stdout=out, stderr=err, **options)
+
+    def test_partitions_cover_every_node(self):
+        for split_depth in (1, 2, 3):
+            out, err = StringIO(), StringIO()
+            self._verify(out, err, split_depth=split_depth)
+            self.assertEqual(out.getvalue(), "")
+            self.assertIn("Verified 60 nodes: 0 violation(s).", err.getvalue())
+
+    def test_partition_reports_violations_and_broken_paths(self):
+        node = TreeNode.objects.filter(depth=4).first()
+        TreeNode.objects.filter(pk=node.pk).update(depth=9)
+        broken = TreeNode.objects.filter(depth=3).exclude(pk=node.parent_id).first()
+        TreeNode.objects.filter(pk=broken.pk).update(path="x")
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            self._verify(out, StringIO(), split_depth=2)
+        reported = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertIn({"node_id": node.pk, "check": "depth", "expected": 4, "actual": 9}, reported)
+        self.assertIn({"check": "coverage", "expected": 60, "actual": 59}, reported)
@@ -0,0 +1,56 @@
+"""Tests for tree.counters (plain and striped pairing counters)."""
+import random
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from tree.counters import add_shard_deltas, fold_counter_shards, increment_counters, ready_user_ids
+from tree.models import PairingCounter, PairingCounterShard
+
+User = get_user_model()
+
+
+class PairingCounterIncrementTest(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f"c{i}@test.example", email=f"c{i}@test.example", password="x").id
+            for i in range(3)
+        ]
+
+    def _counts(self):
+        return {pc.user_id: (pc.left_count, pc.right_count) for pc in PairingCounter.objects.all()}
+
+    def test_plain_increments_one_update_per_delta(self):
+        a, b, c = self.users
+        with self.assertNumQueries(4):  # insert-or-ignore, lock, two grouped UPDATEs
+            increment_counters({a: (2, 0), b: (2, 0), c: (0, 1)}, shards=0)
+        self.assertEqual(self._counts(), {a: (2, 0), b: (2, 0), c: (0, 1)})
+        self.assertFalse(PairingCounterShard.objects.exists())
+
+    @override_settings(PAIRING_COUNTER_SHARDS=4)
+    def test_striped_increments_are_summed_by_reads_and_folded(self):
+        a, b, c = self.users
+        PairingCounter.objects.create(user_id=a, left_count=1, right_count=0)
+        rng = random.Random(3)
+        for _ in range(10):
+            increment_counters({a: (1, 0), b: (0, 1)}, rng=rng)
+        increment_counters({a: (0, 2)}, rng=rng)
+        self.assertGreater(PairingCounterShard.objects.filter(user_id=a).count(), 1)
+        self.assertEqual(self._counts()[a], (1, 0))
+        self.assertEqual(ready_user_ids([a, b, c]), [a])
+        counters = add_shard_deltas({pc.user_id: pc for pc in PairingCounter.objects.filter(user_id=a)})
+        self.assertEqual((counters[a].left_count, counters[a].right_count), (11, 2))
+
+        self.assertEqual(fold_counter_shards(chunk_size=1), 2)
+        self.assertEqual(self._counts(), {a: (11, 2), b: (0, 10)})
+        self.assertEqual(ready_user_ids([a, b, c]), [a])
+        self.assertEqual(fold_counter_shards(), 0)
+
+    @override_settings(PAIRING_COUNTER_SHARDS=4)
+    def test_first_striped_increment_creates_base_counter(self):
+        a, b, c = self.users
+        increment_counters({c: (1, 1), b: (1, 0)}, rng=random.Random(1))
+        self.assertEqual(self._counts(), {b: (0, 0), c: (0, 0)})
+        self.assertEqual(ready_user_ids([a, b, c]), [c])
+        counters = add_shard_deltas({pc.user_id: pc for pc in PairingCounter.objects.all()})
+        self.assertEqual((counters[c].left_count, counters[c].right_count), (1, 1))
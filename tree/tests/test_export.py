@@ -0,0 +1,35 @@
+"""Tests for tree.export."""
+from django.test import TestCase
+
+from tree.export import pack_columns, subtree_columns, unpack_columns
+from tree.models import PairingCounter
+from tree.tests.factories import make_node
+
+
+class ColumnarExportTest(TestCase):
+    def setUp(self):
+        self.top = make_node("top@test.example")
+        self.root = make_node("root@test.example", self.top, "R")
+        self.a = make_node("a@test.example", self.root, "L")
+        self.b = make_node("b@test.example", self.root, "R")
+        self.ar = make_node("ar@test.example", self.a, "R")
+        PairingCounter.objects.create(user=self.a.user, left_count=2, right_count=5)
+        self.root.refresh_from_db()
+
+    def test_parallel_arrays(self):
+        with self.assertNumQueries(2):
+            cols = subtree_columns(self.root)
+        self.assertEqual(cols["ids"], [self.root.id, self.a.id, self.b.id, self.ar.id])
+        self.assertEqual(cols["parent_index"], [-1, 0, 0, 1])
+        self.assertEqual(cols["lane"], [1, 0, 1, 1])
+        self.assertEqual(cols["depth"], [0, 1, 1, 2])
+        self.assertEqual(cols["left_count"][1], 2)
+        self.assertEqual(cols["right_count"][1], 5)
+        self.assertEqual(cols["left_users_below"][0], 2)
+        self.assertEqual(cols["labels"][3], "ar@test.example")
+
+    def test_packed_round_trip(self):
+        cols = subtree_columns(self.root)
+        data = pack_columns(cols)
+        self.assertEqual(data[:4], b"BTC1")
+        self.assertEqual(unpack_columns(data), cols)
@@ -0,0 +1,56 @@
+"""Tests for tree.layout."""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from tree.layout import cached_layout, tidy_layout
+from tree.placement import Strategy, place_user
+from tree.repository import load_subtree
+from tree.tests.factories import make_node
+
+User = get_user_model()
+
+
+class TidyLayoutTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = make_node("root@test.example")
+
+    def _assert_no_overlap(self, pos):
+        by_level = {}
+        for x, y in pos.values():
+            by_level.setdefault(y, []).append(x)
+        for xs in by_level.values():
+            xs.sort()
+            for a, b in zip(xs, xs[1:]):
+                self.assertGreaterEqual(b - a, 1.0 - 1e-9)
+
+    def test_children_sit_on_their_lane_side(self):
+        a = make_node("a@test.example", self.root, "L")
+        b = make_node("b@test.example", self.root, "R")
+        ar = make_node("ar@test.example", a, "R")
+        pos = tidy_layout(load_subtree(self.root))
+        self.assertEqual(pos[self.root.id], (0.0, 0))
+        self.assertLess(pos[a.id][0], 0)
+        self.assertGreater(pos[b.id][0], 0)
+        self.assertGreater(pos[ar.id][0], pos[a.id][0])
+        self.assertEqual(pos[ar.id][1], 2)
+
+    def test_no_overlap_in_larger_tree(self):
+        placed = [self.root]
+        for i in range(40):
+            strategy = (Strategy.BALANCED, Strategy.EXTREME_LEFT, Strategy.EXTREME_RIGHT)[i % 3]
+            user = User.objects.create_user(username=f"u{i}@test.example", email=f"u{i}@test.example", password="x")
+            placed.append(place_user(user, placed[(i * 7) % len(placed)], strategy))
+        pos = tidy_layout(load_subtree(self.root))
+        self.assertEqual(len(pos), 41)
+        self._assert_no_overlap(pos)
+
+    def test_layout_cached_per_subtree_version(self):
+        make_node("a@test.example", self.root, "L")
+        self.root.refresh_from_db()
+        first = cached_layout(load_subtree(self.root))
+        self.assertEqual(cache.get(f"tree-layout:{self.root.id}:1"), first)
+        make_node("b@test.example", self.root, "R")
+        self.root.refresh_from_db()
+        self.assertEqual(len(cached_layout(load_subtree(self.root))), 3)
@@ -1,4 +1,7 @@
 """Tests for tree models."""
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
@@ -68,3 +71,36 @@ class PairingCounterTest(TestCase):
         self.assertEqual(counter.left_count, 0)
         self.assertEqual(counter.right_count, 0)
         self.assertEqual(counter.released_pairs, 0)
+
+
+class SubtreeSizeTest(TestCase):
+    def _node(self, email, parent=None, lane="L"):
+        user = User.objects.create_user(username=email, email=email, password="x")
+        return TreeNode.objects.create(
+            user=user, parent=parent, lane=lane, depth=parent.depth + 1 if parent else 0
+        )
+
+    def setUp(self):
+        self.root = self._node("root@test.example")
+        self.left = self._node("l@test.example", self.root, "L")
+        self.lr = self._node("lr@test.example", self.left, "R")
+        self.lrl = self._node("lrl@test.example", self.lr, "L")
+        self.right = self._node("r@test.example", self.root, "R")
+
+    def test_insert_updates_ancestor_sizes(self):
+        sizes = dict(TreeNode.objects.values_list("id", "left_size"))
+        self.root.refresh_from_db()
+        self.left.refresh_from_db()
+        self.lr.refresh_from_db()
+        self.assertEqual((self.root.left_size, self.root.right_size), (3, 1))
+        self.assertEqual((self.left.left_size, self.left.right_size), (0, 2))
+        self.assertEqual((self.lr.left_size, self.lr.right_size), (1, 0))
+        self.assertEqual(sizes[self.right.id], 0)
+
+    def test_rebuild_recomputes_sizes(self):
+        TreeNode.objects.update(left_size=0, right_size=7)
+        call_command("rebuild_tree_sizes", stdout=StringIO())
+        self.root.refresh_from_db()
+        self.left.refresh_from_db()
+        self.assertEqual((self.root.left_size, self.root.right_size), (3, 1))
+        self.assertEqual((self.left.left_size, self.left.right_size), (0, 2))
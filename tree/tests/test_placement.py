@@ -0,0 +1,82 @@
+"""Tests for tree.placement."""
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from tree.models import OpenSlot, PairingCounter, TreeNode
+from tree.placement import AlreadyPlaced, PlacementError, Strategy, find_slot, open_lanes, place_user
+
+User = get_user_model()
+
+
+def make_user(email):
+    return User.objects.create_user(username=email, email=email, password="x")
+
+
+class PlacementTest(TestCase):
+    def setUp(self):
+        self.root = TreeNode.objects.create(user=make_user("root@test.example"), parent=None, lane="L", depth=0)
+
+    def test_extreme_left_follows_outer_edge(self):
+        nodes = [place_user(make_user(f"l{i}@test.example"), self.root, Strategy.EXTREME_LEFT) for i in range(3)]
+        self.assertEqual([n.path[len(self.root.path):] for n in nodes], ["L", "LL", "LLL"])
+        self.assertEqual(nodes[-1].depth, 3)
+        # From an inner sponsor the same edge continues below it.
+        inner = place_user(make_user("x@test.example"), nodes[0], Strategy.EXTREME_LEFT)
+        self.assertEqual(inner.path[len(self.root.path):], "LLLL")
+
+    def test_extreme_right_below_left_child(self):
+        left = place_user(make_user("l@test.example"), self.root, Strategy.EXTREME_LEFT)
+        a = place_user(make_user("a@test.example"), left, Strategy.EXTREME_RIGHT)
+        b = place_user(make_user("b@test.example"), left, Strategy.EXTREME_RIGHT)
+        self.assertEqual((a.parent_id, a.lane), (left.id, "R"))
+        self.assertEqual((b.parent_id, b.lane), (a.id, "R"))
+
+    def test_balanced_fills_level_by_level(self):
+        nodes = [place_user(make_user(f"b{i}@test.example"), self.root) for i in range(6)]
+        self.assertEqual(sorted(n.depth for n in nodes), [1, 1, 2, 2, 2, 2])
+        self.root.refresh_from_db()
+        self.assertEqual((self.root.left_size, self.root.right_size), (3, 3))
+
+    def test_slots_and_counter_maintained(self):
+        node = place_user(make_user("c@test.example"), self.root)
+        self.assertFalse(OpenSlot.objects.filter(parent=self.root, lane=node.lane).exists())
+        self.assertEqual(OpenSlot.objects.filter(parent=node).count(), 2)
+        self.assertTrue(PairingCounter.objects.filter(user=node.user).exists())
+
+    def test_already_placed_user_rejected(self):
+        node = place_user(make_user("d@test.example"), self.root)
+        with self.assertRaises(AlreadyPlaced):
+            place_user(node.user, self.root)
+
+    def test_concurrent_duplicate_placement_raises_at_once(self):
+        user = make_user("race@test.example")
+
+        def placed_meanwhile(sponsor, strategy):
+            slot = find_slot(sponsor, strategy)
+            TreeNode.objects.create(user=user, parent=sponsor, lane="R", depth=1)
+            return slot
+
+        with mock.patch("tree.placement.find_slot", side_effect=placed_meanwhile) as probe:
+            with self.assertRaises(AlreadyPlaced):
+                place_user(user, self.root, Strategy.EXTREME_LEFT)
+        self.assertEqual(probe.call_count, 1)
+
+    def test_fixed_lane_takes_that_slot_or_fails(self):
+        node = place_user(make_user("f@test.example"), self.root, lane="R")
+        self.assertEqual((node.parent_id, node.lane), (self.root.id, "R"))
+        self.assertEqual(open_lanes(self.root), {"L"})
+        with self.assertRaises(PlacementError) as ctx:
+            place_user(make_user("g@test.example"), self.root, lane="R")
+        self.assertNotIsInstance(ctx.exception, AlreadyPlaced)
+
+    def test_rebuild_open_slots_matches_maintained_slots(self):
+        for i in range(5):
+            place_user(make_user(f"r{i}@test.example"), self.root)
+        fields = ("parent_id", "lane", "depth", "path", "run_base")
+        before = set(OpenSlot.objects.values_list(*fields))
+        call_command("rebuild_open_slots", stdout=StringIO())
+        self.assertEqual(set(OpenSlot.objects.values_list(*fields)), before)
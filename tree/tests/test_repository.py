@@ -0,0 +1,128 @@
+"""Tests for tree.repository."""
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from tree.models import CLOSURE_MAX_DISTANCE, PairingCounter, TreeClosure
+from tree.repository import (
+    ancestors,
+    downline_at,
+    downline_counts,
+    lane_under,
+    load_subtree,
+    subtree_contains,
+    subtree_queryset,
+    upline,
+)
+from tree.tests.factories import make_node
+
+
+class SubtreeTest(TestCase):
+    def setUp(self):
+        # root -> (a, b); a -> (aa, ab); aa -> aal
+        self.root = make_node("root@test.example")
+        self.a = make_node("a@test.example", self.root, "L")
+        self.b = make_node("b@test.example", self.root, "R")
+        self.aa = make_node("aa@test.example", self.a, "L")
+        self.ab = make_node("ab@test.example", self.a, "R")
+        self.aal = make_node("aal@test.example", self.aa, "L")
+        PairingCounter.objects.create(user=self.a.user, left_count=3, right_count=1)
+
+    def test_subtree_queryset_includes_only_descendants(self):
+        ids = set(subtree_queryset(self.a.id).values_list("id", flat=True))
+        self.assertEqual(ids, {self.a.id, self.aa.id, self.ab.id, self.aal.id})
+
+    def test_load_subtree_constant_queries(self):
+        with self.assertNumQueries(2):
+            subtree = load_subtree(self.root)
+            labels = [n.user.email for n in subtree.nodes]
+        self.assertEqual(len(subtree), 6)
+        self.assertEqual(labels[0], "root@test.example")
+        self.assertEqual(subtree.counters[self.a.user_id].left_count, 3)
+
+    def test_children_and_parents_are_scoped_to_subtree(self):
+        subtree = load_subtree(self.a)
+        self.assertIsNone(subtree.parent_of(subtree.root))
+        self.assertEqual(subtree.child(self.a, "L").id, self.aa.id)
+        self.assertEqual(subtree.child(self.aa, "L").id, self.aal.id)
+        self.assertIsNone(subtree.child(self.ab, "L"))
+
+    def test_side_is_relative_to_loaded_root(self):
+        subtree = load_subtree(self.root)
+        sides = {n.id: subtree.side_of(n) for n in subtree.nodes}
+        self.assertEqual(sides[self.aal.id], "L")
+        self.assertEqual(sides[self.ab.id], "L")
+        self.assertEqual(sides[self.b.id], "R")
+        subtree = load_subtree(self.a)
+        self.assertEqual(subtree.side_of(subtree.by_id[self.ab.id]), "R")
+        self.assertEqual(subtree.side_of(subtree.by_id[self.aal.id]), "L")
+        self.assertEqual(subtree.side_of(subtree.root), "L")
+
+
+class MaterializedPathTest(TestCase):
+    def setUp(self):
+        self.root = make_node("root@test.example")
+        self.a = make_node("a@test.example", self.root, "L")
+        self.ar = make_node("ar@test.example", self.a, "R")
+        self.arl = make_node("arl@test.example", self.ar, "L")
+        self.b = make_node("b@test.example", self.root, "R")
+
+    def test_path_encodes_root_and_lanes(self):
+        self.assertEqual(self.root.path, f"{self.root.user_id}:")
+        self.assertEqual(self.arl.path, f"{self.root.user_id}:LRL")
+
+    def test_ancestors_nearest_first_in_one_query(self):
+        with self.assertNumQueries(1):
+            ids = [n.id for n in ancestors(self.arl)]
+        self.assertEqual(ids, [self.ar.id, self.a.id, self.root.id])
+        self.assertEqual([n.id for n in ancestors(self.arl, max_distance=2)], [self.ar.id, self.a.id])
+        self.assertEqual(list(ancestors(self.root)), [])
+
+    def test_subtree_membership_and_lane(self):
+        self.assertTrue(subtree_contains(self.a, self.arl.id))
+        self.assertFalse(subtree_contains(self.a, self.b.id))
+        self.assertEqual(lane_under(self.root, self.arl), "L")
+        self.assertEqual(lane_under(self.a, self.arl), "R")
+        self.assertIsNone(lane_under(self.b, self.arl))
+        self.assertIsNone(lane_under(self.a, self.a))
+
+
+class ClosureTableTest(TestCase):
+    def setUp(self):
+        self.root = make_node("root@test.example")
+        self.a = make_node("a@test.example", self.root, "L")
+        self.b = make_node("b@test.example", self.root, "R")
+        self.ar = make_node("ar@test.example", self.a, "R")
+        self.al = make_node("al@test.example", self.a, "L")
+        self.arl = make_node("arl@test.example", self.ar, "L")
+
+    def test_upline_single_query_with_ancestor_relative_lanes(self):
+        with self.assertNumQueries(1):
+            rows = upline(self.arl.id)
+        self.assertEqual(
+            rows,
+            [
+                (self.ar.id, self.ar.user_id, 1, "L"),
+                (self.a.id, self.a.user_id, 2, "R"),
+                (self.root.id, self.root.user_id, 3, "L"),
+            ],
+        )
+        self.assertEqual(len(upline(self.arl.id, max_distance=1)), 1)
+
+    def test_downline_counts_by_distance_and_lane(self):
+        counts = downline_counts(self.root.id)
+        self.assertEqual(counts, {(1, "L"): 1, (1, "R"): 1, (2, "L"): 2, (3, "L"): 1})
+        self.assertEqual({n.id for n in downline_at(self.root.id, 2)}, {self.ar.id, self.al.id})
+
+    def test_distance_is_capped(self):
+        node = self.arl
+        for i in range(CLOSURE_MAX_DISTANCE + 2):
+            node = make_node(f"deep{i}@test.example", node, "L")
+        self.assertEqual(TreeClosure.objects.filter(descendant=node).count(), CLOSURE_MAX_DISTANCE + 1)
+
+    def test_rebuild_matches_incremental_rows(self):
+        before = set(TreeClosure.objects.values_list("ancestor_id", "descendant_id", "distance", "lane"))
+        call_command("rebuild_tree_closure", stdout=StringIO())
+        after = set(TreeClosure.objects.values_list("ancestor_id", "descendant_id", "distance", "lane"))
+        self.assertEqual(before, after)
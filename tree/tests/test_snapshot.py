@@ -0,0 +1,56 @@
+"""Tests for tree.snapshot."""
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from tree.models import TreeNode
+from tree.repository import upline
+from tree.snapshot import TreeSnapshot, get_snapshot, reset_snapshot, walk_upline
+from tree.tests.factories import make_node
+
+User = get_user_model()
+
+
+class TreeSnapshotTest(TestCase):
+    def setUp(self):
+        reset_snapshot()
+        self.addCleanup(reset_snapshot)
+        self.root = make_node("root@test.example")
+        self.a = make_node("a@test.example", self.root, "L")
+        self.ab = make_node("ab@test.example", self.a, "R")
+        self.abl = make_node("abl@test.example", self.ab, "L")
+
+    def test_upline_matches_closure_without_queries(self):
+        snapshot = TreeSnapshot()
+        snapshot.refresh()
+        self.assertEqual(len(snapshot), 4)
+        with self.assertNumQueries(0):
+            walked = snapshot.upline(self.abl.id)
+        self.assertEqual(walked, upline(self.abl.id))
+        self.assertEqual(snapshot.upline(self.abl.id, 2), upline(self.abl.id, 2))
+        self.assertEqual(snapshot.node_for_user(self.ab.user_id), self.ab.id)
+
+    def test_refresh_appends_above_high_water_mark(self):
+        snapshot = get_snapshot()
+        new = make_node("new@test.example", self.abl, "R")
+        with self.assertNumQueries(1):
+            self.assertEqual(get_snapshot().upline(self.abl.id), snapshot.upline(self.abl.id))
+        self.assertIs(get_snapshot(), snapshot)
+        self.assertEqual(snapshot.high_water, new.id)
+        self.assertEqual([row[0] for row in snapshot.upline(new.id)], [self.abl.id, self.ab.id, self.a.id, self.root.id])
+
+    def test_node_committed_out_of_order_is_fetched_on_demand(self):
+        snapshot = get_snapshot()
+        late = TreeNode.objects.create(
+            id=snapshot.high_water + 10,
+            user=User.objects.create_user(username="late@test.example", email="late@test.example", password="x"),
+            parent=self.abl,
+            lane="L",
+            depth=4,
+        )
+        snapshot.high_water = late.id  # as if a higher id had been loaded first
+        self.assertEqual(snapshot.upline(late.id), upline(late.id))
+
+    @override_settings(TREE_SNAPSHOT_MAX_BYTES=64)
+    def test_over_memory_cap_falls_back_to_closure(self):
+        self.assertIsNone(get_snapshot())
+        self.assertEqual(walk_upline(self.abl.id), upline(self.abl.id))
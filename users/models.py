@@ -17,6 +17,8 @@ class User(AbstractUser):
         db_index=True,
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped by profile saves; the dashboard tree ETag (tree.repository.subtree_stamp) reads it.
+    updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
     USERNAME_FIELD = "email"